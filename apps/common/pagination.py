@@ -0,0 +1,182 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Field, Func, Q, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class Row(Func):
+    """A row value, ``(a, b, ...)``, for row comparisons"""
+
+    template = '(%(expressions)s)'
+    output_field = Field()
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on the full ordering key: the view's ordering (or the
+    client's ``?ordering=`` through OrderingFilter) with the primary key as
+    tie-breaker. A page is fetched with ``WHERE (key) > (cursor) LIMIT n``,
+    so deep pages cost the same as the first one and no COUNT(*) is run.
+    Nullable keys sort NULLs last going forward.
+    """
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in self.ordering]
+
+        position, reverse = self.decode_cursor(request)
+        queryset = queryset.order_by(*self._order_by(reverse))
+        if position is not None:
+            queryset = queryset.filter(self._after(position, reverse))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        """The view's effective ordering with the primary key appended"""
+        ordering = None
+        for backend in getattr(view, 'filter_backends', ()):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        if not ordering:
+            ordering = getattr(view, 'ordering', None) or queryset.query.order_by or queryset.model._meta.ordering
+        pk_name = queryset.model._meta.pk.name
+        ordering = [ordering] if isinstance(ordering, str) else list(ordering)
+        ordering = [pk_name if name == 'pk' else f'-{pk_name}' if name == '-pk' else name for name in ordering]
+        if not any(name.lstrip('-') == pk_name for name in ordering):
+            # The tie-breaker follows the direction of the last key
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append(f'-{pk_name}' if descending else pk_name)
+        return ordering
+
+    def _order_by(self, reverse):
+        # NULLs last going forward, first going back; only nullable keys get
+        # an explicit NULLS clause, so plain keys keep matching their index
+        nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        expressions = []
+        for name, field in zip(self.ordering, self.fields):
+            expression = F(name.lstrip('-'))
+            options = nulls if field.null else {}
+            if name.startswith('-') != reverse:
+                expressions.append(expression.desc(**options))
+            else:
+                expressions.append(expression.asc(**options))
+        return expressions
+
+    def _after(self, position, reverse):
+        """Rows strictly beyond ``position`` in the (possibly reversed) ordering"""
+        directions = {name.startswith('-') for name in self.ordering}
+        if len(directions) == 1 and not any(field.null for field in self.fields):
+            # Same-direction keys: a single row comparison, (a, b) < (%s, %s),
+            # which the database answers with one range scan of the index
+            lookup = LessThan if directions.pop() != reverse else GreaterThan
+            return lookup(
+                Row(*(F(name.lstrip('-')) for name in self.ordering)),
+                Row(*(Value(value, output_field=field) for field, value in zip(self.fields, position))),
+            )
+        condition = Q(pk__in=[])
+        equal = Q()
+        for name, field, value in zip(self.ordering, self.fields, position):
+            attname = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') != reverse else 'gt'
+            if value is None:
+                # Going forward nothing but NULLs follows a NULL; going back every non-NULL does
+                beyond = Q(**{f'{attname}__isnull': False}) if reverse else Q(pk__in=[])
+                same = Q(**{f'{attname}__isnull': True})
+            else:
+                beyond = Q(**{f'{attname}__{lookup}': value})
+                if field.null and not reverse:
+                    beyond |= Q(**{f'{attname}__isnull': True})
+                same = Q(**{attname: value})
+            condition |= equal & beyond
+            equal &= same
+        return condition
+
+    def encode_cursor(self, row, reverse):
+        # value_to_string keeps full precision (JSON encoders truncate datetimes to milliseconds)
+        position = [
+            None if getattr(row, field.attname) is None else field.value_to_string(row) for field in self.fields
+        ]
+        payload = json.dumps({'o': self.ordering, 'p': position, 'r': int(reverse)})
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if payload['o'] != self.ordering or len(payload['p']) != len(self.fields):
+                raise ValueError
+            position = [
+                None if value is None else field.to_python(value)
+                for field, value in zip(self.fields, payload['p'])
+            ]
+            return position, bool(payload['r'])
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -18,6 +18,39 @@ class ErrorResponseSerializer(serializers.Serializer):
     error = serializers.JSONField(required=False, allow_null=True)
 
 
+class SparseFieldsetMixin:
+    """
+    Sparse fieldsets for GET requests. ``?fields=a,b`` limits the response to
+    the listed fields; with it, ``expandable_fields`` (nested, costly fields)
+    are only included when listed in ``?fields=`` or ``?expand=``. Without
+    ``?fields=`` every field is returned, so ``?expand=`` adds nothing.
+    """
+
+    expandable_fields = ()
+
+    @staticmethod
+    def _query_list(request, name):
+        value = request.query_params.get(name)
+        if value is None:
+            return None
+        return {item.strip() for item in value.split(',') if item.strip()}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        # Only the top-level serializer of a read request (or the child of its list serializer)
+        if request is None or request.method != 'GET' or self.root not in (self, self.parent):
+            return fields
+        only = self._query_list(request, 'fields')
+        if only is None:
+            return fields
+        expand = self._query_list(request, 'expand') or set()
+        for name in list(fields):
+            if name not in only and not (name in self.expandable_fields and name in expand):
+                del fields[name]
+        return fields
+
+
 class DistrictSerializer(serializers.ModelSerializer):
     """Serializer for District model"""
     
@@ -30,6 +63,9 @@ class DistrictSerializer(serializers.ModelSerializer):
     
     def get_thanas_count(self, obj):
         """Get count of active thanas in this district"""
+        if hasattr(obj, 'active_thanas'):
+            # Prefetched with to_attr='active_thanas'
+            return len(obj.active_thanas)
         return obj.thanas.filter(is_active=True).count()
 
 
@@ -0,0 +1,36 @@
+import ipaddress
+
+from django.conf import settings
+
+
+def _ip(value):
+    """``value`` as a normalized IP address string, or None when it is not one"""
+    try:
+        return str(ipaddress.ip_address((value or '').strip()))
+    except ValueError:
+        return None
+
+
+def _is_trusted_proxy(address):
+    for network in getattr(settings, 'TRUSTED_PROXIES', ()):
+        try:
+            if ipaddress.ip_address(address) in ipaddress.ip_network(network, strict=False):
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def get_client_ip(request):
+    """
+    Return the client IP of a request. X-Real-IP (which nginx overwrites
+    with the connecting address) is used only when the request comes from
+    one of TRUSTED_PROXIES and holds a valid IP; otherwise the connecting
+    address is the client.
+    """
+    if request is None:
+        return None
+    remote_addr = _ip(request.META.get('REMOTE_ADDR'))
+    if remote_addr and _is_trusted_proxy(remote_addr):
+        return _ip(request.META.get('HTTP_X_REAL_IP')) or remote_addr
+    return remote_addr
@@ -6,20 +6,18 @@ from drf_yasg import openapi
 from .models import Organization
 from .serializers import OrganizationSerializer
 from apps.common.serializers import SuccessResponseSerializer, ErrorResponseSerializer
-from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import PermissionDenied
+from apps.users.policies import AUTHENTICATED, Policy, PolicyPermission
 
-class IsSuperAdminOrAdmin:
-    def has_permission(self, request, view):
-        if not request.user.is_authenticated:
-            return False
-        return request.user.is_superuser or request.user.is_staff  # Assuming is_staff indicates admin
+# Staff (is_staff) and superusers manage organizations
+CREATE_ORGANIZATION = Policy(staff=True, message="Only superadmin or admin can create organizations.")
+UPDATE_ORGANIZATION = Policy(staff=True, message="Only superadmin or admin can update organizations.")
+DELETE_ORGANIZATION = Policy(staff=True, message="Only superadmin or admin can delete organizations.")
 
-    def has_object_permission(self, request, view, obj):
-        return self.has_permission(request, view)
 
 class OrganizationListCreateView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [PolicyPermission]
+    policy = {'GET': AUTHENTICATED, 'POST': CREATE_ORGANIZATION}
 
     @swagger_auto_schema(
         operation_description="List all organizations or create a new one.",
@@ -33,8 +31,6 @@ class OrganizationListCreateView(APIView):
       
     )
     def post(self, request):
-        if not IsSuperAdminOrAdmin().has_permission(request, self):
-            raise PermissionDenied(detail="Only superadmin or admin can create organizations.")
         serializer = OrganizationSerializer(data=request.data)
         if serializer.is_valid():
             organization = serializer.save()
@@ -77,7 +73,13 @@ class OrganizationListCreateView(APIView):
 
 
 class OrganizationDetailView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [PolicyPermission]
+    policy = {
+        'GET': AUTHENTICATED,
+        'PUT': UPDATE_ORGANIZATION,
+        'PATCH': UPDATE_ORGANIZATION,
+        'DELETE': DELETE_ORGANIZATION,
+    }
 
     @swagger_auto_schema(
         operation_description="Retrieve a specific organization by ID.",
@@ -124,8 +126,6 @@ class OrganizationDetailView(APIView):
       
     )
     def put(self, request, pk):
-        if not IsSuperAdminOrAdmin().has_permission(request, self):
-            raise PermissionDenied(detail="Only superadmin or admin can update organizations.")
         try:
             organization = Organization.objects.get(pk=pk)
             serializer = OrganizationSerializer(organization, data=request.data, partial=True)
@@ -167,8 +167,6 @@ class OrganizationDetailView(APIView):
 
 
     def patch(self, request, pk):
-        if not IsSuperAdminOrAdmin().has_permission(request, self):
-            raise PermissionDenied(detail="Only superadmin or admin can update organizations.")
         try:
             organization = Organization.objects.get(pk=pk)
             serializer = OrganizationSerializer(organization, data=request.data, partial=True)
@@ -200,8 +198,6 @@ class OrganizationDetailView(APIView):
             
 
     def delete(self, request, pk):
-        if not IsSuperAdminOrAdmin().has_permission(request, self):
-            raise PermissionDenied(detail="Only superadmin or admin can delete organizations.")
         try:
             organization = Organization.objects.get(pk=pk)
             organization.delete()
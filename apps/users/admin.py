@@ -2,10 +2,25 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import User, Role, UserRole, PermissionCategory, CustomPermission, Department, Designation
+from .models import User, Role, UserRole, UserSession, PermissionCategory, CustomPermission, Department, Designation
+from .search import user_search
+
+
+def assignable_role_choices(request, edited_by):
+    """
+    Roles the admin user may assign, plus the roles of the assignments on the
+    object being edited (``edited_by`` is the UserRole lookup of its id), so
+    existing rows stay valid when the form is saved
+    """
+    object_id = request.resolver_match.kwargs.get('object_id') if request.resolver_match else None
+    current = UserRole.objects.filter(**{edited_by: object_id}) if object_id else UserRole.objects.none()
+    return Role.objects.filter(
+        Q(pk__in=Role.objects.assignable_by(request.user).values('pk')) | Q(pk__in=current.values('role_id'))
+    )
 
 
 class UserRoleInline(admin.TabularInline):
@@ -18,6 +33,11 @@ class UserRoleInline(admin.TabularInline):
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('role', 'assigned_by')
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'role':
+            kwargs['queryset'] = assignable_role_choices(request, 'user_id')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 admin.site.register([Department, Designation])
@@ -85,6 +105,17 @@ class UserAdmin(BaseUserAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).prefetch_related('user_roles__role')
     
+    def get_search_results(self, request, queryset, search_term):
+        """Search through the indexed user search backend (login ID, email, name, employee ID, mobile)"""
+        if not search_term.strip():
+            return queryset, False
+        return user_search(queryset.db).matching(queryset, search_term), False
+    
+    def save_related(self, request, form, formsets, change):
+        """Apply the role inline changes as one unit of work"""
+        with UserRole.objects.unit_of_work():
+            super().save_related(request, form, formsets, change)
+    
     def has_add_permission(self, request):
         """Only super_admin and admin can add users"""
         if request.user.is_superuser:
@@ -133,7 +164,7 @@ class RoleAdmin(admin.ModelAdmin):
             'fields': ('name', 'display_name', 'description')
         }),
         ('Role Settings', {
-            'fields': ('role_level', 'is_active', 'is_system_role', 'can_assign_roles', 'max_assignments')
+            'fields': ('parent', 'role_level', 'is_active', 'is_system_role', 'can_assign_roles', 'max_assignments')
         }),
         ('Django Integration', {
             'fields': ('django_group', 'get_group_permissions'),
@@ -180,6 +211,11 @@ class RoleAdmin(admin.ModelAdmin):
             obj.django_group = group
             obj.save()
     
+    def save_related(self, request, form, formsets, change):
+        """Apply the assignment inline changes as one unit of work"""
+        with UserRole.objects.unit_of_work():
+            super().save_related(request, form, formsets, change)
+    
     def has_add_permission(self, request):
         """Only super_admin and admin can add roles"""
         if request.user.is_superuser:
@@ -232,6 +268,11 @@ class UserRoleAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user', 'role', 'assigned_by', 'revoked_by')
     
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'role':
+            kwargs['queryset'] = assignable_role_choices(request, 'pk')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+    
     def has_add_permission(self, request):
         """Only super_admin and admin can assign roles"""
         if request.user.is_superuser:
@@ -257,6 +298,23 @@ class UserRoleAdmin(admin.ModelAdmin):
         return request.user.user_type in ['super_admin', 'admin', 'billing_manager']
 
 
+@admin.register(UserSession)
+class UserSessionAdmin(admin.ModelAdmin):
+    """Login sessions (one per device)"""
+    
+    list_display = ('user', 'ip_address', 'remember_me', 'created_at', 'last_refreshed_at', 'expires_at', 'revoked_at')
+    list_filter = ('remember_me', 'created_at', 'revoked_at')
+    search_fields = ('user__login_id', 'user__email', 'ip_address', 'refresh_jti')
+    readonly_fields = ('user', 'refresh_jti', 'ip_address', 'user_agent', 'created_at', 'last_refreshed_at', 'expires_at')
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+    
+    def has_add_permission(self, request):
+        """Sessions are only created by logging in"""
+        return False
+
+
 @admin.register(PermissionCategory)
 class PermissionCategoryAdmin(admin.ModelAdmin):
     """Permission Category Admin"""
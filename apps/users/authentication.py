@@ -1,6 +1,26 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.backends import BaseBackend
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from apps.common.utils import get_client_ip
+from .blacklist import token_blacklist
+from .hashing import password_hash_limiter
+from .lockout import login_attempts
+from .tokens import (
+    PRINCIPAL_VERSION_CLAIM, SESSION_ID_CLAIM, TOKEN_GENERATION_CLAIM, is_current_generation, principal_version,
+)
+from .token_permissions import bump_now_and_on_commit, incr_version, pin_permission_mask
 
 User = get_user_model()
 
@@ -13,35 +33,60 @@ class LoginIdBackend(BaseBackend):
     
     def authenticate(self, request, login_id=None, password=None, **kwargs):
         """
-        Authenticate user using login_id and password
+        Authenticate user using login_id and password.
+        
+        Blocked login ids/IPs and locked accounts are rejected before the
+        password is hashed. Rejections raise PermissionDenied so the
+        remaining backends do not hash the password again.
         """
         if login_id is None or password is None:
             return None
         
+        user = self.get_login_user(request, login_id)
+        
+        # Check password inside a shared hashing slot (503 when all are taken)
+        if not password_hash_limiter.check_password(user, password):
+            self.login_failed(request, login_id, user)
+        
+        login_attempts.reset(login_id, user)
+        return User.objects.prefetch_login_relations(user)
+    
+    async def aauthenticate(self, request, login_id=None, password=None, **kwargs):
+        """
+        Async variant of authenticate(); the password hash runs on a worker
+        thread while the event loop serves other requests.
+        """
+        if login_id is None or password is None:
+            return None
+        
+        user = await sync_to_async(self.get_login_user)(request, login_id)
+        
+        if not await password_hash_limiter.acheck_password(user, password):
+            await sync_to_async(self.login_failed)(request, login_id, user)
+        
+        await sync_to_async(login_attempts.reset)(login_id, user)
+        return await sync_to_async(User.objects.prefetch_login_relations)(user)
+    
+    def get_login_user(self, request, login_id):
+        """Find the user for a login attempt, rejecting blocked or locked principals"""
+        client_ip = get_client_ip(request)
+        if login_attempts.blocked_until(login_id, client_ip):
+            raise PermissionDenied('Too many failed login attempts.')
+        
         try:
-            # Try to find user by login_id
-            user = User.objects.get(
-                Q(login_id=login_id) | Q(email=login_id),  # Allow login with email as well
-                is_active=True
-            )
-            
-            # Check password
-            if user.check_password(password):
-                return user
-            else:
-                # Increment failed login attempts
-                user.failed_login_attempts += 1
-                
-                # Lock account after 5 failed attempts for 30 minutes
-                if user.failed_login_attempts >= 5:
-                    from django.utils import timezone
-                    user.locked_until = timezone.now() + timezone.timedelta(minutes=30)
-                
-                user.save(update_fields=['failed_login_attempts', 'locked_until'])
-                return None
-                
+            # Single case-insensitive lookup by login_id or email
+            user = User.objects.get_for_login(login_id)
         except User.DoesNotExist:
-            return None
+            self.login_failed(request, login_id)
+        
+        if user.locked_until and user.locked_until > timezone.now():
+            raise PermissionDenied('Account is locked.')
+        return user
+    
+    def login_failed(self, request, login_id, user=None):
+        """Count the failed attempt and stop the authentication chain"""
+        login_attempts.register_failure(login_id, get_client_ip(request), user=user)
+        raise PermissionDenied('Invalid login credentials.')
     
     def get_user(self, user_id):
         """
@@ -51,3 +96,170 @@ class LoginIdBackend(BaseBackend):
             return User.objects.get(pk=user_id)
         except User.DoesNotExist:
             return None
+
+
+def _detached(user):
+    """Copy of a cached user that requests can modify without affecting the cache"""
+    clone = copy.copy(user)
+    if '_prefetched_objects_cache' in clone.__dict__:
+        clone._prefetched_objects_cache = dict(clone._prefetched_objects_cache)
+    return clone
+
+
+class PrincipalCache:
+    """
+    Two-tier cache of authenticated users: a per-process LRU in front of the
+    shared (Redis) cache. Entries are keyed by user id and carry the principal
+    version they were loaded at, so a token minted after a change never
+    resolves to an older copy of the user.
+
+    Entries also record the user's shared invalidation stamp, which
+    ``invalidate()`` increments. Every lookup reads the stamp (one small
+    cache read) before trusting an entry, so an invalidation in one worker
+    process retires the copies held by all the others.
+    """
+
+    key_prefix = 'users:principal'
+    stamp_key_prefix = 'users:principal_stamp'
+
+    def __init__(self, maxsize=None, local_ttl=None, shared_ttl=None):
+        self.maxsize = maxsize or getattr(settings, 'PRINCIPAL_CACHE_LOCAL_SIZE', 1024)
+        self.local_ttl = local_ttl or getattr(settings, 'PRINCIPAL_CACHE_LOCAL_TTL', 30)
+        self.shared_ttl = shared_ttl or getattr(settings, 'PRINCIPAL_CACHE_SHARED_TTL', 300)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'stale': 0, 'invalidations': 0}
+
+    def make_key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    def make_stamp_key(self, user_id):
+        return f'{self.stamp_key_prefix}:{user_id}'
+
+    def stamp(self, user_id):
+        """Current invalidation stamp of the user; read it before loading the row"""
+        return cache.get(self.make_stamp_key(user_id), 0)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _get_local(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[3] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[:3]
+
+    def _set_local(self, user_id, user, version, stamp):
+        with self._lock:
+            self._entries[user_id] = (user, version, stamp, time.monotonic() + self.local_ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, user_id, min_version=0, stamp=None):
+        """Return a cached user at least as new as ``min_version``, or None"""
+        if stamp is None:
+            stamp = self.stamp(user_id)
+        entry = self._get_local(user_id)
+        if entry is not None:
+            if entry[1] >= min_version and entry[2] == stamp:
+                self._count('local_hits')
+                # Requests must not share (and mutate) one instance
+                return _detached(entry[0])
+            self._count('stale')
+
+        entry = cache.get(self.make_key(user_id))
+        if entry is not None:
+            if entry[1] >= min_version and entry[2] == stamp:
+                self._count('shared_hits')
+                self._set_local(user_id, entry[0], entry[1], stamp)
+                return _detached(entry[0])
+            self._count('stale')
+
+        self._count('misses')
+        return None
+
+    def set(self, user, min_version=0, stamp=None):
+        """
+        Cache a user loaded from the database. ``stamp`` must be read before
+        the row was loaded, so a concurrent invalidation is not masked.
+        """
+        if stamp is None:
+            stamp = self.stamp(user.pk)
+        # A row fetched from the database is authoritative, even if its
+        # timestamp lags the token's stamp
+        version = max(principal_version(user), min_version)
+        self._set_local(str(user.pk), user, version, stamp)
+        cache.set(self.make_key(user.pk), (user, version, stamp), self.shared_ttl)
+        return _detached(user)
+
+    def invalidate(self, user_id):
+        """Retire every cached copy of the user, in this process and the others"""
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+            self._stats['invalidations'] += 1
+
+        def bump():
+            incr_version(self.make_stamp_key(user_id))
+            cache.delete(self.make_key(user_id))
+
+        bump_now_and_on_commit(bump)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['local_size'] = len(self._entries)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['local_hits'] + stats['shared_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+principal_cache = PrincipalCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that resolves the principal from ``principal_cache``
+    instead of querying the users table on every request.
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if token_blacklist.is_revoked(validated_token.get(SESSION_ID_CLAIM)):
+            raise InvalidToken('Token is blacklisted')
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if not is_current_generation(user_id, validated_token.get(TOKEN_GENERATION_CLAIM, 0)):
+            raise InvalidToken('Token has been revoked')
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken('Token contained no recognizable user identification') from e
+
+        min_version = validated_token.get(PRINCIPAL_VERSION_CLAIM, 0)
+        stamp = principal_cache.stamp(str(user_id))
+        user = principal_cache.get(str(user_id), min_version, stamp)
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed('User not found', code='user_not_found') from e
+            user = principal_cache.set(user, min_version, stamp)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+
+        # A detached copy per request, so its permission mask can be memoized
+        return pin_permission_mask(user)
@@ -0,0 +1,169 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings"""
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        # m = -n ln p / (ln 2)^2, k = m/n ln 2
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] >> (position & 7) & 1 for position in self._positions(value))
+
+
+class TokenBlacklist:
+    """
+    Revoked session ids kept in the shared (Redis) cache with a TTL equal to
+    the remaining token lifetime, so the store only ever holds live entries.
+
+    Every revocation is also appended to a sequence-numbered log. Each process
+    replays that log into an in-process bloom filter at most once per
+    ``sync_interval`` seconds; ids the filter has never seen are answered as
+    "not revoked" without a cache round trip, and only filter hits are
+    confirmed against the cache. Filters rotate every ``rotation_period``
+    (the longest token lifetime), keeping the previous generation, so an id
+    stays in a filter for at least as long as its token can be presented.
+    """
+
+    key_prefix = 'users:revoked'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current = BloomFilter(self.filter_capacity)
+        self._previous = None
+        self._rotated_at = time.monotonic()
+        self._synced_at = 0.0
+        self._seq = None
+
+    @property
+    def sync_interval(self):
+        return getattr(settings, 'TOKEN_BLACKLIST_SYNC_INTERVAL', 1)
+
+    @property
+    def filter_capacity(self):
+        return getattr(settings, 'TOKEN_BLACKLIST_FILTER_CAPACITY', 100000)
+
+    @property
+    def rotation_period(self):
+        from .tokens import REMEMBER_ME_LIFETIME
+        return REMEMBER_ME_LIFETIME.total_seconds()
+
+    @property
+    def seq_key(self):
+        return f'{self.key_prefix}:seq'
+
+    @property
+    def floor_key(self):
+        return f'{self.key_prefix}:floor'
+
+    def _entry_key(self, value):
+        return f'{self.key_prefix}:id:{value}'
+
+    def _log_key(self, seq):
+        return f'{self.key_prefix}:log:{seq}'
+
+    def _add_local(self, value):
+        if time.monotonic() - self._rotated_at >= self.rotation_period:
+            self._previous, self._current = self._current, BloomFilter(self.filter_capacity)
+            self._rotated_at = time.monotonic()
+        self._current.add(value)
+
+    def _might_contain(self, value):
+        return value in self._current or (self._previous is not None and value in self._previous)
+
+    def _replay(self, start, end, batch_size=1000):
+        for first in range(start, end + 1, batch_size):
+            keys = [self._log_key(seq) for seq in range(first, min(first + batch_size, end + 1))]
+            for value in cache.get_many(keys).values():
+                self._add_local(value)
+
+    def sync(self, force=False):
+        """Replay revocations logged by other processes into the local filter"""
+        now = time.monotonic()
+        if not force and now - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            if not force and now - self._synced_at < self.sync_interval:
+                return
+            values = cache.get_many([self.seq_key, self.floor_key])
+            seq = values.get(self.seq_key, 0)
+            if self._seq is None:
+                # First sync: load every log entry that may still be live
+                self._replay(values.get(self.floor_key, 0) + 1, seq)
+            elif seq > self._seq:
+                self._replay(self._seq + 1, seq)
+            elif seq < self._seq:
+                # The cache was flushed; start over
+                self._current, self._previous = BloomFilter(self.filter_capacity), None
+                self._replay(values.get(self.floor_key, 0) + 1, seq)
+            self._seq = seq
+            self._synced_at = now
+
+    def revoke(self, value, expires_at):
+        """Blacklist ``value`` until ``expires_at``"""
+        ttl = int((expires_at - timezone.now()).total_seconds()) + 1
+        if ttl <= 0:
+            return
+        value = str(value)
+        cache.set(self._entry_key(value), 1, ttl)
+        cache.add(self.seq_key, 0, None)
+        seq = cache.incr(self.seq_key)
+        cache.set(self._log_key(seq), value, ttl)
+        with self._lock:
+            self._add_local(value)
+
+    def is_revoked(self, value):
+        if value is None:
+            return False
+        value = str(value)
+        self.sync()
+        if not self._might_contain(value):
+            return False
+        return cache.get(self._entry_key(value)) is not None
+
+    def compact(self, batch_size=1000):
+        """
+        Advance the log floor past entries that have expired, so new
+        processes only replay live revocations. Returns the new floor.
+        """
+        values = cache.get_many([self.seq_key, self.floor_key])
+        seq, floor = values.get(self.seq_key, 0), values.get(self.floor_key, 0)
+        while floor < seq:
+            keys = [self._log_key(n) for n in range(floor + 1, min(floor + batch_size, seq) + 1)]
+            found = cache.get_many(keys)
+            expired = 0
+            for key in keys:
+                if key in found:
+                    break
+                expired += 1
+            floor += expired
+            if expired < len(keys):
+                break
+        cache.set(self.floor_key, floor, None)
+        return floor
+
+
+token_blacklist = TokenBlacklist()
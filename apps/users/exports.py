@@ -0,0 +1,167 @@
+"""
+Streaming exports of the staff list and role assignments (CSV or JSONL).
+
+Rows are read as tuples with ``values_list().iterator(chunk_size)`` (a
+server-side cursor on PostgreSQL), so no model instances are built and
+memory stays flat whatever the row count. Users' active role names are
+loaded with one query per chunk (a ';'-joined CSV column, a JSONL list).
+The CSV header line is yielded before the first query runs, so the first
+byte leaves immediately. CSV cells that a spreadsheet would read as a
+formula are prefixed with a quote.
+
+The response is produced by the worker serving the request; a sync
+(gunicorn) worker stays busy until the last row is sent.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .models import UserRole
+
+
+USER_EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('login_id', 'login_id'),
+    ('employee_id', 'employee_id'),
+    ('name', 'name'),
+    ('email', 'email'),
+    ('mobile', 'mobile'),
+    ('user_type', 'user_type'),
+    ('department', 'department__name'),
+    ('designation', 'designation__name'),
+    ('salary', 'salary'),
+    ('date_of_joining', 'date_of_joining'),
+    ('district', 'district__name'),
+    ('thana', 'thana__name'),
+    ('is_active', 'is_active'),
+    ('date_joined', 'date_joined'),
+)
+
+ROLE_ASSIGNMENT_EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('user_id', 'user_id'),
+    ('login_id', 'user__login_id'),
+    ('employee_id', 'user__employee_id'),
+    ('user_name', 'user__name'),
+    ('role', 'role__name'),
+    ('role_display_name', 'role__display_name'),
+    ('is_active', 'is_active'),
+    ('assigned_by', 'assigned_by__login_id'),
+    ('assigned_at', 'assigned_at'),
+    ('expires_at', 'expires_at'),
+    ('assignment_reason', 'assignment_reason'),
+    ('revoked_at', 'revoked_at'),
+)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def _chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_user_rows(queryset):
+    """Export rows of the users, ending with the list of their active role names"""
+    lookups = [lookup for _, lookup in USER_EXPORT_COLUMNS]
+    rows = queryset.order_by('pk').values_list(*lookups).iterator(chunk_size=_chunk_size())
+    for chunk in _chunks(rows, _chunk_size()):
+        roles = {}
+        for user_id, role_name in UserRole.objects.filter(
+            user_id__in=[row[0] for row in chunk], is_active=True
+        ).order_by('role__name').values_list('user_id', 'role__name'):
+            roles.setdefault(user_id, []).append(role_name)
+        for row in chunk:
+            yield row + (roles.get(row[0], []),)
+
+
+def iter_role_assignment_rows(queryset):
+    lookups = [lookup for _, lookup in ROLE_ASSIGNMENT_EXPORT_COLUMNS]
+    return queryset.order_by('pk').values_list(*lookups).iterator(chunk_size=_chunk_size())
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ';'.join(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+# Leading characters that make spreadsheet applications evaluate a cell
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    """Cell text, quoted against formula injection (a leading ``'`` keeps it text)"""
+    text = _text(value)
+    if text.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + text
+    return text
+
+
+def csv_lines(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+class ExportJSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder that writes other values (phone numbers) as strings"""
+
+    def default(self, o):
+        try:
+            return super().default(o)
+        except TypeError:
+            return str(o)
+
+
+def jsonl_lines(headers, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(headers, row)), cls=ExportJSONEncoder) + '\n'
+
+
+def streaming_export(name, export_format, headers, rows):
+    """StreamingHttpResponse of ``rows`` as a CSV or JSONL attachment"""
+    lines = csv_lines(headers, rows) if export_format == 'csv' else jsonl_lines(headers, rows)
+    response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[export_format])
+    filename = f"{name}-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Let reverse proxies pass chunks through as they are produced
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def export_users(queryset, export_format):
+    headers = [header for header, _ in USER_EXPORT_COLUMNS] + ['roles']
+    return streaming_export('users', export_format, headers, iter_user_rows(queryset))
+
+
+def export_role_assignments(queryset, export_format):
+    headers = [header for header, _ in ROLE_ASSIGNMENT_EXPORT_COLUMNS]
+    return streaming_export('role-assignments', export_format, headers, iter_role_assignment_rows(queryset))
@@ -0,0 +1,215 @@
+import bisect
+import random
+import time
+import uuid
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+from django.core.cache import cache
+
+try:
+    from django_redis import get_redis_connection
+except ImportError:  # other cache backends (LocMem in tests)
+    get_redis_connection = None
+
+
+# Delete KEYS[1] only while it still holds ARGV[1], in one step on the server
+RELEASE_SLOT_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class HashingCapacityExceeded(Exception):
+    """Raised when no password hashing slot frees up within the queue timeout"""
+
+
+def _incr(key, delta=1):
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, delta, None)
+        return delta
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of durations in seconds, kept in the shared cache
+    so every worker process adds to (and reports) the same counters
+    """
+
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+    key_prefix = 'users:histogram'
+
+    def __init__(self, name, buckets=None):
+        self.name = name
+        self.buckets = tuple(buckets or self.default_buckets)
+
+    def _bucket_key(self, index):
+        return f'{self.key_prefix}:{self.name}:{index}'
+
+    @property
+    def sum_key(self):
+        return f'{self.key_prefix}:{self.name}:sum_us'
+
+    def observe(self, value):
+        _incr(self._bucket_key(bisect.bisect_left(self.buckets, value)))
+        _incr(self.sum_key, int(value * 1e6))
+
+    def snapshot(self):
+        keys = [self._bucket_key(index) for index in range(len(self.buckets) + 1)]
+        values = cache.get_many(keys + [self.sum_key])
+        cumulative, buckets = 0, {}
+        for bound, key in zip(self.buckets + ('+Inf',), keys):
+            cumulative += values.get(key, 0)
+            buckets[str(bound)] = cumulative
+        return {'buckets': buckets, 'count': cumulative, 'sum': round(values.get(self.sum_key, 0) / 1e6, 6)}
+
+
+class PasswordHashLimiter:
+    """
+    Admission control for password hashing across every worker process.
+
+    The app runs on sync gunicorn workers (Dockerfile, docker-compose.yml):
+    each process serves one request at a time, so a per-process queue never
+    fills and cannot protect the site. Instead each hash holds one of
+    ``PASSWORD_HASH_CONCURRENCY`` slots in the shared (Redis) cache for the
+    duration of the hash. A slot is a key taken with ``cache.add()`` (SET NX)
+    and leased for ``PASSWORD_HASH_TIMEOUT`` seconds, so a worker killed
+    mid-hash frees its slot when the lease runs out.
+
+    When every slot is taken the request waits up to
+    ``PASSWORD_HASH_QUEUE_TIMEOUT`` seconds for one to free, then is shed
+    with HashingCapacityExceeded (a 503 with Retry-After). A login burst
+    then ties up at most that many workers on PBKDF2, and the remaining
+    workers keep serving other endpoints. The hash itself runs on the
+    request's thread. The admission wait and hash duration histograms and
+    the rejection counter are shared by every process.
+    """
+
+    key_prefix = 'users:hash_slot'
+    rejected_key = 'users:hash_slot_rejected'
+    # Seconds between attempts to take a slot while queued
+    poll_interval = 0.02
+
+    def __init__(self, concurrency=None, lease=None, queue_timeout=None):
+        self.concurrency = concurrency or getattr(settings, 'PASSWORD_HASH_CONCURRENCY', 2)
+        self.lease = lease or getattr(settings, 'PASSWORD_HASH_TIMEOUT', 5)
+        if queue_timeout is None:
+            queue_timeout = getattr(settings, 'PASSWORD_HASH_QUEUE_TIMEOUT', 0.25)
+        self.queue_timeout = queue_timeout
+        self.queue_wait = Histogram('password_hash_queue_wait')
+        self.hash_duration = Histogram('password_hash_duration')
+
+    def _slot_key(self, index):
+        return f'{self.key_prefix}:{index}'
+
+    def _acquire(self):
+        """Take a free slot; returns its key and lease token, or None when all are taken"""
+        token = uuid.uuid4().hex
+        # Start at a random slot so concurrent callers rarely probe the same keys
+        start = random.randrange(self.concurrency)
+        for offset in range(self.concurrency):
+            key = self._slot_key((start + offset) % self.concurrency)
+            if cache.add(key, token, self.lease):
+                return key, token
+        return None
+
+    def _admit(self):
+        """Take a slot, waiting up to ``queue_timeout`` for one to free; None when none did"""
+        started_at = time.monotonic()
+        deadline = started_at + self.queue_timeout
+        while True:
+            lease = self._acquire()
+            if lease is not None or time.monotonic() >= deadline:
+                break
+            time.sleep(self.poll_interval)
+        self.queue_wait.observe(time.monotonic() - started_at)
+        return lease
+
+    def _redis(self):
+        if get_redis_connection is None:
+            return None
+        try:
+            return get_redis_connection('default')
+        except NotImplementedError:
+            # The default cache is not django-redis
+            return None
+
+    def _release(self, key, token):
+        """Free the slot only while the lease is still ours; once it expired it may be another worker's"""
+        client = self._redis()
+        if client is not None:
+            client.eval(RELEASE_SLOT_SCRIPT, 1, cache.make_key(key), cache.client.encode(token))
+            return
+        # Process-local backends: nothing else can take the slot in between
+        if cache.get(key) == token:
+            cache.delete(key)
+
+    @contextmanager
+    def slot(self):
+        """Hold a hashing slot for the block, or raise HashingCapacityExceeded"""
+        lease = self._admit()
+        if lease is None:
+            _incr(self.rejected_key)
+            raise HashingCapacityExceeded('Password hashing capacity exceeded.')
+        try:
+            yield
+        finally:
+            self._release(*lease)
+
+    def run(self, fn, *args):
+        """``fn(*args)`` on the calling thread, inside a hashing slot"""
+        with self.slot():
+            started_at = time.monotonic()
+            try:
+                return fn(*args)
+            finally:
+                self.hash_duration.observe(time.monotonic() - started_at)
+
+    async def arun(self, fn, *args):
+        # Off the event loop; PBKDF2 releases the GIL while it hashes
+        return await sync_to_async(self.run, thread_sensitive=False)(fn, *args)
+
+    def _finish_check(self, user, raw_password, result):
+        is_correct, must_update = result
+        if is_correct and must_update:
+            # Hasher upgrade: rare, done inline on the request thread
+            user.set_password(raw_password)
+            user.save(update_fields=['password'])
+        return is_correct
+
+    def check_password(self, user, raw_password):
+        """Admission-controlled equivalent of ``user.check_password()``"""
+        result = self.run(verify_password, raw_password, user.password)
+        return self._finish_check(user, raw_password, result)
+
+    async def acheck_password(self, user, raw_password):
+        result = await self.arun(verify_password, raw_password, user.password)
+        if result[0] and result[1]:
+            return await sync_to_async(self._finish_check)(user, raw_password, result)
+        return result[0]
+
+    def set_password(self, user, raw_password):
+        """Admission-controlled equivalent of ``user.set_password()``; the caller saves"""
+        user.password = self.run(make_password, raw_password)
+        user._password = raw_password
+
+    def stats(self):
+        """Numbers across every worker process"""
+        return {
+            'concurrency': self.concurrency,
+            'queue_timeout': self.queue_timeout,
+            'rejected': cache.get(self.rejected_key, 0),
+            'queue_wait_seconds': self.queue_wait.snapshot(),
+            'hash_duration_seconds': self.hash_duration.snapshot(),
+        }
+
+
+password_hash_limiter = PasswordHashLimiter()
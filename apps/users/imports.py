@@ -0,0 +1,394 @@
+"""
+Bulk user import from CSV or JSONL (``POST users/import/``, ``manage.py import_users``).
+
+Rows are validated in passes over the whole file rather than one
+UserCreateSerializer per row: field and password checks per row (no
+queries), then one query each for existing login IDs/emails, departments,
+designations, districts, thanas and roles. Valid rows are inserted with
+``bulk_create`` and their roles linked with the set-based bulk role
+assignment. Invalid rows are reported with their errors and skipped, as
+are rows that hit a unique constraint at insert time (a user created
+concurrently).
+
+Each plaintext ``password`` costs one full PBKDF2 hash, so the endpoint
+queues files above USER_IMPORT_ASYNC_THRESHOLD rows or with more than
+USER_IMPORT_SYNC_PASSWORDS passwords as a background job. The uploaded
+file is kept in USER_IMPORT_UPLOAD_DIR (not served) and only its name is
+passed to the task, so passwords never reach the broker; the job deletes
+it when done. The job hashes in a pool of USER_IMPORT_HASH_WORKERS
+processes. A ``password_hash`` column (an encoded Django hash) is stored
+as is; rows with neither get an unusable password and must reset it.
+"""
+import csv
+import io
+import json
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+from phonenumber_field.serializerfields import PhoneNumberField
+from rest_framework import serializers
+from apps.common.models import District, Thana
+from .models import User, Role, Department, Designation, validate_login_id
+from .services import BulkRoleJob, bulk_assign_role
+
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+# Status of queued imports, polled by clients
+USER_IMPORT_JOB_KEY = 'users:user_import_job:{}'
+
+
+class ImportFileError(ValueError):
+    """The file cannot be imported at all (unreadable, unknown format, too many rows)"""
+
+
+class UserImportRowSerializer(serializers.Serializer):
+    """Field validation of one import row; references are resolved in bulk afterwards"""
+
+    login_id = serializers.CharField(max_length=150, validators=[validate_login_id])
+    email = serializers.EmailField()
+    password = serializers.CharField(required=False, allow_blank=True)
+    password_hash = serializers.CharField(required=False)
+    mobile = PhoneNumberField()
+    user_type = serializers.ChoiceField(choices=User.USER_TYPES)
+    name = serializers.CharField(max_length=150)
+    employee_id = serializers.CharField(max_length=50, required=False)
+    salary = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    date_of_joining = serializers.DateField(required=False)
+    address = serializers.CharField(required=False)
+    postal_code = serializers.CharField(max_length=20, required=False)
+    remarks = serializers.CharField(required=False)
+    # Department/designation names, district code or name, thana code or name within the district
+    department = serializers.CharField(required=False)
+    designation = serializers.CharField(required=False)
+    district = serializers.CharField(required=False)
+    thana = serializers.CharField(required=False)
+    roles = serializers.ListField(child=serializers.CharField(), required=False)
+
+    def validate_password_hash(self, value):
+        try:
+            identify_hasher(value)
+        except ValueError:
+            raise serializers.ValidationError('Not a recognized password hash.')
+        return value
+
+    def validate(self, attrs):
+        password = attrs.get('password')
+        if password and attrs.get('password_hash'):
+            raise serializers.ValidationError({'password': ['Give either password or password_hash, not both.']})
+        if password:
+            user = User(login_id=attrs['login_id'], email=attrs['email'], name=attrs['name'])
+            try:
+                validate_password(password, user=user)
+            except DjangoValidationError as e:
+                raise serializers.ValidationError({'password': e.messages})
+        if attrs.get('thana') and not attrs.get('district'):
+            raise serializers.ValidationError({'thana': ['A thana requires its district.']})
+        return attrs
+
+
+def read_rows(stream, file_format):
+    """Parse a binary file object into row dicts; blank CSV cells are dropped"""
+    if file_format not in IMPORT_FORMATS:
+        raise ImportFileError('Unsupported import format; use csv or jsonl')
+    max_rows = getattr(settings, 'USER_IMPORT_MAX_ROWS', 20000)
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    rows = []
+    try:
+        if file_format == 'csv':
+            for raw in csv.DictReader(text):
+                rows.append({
+                    key.strip(): value.strip() for key, value in raw.items()
+                    if key and value is not None and value.strip()
+                })
+                if len(rows) > max_rows:
+                    break
+        else:
+            for line in text:
+                if not line.strip():
+                    continue
+                try:
+                    raw = json.loads(line)
+                except ValueError:
+                    raw = None
+                # Malformed lines are reported as row errors
+                rows.append(raw if isinstance(raw, dict) else {'__invalid__': line.strip()[:80]})
+                if len(rows) > max_rows:
+                    break
+    except UnicodeDecodeError:
+        raise ImportFileError('The file is not UTF-8 encoded')
+    finally:
+        # Leave the caller's file open (the view may still store it)
+        text.detach()
+    if len(rows) > max_rows:
+        raise ImportFileError(f'At most {max_rows} rows can be imported at once')
+    return rows
+
+
+def password_count(rows):
+    """Rows with a plaintext password, i.e. PBKDF2 hashes an import of ``rows`` would compute"""
+    return sum(1 for row in rows if str(row.get('password') or '').strip())
+
+
+def runs_in_background(rows, dry_run=False):
+    """Whether the import endpoint queues ``rows`` instead of importing them in the request"""
+    if len(rows) > getattr(settings, 'USER_IMPORT_ASYNC_THRESHOLD', 1000):
+        return True
+    return not dry_run and password_count(rows) > getattr(settings, 'USER_IMPORT_SYNC_PASSWORDS', 10)
+
+
+def upload_storage():
+    """Private storage of files queued for a background import"""
+    return FileSystemStorage(location=settings.USER_IMPORT_UPLOAD_DIR)
+
+
+def _setup_hash_worker():
+    # Pool processes that were not forked from a configured Django process (spawn / forkserver)
+    if not apps.ready:
+        django.setup()
+
+
+def hash_passwords(passwords, workers=1):
+    """Encoded hashes of ``passwords``, in order; ``workers`` > 1 hashes them in a process pool"""
+    if workers <= 1 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    chunksize = max(len(passwords) // (workers * 4), 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_setup_hash_worker) as executor:
+        return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+class UserImportJob(BulkRoleJob):
+    """Cache-backed status of a queued user import; ``result`` holds the import report"""
+
+    key_format = USER_IMPORT_JOB_KEY
+
+    @classmethod
+    def create(cls, actor, total, dry_run=False):
+        job = cls(uuid.uuid4())
+        job.save({
+            'job_id': job.job_id,
+            'status': 'pending',
+            'requested_by': str(actor.id),
+            'dry_run': dry_run,
+            'total': total,
+            'result': None,
+            'error': None,
+            'created_at': timezone.now().isoformat(),
+        })
+        return job
+
+
+def _normalize(row):
+    row = {key: value for key, value in row.items() if value not in ('', None)}
+    roles = row.get('roles')
+    if isinstance(roles, str):
+        row['roles'] = [name.strip() for name in roles.replace(',', ';').split(';') if name.strip()]
+    return row
+
+
+def _by_lower(values):
+    return {value.lower() for value in values if value}
+
+
+class UserImport:
+    """One import run: ``validate()`` then ``save()``; ``report()`` at any point"""
+
+    def __init__(self, rows, actor, dry_run=False, hash_workers=1):
+        self.rows = rows
+        self.actor = actor
+        self.dry_run = dry_run
+        self.hash_workers = hash_workers
+        self.errors = {}
+        self.valid = {}
+        self.created = 0
+
+    def add_error(self, index, field, message):
+        self.errors.setdefault(index, {}).setdefault(field, []).append(message)
+        self.valid.pop(index, None)
+
+    def validate(self):
+        # Pass 1: fields and passwords, no queries
+        for index, raw in enumerate(self.rows, start=1):
+            if '__invalid__' in raw:
+                self.errors[index] = {'non_field_errors': ['Line is not a JSON object.']}
+                continue
+            serializer = UserImportRowSerializer(data=_normalize(raw))
+            if serializer.is_valid():
+                self.valid[index] = dict(serializer.validated_data)
+            else:
+                self.errors[index] = serializer.errors
+        self._check_duplicates()
+        self._check_existing()
+        self._resolve_references()
+        self._resolve_roles()
+        return not self.errors
+
+    def _check_duplicates(self):
+        for field in ('login_id', 'email'):
+            counts = Counter(attrs[field].lower() for attrs in self.valid.values())
+            for index, attrs in list(self.valid.items()):
+                if counts[attrs[field].lower()] > 1:
+                    self.add_error(index, field, f'Duplicate {field} in the file.')
+
+    def _check_existing(self):
+        """One query (served by the lower() indexes) for login IDs and emails already taken"""
+        login_ids = _by_lower(attrs['login_id'] for attrs in self.valid.values())
+        emails = _by_lower(attrs['email'] for attrs in self.valid.values())
+        if not login_ids:
+            return
+        taken_login_ids, taken_emails = set(), set()
+        for login_id, email, username in User.objects.annotate(
+            login_id_lower=Lower('login_id'), email_lower=Lower('email'),
+        ).filter(
+            Q(login_id_lower__in=login_ids) | Q(email_lower__in=emails) | Q(username__in=login_ids)
+        ).values_list('login_id', 'email', 'username'):
+            taken_login_ids.update((login_id.lower(), username.lower()))
+            taken_emails.add(email.lower())
+        for index, attrs in list(self.valid.items()):
+            if attrs['login_id'].lower() in taken_login_ids:
+                self.add_error(index, 'login_id', 'A user with this login ID already exists.')
+            if attrs['email'].lower() in taken_emails:
+                self.add_error(index, 'email', 'A user with this email already exists.')
+
+    def _resolve_references(self):
+        """Departments and designations by name, districts by code or name, thanas within them"""
+        rows = self.valid.values()
+        departments = {
+            name.lower(): pk for pk, name in Department.objects.annotate(name_lower=Lower('name')).filter(
+                name_lower__in=_by_lower(attrs.get('department') for attrs in rows)
+            ).values_list('pk', 'name')
+        }
+        designations = {
+            name.lower(): pk for pk, name in Designation.objects.annotate(name_lower=Lower('name')).filter(
+                name_lower__in=_by_lower(attrs.get('designation') for attrs in rows)
+            ).values_list('pk', 'name')
+        }
+        district_keys = _by_lower(attrs.get('district') for attrs in rows)
+        districts = {}
+        for pk, code, name in District.objects.annotate(code_lower=Lower('code'), name_lower=Lower('name')).filter(
+            Q(code_lower__in=district_keys) | Q(name_lower__in=district_keys)
+        ).values_list('pk', 'code', 'name'):
+            districts[code.lower()] = districts[name.lower()] = pk
+        thanas = {}
+        for pk, district_id, code, name in Thana.objects.filter(
+            district_id__in=set(districts.values())
+        ).values_list('pk', 'district_id', 'code', 'name'):
+            thanas[district_id, code.lower()] = thanas[district_id, name.lower()] = pk
+
+        for index, attrs in list(self.valid.items()):
+            for field, lookup in (('department', departments), ('designation', designations)):
+                if attrs.get(field):
+                    attrs[f'{field}_id'] = lookup.get(attrs[field].lower())
+                    if attrs[f'{field}_id'] is None:
+                        self.add_error(index, field, f'Unknown {field} "{attrs[field]}".')
+            if attrs.get('district'):
+                attrs['district_id'] = districts.get(attrs['district'].lower())
+                if attrs['district_id'] is None:
+                    self.add_error(index, 'district', f'Unknown district "{attrs["district"]}".')
+                elif attrs.get('thana'):
+                    attrs['thana_id'] = thanas.get((attrs['district_id'], attrs['thana'].lower()))
+                    if attrs['thana_id'] is None:
+                        self.add_error(index, 'thana', f'Unknown thana "{attrs["thana"]}" in this district.')
+
+    def _resolve_roles(self):
+        """Roles by name among those the actor may assign, within their max_assignments"""
+        names = {name for attrs in self.valid.values() for name in attrs.get('roles', ())}
+        self.roles = {role.name: role for role in Role.objects.assignable_by(self.actor).filter(name__in=names)}
+        for index, attrs in list(self.valid.items()):
+            for name in attrs.get('roles', ()):
+                if name not in self.roles:
+                    self.add_error(index, 'roles', f'Unknown role "{name}" or not assignable by you.')
+        requested = Counter(name for attrs in self.valid.values() for name in set(attrs.get('roles', ())))
+        for name, count in requested.items():
+            role = self.roles[name]
+            if role.max_assignments is not None and role.active_assignments + count > role.max_assignments:
+                message = str(Role.objects.capacity_error(role.pk, count).messages[0])
+                for index, attrs in list(self.valid.items()):
+                    if name in attrs.get('roles', ()):
+                        self.add_error(index, 'roles', message)
+
+    def _hash_passwords(self):
+        """Encoded password per valid row: given hashes as is, plaintext hashed (in a pool), else unusable"""
+        plain = [index for index, attrs in self.valid.items() if attrs.get('password')]
+        passwords = [self.valid[index]['password'] for index in plain]
+        hashes = dict(zip(plain, hash_passwords(passwords, self.hash_workers)))
+        return {
+            index: attrs.get('password_hash') or hashes.get(index) or make_password(None)
+            for index, attrs in self.valid.items()
+        }
+
+    def _insert(self, users):
+        """
+        bulk_create ``users``; when a unique value was taken after validation,
+        insert row by row and report the conflicting rows instead
+        """
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users.values(), batch_size=getattr(settings, 'USER_IMPORT_BATCH_SIZE', 1000))
+            return
+        except IntegrityError:
+            pass
+        for index, user in list(users.items()):
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create([user])
+            except IntegrityError:
+                del users[index]
+                self.add_error(index, 'non_field_errors', 'A user with this login ID or email already exists.')
+
+    def save(self):
+        """Insert the valid rows and link their roles, in one transaction"""
+        if self.dry_run or not self.valid:
+            return []
+        model_fields = (
+            'login_id', 'email', 'mobile', 'user_type', 'name', 'employee_id', 'salary', 'date_of_joining',
+            'address', 'postal_code', 'remarks', 'department_id', 'designation_id', 'district_id', 'thana_id',
+        )
+        hashes = self._hash_passwords()
+        users = {
+            index: User(
+                username=attrs['login_id'],
+                password=hashes[index],
+                **{field: attrs[field] for field in model_fields if attrs.get(field) is not None},
+            )
+            for index, attrs in self.valid.items()
+        }
+        with transaction.atomic():
+            self._insert(users)
+            members = {}
+            for index, attrs in self.valid.items():
+                for name in set(attrs.get('roles', ())):
+                    members.setdefault(name, []).append(users[index].pk)
+            for name, user_ids in members.items():
+                bulk_assign_role(self.roles[name], user_ids, self.actor, reason='Bulk user import')
+        self.created = len(users)
+        return list(users.values())
+
+    def run(self):
+        self.validate()
+        self.save()
+        return self.report()
+
+    def report(self):
+        return {
+            'total': len(self.rows),
+            'valid': len(self.valid),
+            'created': self.created,
+            'failed': len(self.errors),
+            'dry_run': self.dry_run,
+            'errors': [
+                {'row': index, 'login_id': self.rows[index - 1].get('login_id'), 'errors': errors}
+                for index, errors in sorted(self.errors.items())
+            ],
+        }
@@ -0,0 +1,155 @@
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class LoginAttemptTracker:
+    """
+    Failed-login counters kept in the shared (Redis) cache.
+
+    Failures are counted per login id and per source IP in fixed TTL windows
+    using atomic increments. Crossing a threshold sets a lock key that is
+    checked before any user lookup or password hash.
+
+    The counters of known users are copied onto their rows for the admin in
+    batches: a failure stores the user's latest state in the cache and
+    appends the user id to a sequence-numbered log, which the periodic
+    ``flush_login_failures`` task drains with one bulk UPDATE. The login
+    path never talks to the Celery broker.
+    """
+
+    key_prefix = 'users:login'
+
+    @property
+    def max_attempts(self):
+        return getattr(settings, 'LOGIN_MAX_FAILED_ATTEMPTS', 5)
+
+    @property
+    def max_attempts_per_ip(self):
+        return getattr(settings, 'LOGIN_MAX_FAILED_ATTEMPTS_PER_IP', 50)
+
+    @property
+    def window(self):
+        return getattr(settings, 'LOGIN_FAILURE_WINDOW', 900)
+
+    @property
+    def lockout_duration(self):
+        return getattr(settings, 'LOGIN_LOCKOUT_DURATION', 1800)
+
+    def _login_key(self, kind, login_id):
+        digest = hashlib.sha1(login_id.strip().lower().encode()).hexdigest()
+        return f'{self.key_prefix}:{kind}:id:{digest}'
+
+    def _ip_key(self, kind, ip):
+        return f'{self.key_prefix}:{kind}:ip:{ip}'
+
+    def _pending_key(self, user_id):
+        return f'{self.key_prefix}:pending:{user_id}'
+
+    def _log_key(self, seq):
+        return f'{self.key_prefix}:pending_log:{seq}'
+
+    @property
+    def seq_key(self):
+        return f'{self.key_prefix}:pending_log:seq'
+
+    @property
+    def floor_key(self):
+        return f'{self.key_prefix}:pending_log:floor'
+
+    @property
+    def pending_ttl(self):
+        # Long enough to survive a few missed flush runs
+        return self.window + self.lockout_duration
+
+    def _incr(self, key):
+        # add() is a SET NX with expiry, so the window starts at the first failure
+        cache.add(key, 0, self.window)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Key expired between add() and incr()
+            cache.set(key, 1, self.window)
+            return 1
+
+    def blocked_until(self, login_id, ip=None):
+        """Return when the login id or source IP is unblocked, or None if it is not blocked"""
+        keys = [self._login_key('lock', login_id)]
+        if ip:
+            keys.append(self._ip_key('lock', ip))
+        values = [v for v in cache.get_many(keys).values() if v]
+        if not values:
+            return None
+        return datetime.fromtimestamp(max(values), tz=dt_timezone.utc)
+
+    def register_failure(self, login_id, ip=None, user=None):
+        """Count a failed attempt; return the lock expiry if a threshold was crossed"""
+        now = timezone.now()
+        locked_until = None
+
+        attempts = self._incr(self._login_key('fail', login_id))
+        if attempts >= self.max_attempts:
+            locked_until = now + timedelta(seconds=self.lockout_duration)
+            cache.set(self._login_key('lock', login_id), locked_until.timestamp(), self.lockout_duration)
+
+        if ip and self._incr(self._ip_key('fail', ip)) >= self.max_attempts_per_ip:
+            ip_locked_until = now + timedelta(seconds=self.window)
+            cache.set(self._ip_key('lock', ip), ip_locked_until.timestamp(), self.window)
+
+        if user is not None:
+            self._flush(user, attempts, locked_until)
+        return locked_until
+
+    def reset(self, login_id, user=None):
+        """Clear the per login id counters (and any unflushed failures) after a successful login"""
+        keys = [self._login_key('fail', login_id), self._login_key('lock', login_id)]
+        if user is not None:
+            keys.append(self._pending_key(user.pk))
+        cache.delete_many(keys)
+
+    def _flush(self, user, attempts, locked_until):
+        """Buffer the user's counters for the next flush_login_failures run"""
+        try:
+            cache.set(
+                self._pending_key(user.pk),
+                (attempts, locked_until.timestamp() if locked_until else None),
+                self.pending_ttl,
+            )
+            cache.add(self.seq_key, 0, None)
+            seq = cache.incr(self.seq_key)
+            cache.set(self._log_key(seq), str(user.pk), self.pending_ttl)
+        except Exception:
+            # The cache counters stay authoritative; only the admin copy lags
+            logger.warning('Could not buffer login failures of user %s', user.pk, exc_info=True)
+
+    def pending_failures(self, batch_size=1000):
+        """
+        Yield ``(user_id, attempts, locked_until)`` for the users logged since
+        the last drain, then advance the log floor past them.
+        """
+        values = cache.get_many([self.seq_key, self.floor_key])
+        seq, floor = values.get(self.seq_key, 0), values.get(self.floor_key, 0)
+        if seq < floor:
+            # The cache was flushed; the log restarted
+            floor = 0
+        for first in range(floor + 1, seq + 1, batch_size):
+            keys = [self._log_key(n) for n in range(first, min(first + batch_size, seq + 1))]
+            user_ids = list(dict.fromkeys(cache.get_many(keys).values()))
+            states = cache.get_many([self._pending_key(user_id) for user_id in user_ids])
+            for user_id in user_ids:
+                state = states.get(self._pending_key(user_id))
+                if state is None:
+                    continue  # Reset by a successful login, or expired
+                attempts, locked_until = state
+                yield user_id, attempts, (
+                    datetime.fromtimestamp(locked_until, tz=dt_timezone.utc) if locked_until else None
+                )
+        cache.set(self.floor_key, seq, None)
+
+login_attempts = LoginAttemptTracker()
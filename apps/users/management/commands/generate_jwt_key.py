@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.users.signing_keys import SigningKey
+
+
+class Command(BaseCommand):
+    help = 'Generate a JWT signing key (PEM) for JWT_SIGNING_KEY_FILES'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write the private key to')
+        parser.add_argument(
+            '--type',
+            choices=['rsa', 'ed25519'],
+            default='rsa',
+            help='Key type: rsa (RS256) or ed25519 (EdDSA)',
+        )
+
+    def handle(self, *args, **options):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+        path = options['path']
+        if os.path.exists(path):
+            raise CommandError(f'{path} already exists.')
+
+        if options['type'] == 'rsa':
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        else:
+            private_key = ed25519.Ed25519PrivateKey.generate()
+        pem = private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        )
+
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pem)
+
+        key = SigningKey(pem)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {key.algorithm} key {key.kid} to {path}'))
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ValidationError
+from apps.users import imports
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create users from a CSV or JSONL file, reporting rejected rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import')
+        parser.add_argument(
+            '--format',
+            dest='file_format',
+            choices=imports.IMPORT_FORMATS,
+            help='File format (default: from the file extension)',
+        )
+        parser.add_argument(
+            '--actor',
+            required=True,
+            help='Login ID of the administrator recorded as assigning the imported roles',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Validate only; create nothing')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or path.rsplit('.', 1)[-1].lower()
+        try:
+            actor = User.objects.get(login_id=options['actor'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with login ID {options['actor']!r}")
+
+        try:
+            with open(path, 'rb') as stream:
+                rows = imports.read_rows(stream, file_format)
+            report = imports.UserImport(
+                rows, actor, dry_run=options['dry_run'], hash_workers=settings.USER_IMPORT_HASH_WORKERS,
+            ).run()
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+        except imports.ImportFileError as e:
+            raise CommandError(str(e))
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+
+        for error in report['errors']:
+            details = '; '.join(
+                f"{field}: {' '.join(str(message) for message in messages)}"
+                for field, messages in error['errors'].items()
+            )
+            self.stderr.write(f"Row {error['row']} ({error['login_id'] or '-'}): {details}")
+        verb = 'Validated' if report['dry_run'] else 'Imported'
+        count = report['valid'] if report['dry_run'] else report['created']
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {count} of {report['total']} rows; {report['failed']} rejected."
+        ))
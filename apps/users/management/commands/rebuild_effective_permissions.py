@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.users.models import User, EffectivePermission
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized effective permissions of every user, repairing drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of users refreshed per transaction',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        total_added = total_removed = 0
+
+        for start in range(0, len(user_ids), batch_size):
+            with transaction.atomic():
+                added, removed = EffectivePermission.objects.refresh_users(user_ids[start:start + batch_size])
+            total_added += added
+            total_removed += removed
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {len(user_ids)} users: {total_added} permissions added, {total_removed} removed.'
+        ))
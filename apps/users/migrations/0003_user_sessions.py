@@ -0,0 +1,59 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:59
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_language_preference_user_timezone'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='access_token',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='refresh_token',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='remember_me',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='token_created_at',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='token_expires_at',
+        ),
+        migrations.CreateModel(
+            name='UserSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('refresh_jti', models.CharField(max_length=64, unique=True)),
+                ('remember_me', models.BooleanField(default=False, help_text='Remember me for lifetime login')),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('user_agent', models.CharField(blank=True, max_length=255)),
+                ('expires_at', models.DateTimeField()),
+                ('last_refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('revoked_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'User Session',
+                'verbose_name_plural': 'User Sessions',
+                'db_table': 'user_sessions',
+                'indexes': [models.Index(fields=['user', 'revoked_at'], name='user_sessions_user_open_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_login_lower_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='token_generation',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped to revoke every issued token'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_effective_permissions(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    UserRole = apps.get_model('users', 'UserRole')
+    EffectivePermission = apps.get_model('users', 'EffectivePermission')
+
+    granted = set()
+    sources = [
+        UserRole.objects.filter(is_active=True).values_list('user_id', 'role__django_group__permissions__codename'),
+        User.groups.through.objects.values_list('user_id', 'group__permissions__codename'),
+        User.user_permissions.through.objects.values_list('user_id', 'permission__codename'),
+    ]
+    for rows in sources:
+        granted.update((user_id, codename) for user_id, codename in rows.iterator() if codename is not None)
+    EffectivePermission.objects.bulk_create(
+        [EffectivePermission(user_id=user_id, codename=codename) for user_id, codename in granted],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_token_generation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectivePermission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codename', models.CharField(max_length=100)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_permissions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Effective Permission',
+                'verbose_name_plural': 'Effective Permissions',
+                'db_table': 'user_effective_permissions',
+                'indexes': [models.Index(fields=['codename'], name='user_eff_perm_codename_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'codename'), name='user_effective_permission_unique')],
+            },
+        ),
+        migrations.RunPython(populate_effective_permissions, migrations.RunPython.noop),
+    ]
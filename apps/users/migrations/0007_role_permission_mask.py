@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:15
+
+from django.db import migrations, models
+
+
+def populate_permission_masks(apps, schema_editor):
+    from apps.users.token_permissions import encode_mask
+
+    Role = apps.get_model('users', 'Role')
+    Group = apps.get_model('auth', 'Group')
+
+    masks = {}
+    for group_id, permission_id in Group.permissions.through.objects.values_list('group_id', 'permission_id'):
+        masks[group_id] = masks.get(group_id, 0) | (1 << permission_id)
+    roles = list(Role.objects.filter(django_group__isnull=False))
+    for role in roles:
+        role.permission_mask = encode_mask(masks.get(role.django_group_id, 0))
+    Role.objects.bulk_update(roles, ['permission_mask'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_effective_permissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='role',
+            name='permission_mask',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_permission_masks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_role_permission_mask'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userrole',
+            index=models.Index(fields=['is_active', 'expires_at'], name='user_roles_active_expiry_idx'),
+        ),
+    ]
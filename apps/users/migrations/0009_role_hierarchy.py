@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_role_hierarchy(apps, schema_editor):
+    """
+    Derive parent links from role_level: each role goes below the first (by
+    name) role that can assign roles at the nearest higher level. Then build
+    the closure.
+    """
+    Role = apps.get_model('users', 'Role')
+    RoleClosure = apps.get_model('users', 'RoleClosure')
+
+    roles = list(Role.objects.order_by('role_level', 'name'))
+    assigners = {}
+    for role in roles:
+        if role.can_assign_roles:
+            assigners.setdefault(role.role_level, role)
+    for role in roles:
+        higher = [level for level in assigners if level < role.role_level]
+        role.parent_id = assigners[max(higher)].pk if higher else None
+    Role.objects.bulk_update(roles, ['parent'], batch_size=500)
+
+    parents = {role.pk: role.parent_id for role in roles}
+    links = []
+    for role_id in parents:
+        ancestor_id, depth = role_id, 0
+        while ancestor_id is not None:
+            links.append(RoleClosure(ancestor_id=ancestor_id, descendant_id=role_id, depth=depth))
+            ancestor_id, depth = parents[ancestor_id], depth + 1
+    RoleClosure.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_user_role_expiry_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='role',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='users.role'),
+        ),
+        migrations.CreateModel(
+            name='RoleClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='users.role')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='users.role')),
+            ],
+            options={
+                'verbose_name': 'Role Hierarchy Link',
+                'verbose_name_plural': 'Role Hierarchy Links',
+                'db_table': 'role_closure',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='role_closure_descendant_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='role_closure_unique')],
+            },
+        ),
+        migrations.RunPython(populate_role_hierarchy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_active_assignments(apps, schema_editor):
+    Role = apps.get_model('users', 'Role')
+    UserRole = apps.get_model('users', 'UserRole')
+
+    active = UserRole.objects.filter(role=OuterRef('pk'), is_active=True).order_by().values('role').annotate(
+        count=Count('pk')
+    ).values('count')
+    Role.objects.update(active_assignments=Coalesce(Subquery(active), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_role_hierarchy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='role',
+            name='active_assignments',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_active_assignments, migrations.RunPython.noop),
+    ]
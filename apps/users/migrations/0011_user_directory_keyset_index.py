@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('common', '0001_initial'),
+        ('users', '0010_role_active_assignments'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-date_joined', '-id'], name='users_date_joined_id_idx'),
+        ),
+    ]
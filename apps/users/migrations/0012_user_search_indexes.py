@@ -0,0 +1,51 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models.functions import Upper
+
+
+def search_indexes():
+    """
+    Indexes behind apps.users.search on PostgreSQL: the tsvector of
+    search_document() and trigram indexes for icontains (UPPER(...) LIKE) on
+    each text field and LIKE on the E.164 mobile.
+    """
+    indexes = [
+        GinIndex(
+            SearchVector('login_id', 'email', 'name', 'employee_id', config='simple'),
+            name='users_search_document_idx',
+        ),
+        GinIndex(fields=['mobile'], opclasses=['gin_trgm_ops'], name='users_mobile_trgm_idx'),
+    ]
+    for field in ('login_id', 'email', 'name', 'employee_id'):
+        indexes.append(GinIndex(OpClass(Upper(field), name='gin_trgm_ops'), name=f'users_{field}_trgm_idx'))
+    return indexes
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    User = apps.get_model('users', 'User')
+    for index in search_indexes():
+        schema_editor.add_index(User, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    User = apps.get_model('users', 'User')
+    for index in search_indexes():
+        schema_editor.remove_index(User, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_user_directory_keyset_index'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
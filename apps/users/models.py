@@ -1,12 +1,30 @@
 import uuid
 import re
-from django.db import models
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from django.db import models, transaction
+from django.db.models import F, Prefetch, Q, prefetch_related_objects
+from django.db.models.functions import Greatest, Lower
 from django.utils import timezone
 from django.contrib.auth.models import AbstractUser, UserManager as DjangoUserManager, Group, Permission
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
+from django.dispatch import Signal
 from phonenumber_field.modelfields import PhoneNumberField
-from apps.common.models import TimestampedModel
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from apps.common.models import TimestampedModel, District, Thana
+from apps.common.utils import get_client_ip
+from .blacklist import token_blacklist
+from .tokens import bump_token_generation
+from .token_permissions import (
+    bump_user_versions, decode_mask, encode_mask, has_all, permission_catalog, user_permission_mask,
+)
+
+
+# Sent once per user, on commit, when the user's effective permissions change
+permissions_changed = Signal()
 
 
 def validate_login_id(value):
@@ -23,6 +41,69 @@ class CustomUserManager(DjangoUserManager):
     """
     Custom user manager to handle user_type and initial role assignment.
     """
+    
+    def for_login(self, identifier):
+        """
+        Active users whose login_id or email matches ``identifier`` case-insensitively.
+        Both comparisons are served by the lower() expression indexes on users.
+        """
+        identifier = identifier.strip().lower()
+        return self.get_queryset().annotate(
+            login_id_lower=Lower('login_id'),
+            email_lower=Lower('email'),
+        ).filter(
+            Q(login_id_lower=identifier) | Q(email_lower=identifier),
+            is_active=True
+        ).select_related('department', 'designation', 'district', 'thana')
+    
+    def get_for_login(self, identifier):
+        """Single-query credential lookup; raises DoesNotExist when nothing (or nothing unambiguous) matches"""
+        candidates = list(self.for_login(identifier)[:2])
+        if len(candidates) > 1:
+            # Case variants of the same login_id: only an exact match is unambiguous
+            candidates = [u for u in candidates if identifier in (u.login_id, u.email)]
+        if len(candidates) != 1:
+            raise self.model.DoesNotExist
+        return candidates[0]
+    
+    def prefetch_login_relations(self, user):
+        """Load everything the login response reads, so serializing it needs no further queries"""
+        prefetch_related_objects(
+            [user],
+            Prefetch('user_roles', queryset=UserRole.objects.select_related('role', 'assigned_by')),
+            Prefetch('district__thanas', queryset=Thana.objects.filter(is_active=True), to_attr='active_thanas'),
+        )
+        return user
+    
+    def prefetch_directory_relations(self, users, relations=None):
+        """
+        Batch-load what UserSerializer reads for a page of users: roles with
+        their assigners, materialized permissions and locations (districts with
+        their active thanas, thanas with their district). The query count does
+        not depend on the number of users. ``relations`` limits the loading to
+        some of 'user_roles', 'effective_permissions', 'district' and 'thana'.
+        """
+        lookups = {
+            'user_roles': Prefetch('user_roles', queryset=UserRole.objects.select_related('role', 'assigned_by')),
+            'effective_permissions': 'effective_permissions',
+            'district': Prefetch('district', queryset=District.objects.prefetch_related(
+                Prefetch('thanas', queryset=Thana.objects.filter(is_active=True), to_attr='active_thanas')
+            )),
+            'thana': Prefetch('thana', queryset=Thana.objects.select_related('district')),
+        }
+        if relations is not None:
+            lookups = {name: lookup for name, lookup in lookups.items() if name in relations}
+        users = list(users)
+        prefetch_related_objects(users, *lookups.values())
+        return users
+    
+    def in_role_subtree(self, role, include_self=True):
+        """Users holding an active role at or below ``role`` in the hierarchy"""
+        return self.filter(
+            user_roles__is_active=True,
+            user_roles__role__in=Role.objects.subtree(role, include_self=include_self).values('pk'),
+        ).distinct()
+    
     def _create_user(self, login_id, email, password, user_type, **extra_fields):
         if not email:
             raise ValueError('The given email must be set')
@@ -147,16 +228,10 @@ class User(AbstractUser, TimestampedModel):
     # Security
     failed_login_attempts = models.PositiveIntegerField(default=0)
     locked_until = models.DateTimeField(blank=True, null=True)
+    token_generation = models.PositiveIntegerField(default=0, help_text="Bumped to revoke every issued token")
     two_factor_enabled = models.BooleanField(default=False)
     two_factor_secret = models.CharField(max_length=32, blank=True, null=True)
     
-    # Token Management for Lifetime Login
-    access_token = models.TextField(blank=True, null=True, help_text="Current access token")
-    refresh_token = models.TextField(blank=True, null=True, help_text="Current refresh token")
-    token_created_at = models.DateTimeField(blank=True, null=True, help_text="Token creation time")
-    token_expires_at = models.DateTimeField(blank=True, null=True, help_text="Token expiration time")
-    remember_me = models.BooleanField(default=False, help_text="Remember me for lifetime login")
-    
     # Profile
     profile_photo = models.ImageField(upload_to='profile_photos/', blank=True, null=True)
     
@@ -185,6 +260,13 @@ class User(AbstractUser, TimestampedModel):
         db_table = 'users'
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            # Case-insensitive credential lookup (CustomUserManager.for_login)
+            models.Index(Lower('login_id'), name='users_login_id_lower_idx'),
+            models.Index(Lower('email'), name='users_email_lower_idx'),
+            # Keyset pagination of the user directory (KeysetPagination on -date_joined, -id)
+            models.Index(fields=['-date_joined', '-id'], name='users_date_joined_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name or self.get_full_name()} ({self.login_id})"
@@ -193,6 +275,10 @@ class User(AbstractUser, TimestampedModel):
         # Ensure username is set to login_id to satisfy AbstractUser requirements
         if not self.username and self.login_id:
             self.username = self.login_id
+        # Keep updated_at (the principal version stamp) moving on partial saves
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'updated_at' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['updated_at']
         super().save(*args, **kwargs)
 
     @property
@@ -201,24 +287,36 @@ class User(AbstractUser, TimestampedModel):
     
     def has_role(self, role_name):
         """Check if user has a specific role"""
+        if 'user_roles' in getattr(self, '_prefetched_objects_cache', {}):
+            return any(
+                user_role.is_active and user_role.role.name == role_name for user_role in self.user_roles.all()
+            )
         return self.user_roles.filter(role__name=role_name, is_active=True).exists()
     
+    def is_role_assigner(self):
+        """Check if user holds an active role that may assign roles (see RoleManager.assignable_by)"""
+        if 'user_roles' in getattr(self, '_prefetched_objects_cache', {}):
+            return any(
+                user_role.is_active and user_role.role.is_active and user_role.role.can_assign_roles
+                for user_role in self.user_roles.all()
+            )
+        return self.user_roles.filter(is_active=True, role__is_active=True, role__can_assign_roles=True).exists()
+    
+    @property
+    def permission_mask(self):
+        """Union permission bitmask of the user, cached in the shared cache"""
+        return user_permission_mask(self)
+    
+    def has_permission(self, *codenames):
+        """Check the user's permission bitmask for every codename"""
+        return has_all(self.permission_mask, codenames)
+    
     def get_all_permissions(self):
         """Get all permissions from assigned roles and Django groups"""
-        permissions = set()
-        
-        # Get permissions from roles
-        for user_role in self.user_roles.filter(is_active=True):
-            permissions.update(user_role.role.get_all_permissions())
-        
-        # Get permissions from Django groups
-        for group in self.groups.all():
-            permissions.update(group.permissions.values_list('codename', flat=True))
-        
-        # Get direct user permissions
-        permissions.update(self.user_permissions.values_list('codename', flat=True))
-        
-        return list(permissions)
+        # Materialized by EffectivePermission; reuse a prefetch when present
+        if 'effective_permissions' in getattr(self, '_prefetched_objects_cache', {}):
+            return [permission.codename for permission in self.effective_permissions.all()]
+        return permission_catalog.codenames_for(self.permission_mask)
     
     def assign_role(self, role, assigned_by, **kwargs):
         """Assign a role to the user"""
@@ -242,30 +340,148 @@ class User(AbstractUser, TimestampedModel):
             user_role.revocation_reason = reason
             user_role.save()
         return user_roles.count()
-    
-    def set_tokens(self, access_token, refresh_token, expires_at=None, remember_me=False):
-        """Set access and refresh tokens for the user"""
-        self.access_token = access_token
-        self.refresh_token = refresh_token
-        self.token_created_at = timezone.now()
-        self.token_expires_at = expires_at
-        self.remember_me = remember_me
-        self.save(update_fields=['access_token', 'refresh_token', 'token_created_at', 'token_expires_at', 'remember_me'])
-    
-    def clear_tokens(self):
-        """Clear user tokens"""
-        self.access_token = None
-        self.refresh_token = None
-        self.token_created_at = None
-        self.token_expires_at = None
-        self.remember_me = False
-        self.save(update_fields=['access_token', 'refresh_token', 'token_created_at', 'token_expires_at', 'remember_me'])
-    
-    def is_token_valid(self):
-        """Check if current token is valid"""
-        if not self.access_token or not self.token_expires_at:
-            return False
-        return timezone.now() < self.token_expires_at
+
+
+class RoleManager(models.Manager):
+    """Manager for roles"""
+
+    def refresh_permission_masks(self, group_ids):
+        """Recompute the stored permission bitmask of the roles backed by the given groups"""
+        group_ids = list(group_ids)
+        masks = dict.fromkeys(group_ids, 0)
+        for group_id, permission_id in Group.permissions.through.objects.filter(
+            group_id__in=group_ids
+        ).values_list('group_id', 'permission_id'):
+            masks[group_id] |= 1 << permission_id
+        roles = list(self.filter(django_group_id__in=group_ids))
+        for role in roles:
+            role.permission_mask = encode_mask(masks[role.django_group_id])
+        self.bulk_update(roles, ['permission_mask'])
+        return roles
+
+    def reserve_assignments(self, role_id, count=1):
+        """
+        Take ``count`` assignment slots of a role with one conditional UPDATE
+        (no COUNT over user_roles). Returns False, changing nothing, when the
+        role's max_assignments would be exceeded.
+        """
+        if count <= 0:
+            return True
+        return bool(self.filter(pk=role_id).filter(
+            Q(max_assignments__isnull=True) | Q(active_assignments__lte=F('max_assignments') - count)
+        ).update(active_assignments=F('active_assignments') + count))
+
+    def release_assignments(self, role_id, count=1):
+        """Give back ``count`` assignment slots of a role"""
+        if count > 0:
+            self.filter(pk=role_id).update(active_assignments=Greatest(F('active_assignments') - count, 0))
+
+    def release_assignment_slots(self, role_ids):
+        """Give back one slot per role id in ``role_ids``, one UPDATE per role"""
+        for role_id, count in Counter(role_ids).items():
+            self.release_assignments(role_id, count)
+
+    def reconcile_assignment_counts(self):
+        """
+        Reset each role's active_assignments from user_roles, repairing drift.
+        Roles are recounted one at a time under their row lock, which every
+        slot reservation and release also takes: an in-flight assignment is
+        counted once it commits, never half-way. Slots a running bulk
+        assignment reserved but has not filled yet are not rows, so a run
+        during one undercounts until the next run. Returns the roles corrected.
+        """
+        corrected = 0
+        for role_id in self.values_list('pk', flat=True):
+            with transaction.atomic():
+                if not list(self.select_for_update().filter(pk=role_id).values_list('pk', flat=True)):
+                    continue
+                active = UserRole.objects.filter(role_id=role_id, is_active=True).count()
+                corrected += self.filter(pk=role_id).exclude(active_assignments=active).update(
+                    active_assignments=active
+                )
+        return corrected
+
+    def capacity_error(self, role_id, requested=1):
+        role = self.filter(pk=role_id).values('display_name', 'max_assignments', 'active_assignments').first()
+        if role is None:
+            return ValidationError('Role not found.')
+        available = max(role['max_assignments'] - role['active_assignments'], 0)
+        return ValidationError(
+            f"Role \"{role['display_name']}\" allows {role['max_assignments']} active assignments; "
+            f"{available} available, {requested} requested."
+        )
+
+    def subtree(self, role, include_self=True):
+        """Roles at or below ``role`` in the hierarchy (one closure join)"""
+        queryset = self.filter(ancestor_links__ancestor=role)
+        return queryset if include_self else queryset.filter(ancestor_links__depth__gt=0)
+
+    def ancestors(self, role, include_self=True):
+        """Roles above ``role`` in the hierarchy, nearest first"""
+        queryset = self.filter(descendant_links__descendant=role)
+        if not include_self:
+            queryset = queryset.filter(descendant_links__depth__gt=0)
+        return queryset.order_by('descendant_links__depth')
+
+    def assignable_by(self, user):
+        """
+        Active roles ``user`` may assign: every role for superusers and super
+        admins, otherwise the roles strictly below the user's active roles
+        that have ``can_assign_roles``. Admins may also assign every
+        non-system role, as they could before the hierarchy existed; system
+        roles need a super admin or an assigner role above them.
+        """
+        queryset = self.filter(is_active=True)
+        if user.is_superuser or user.user_type == 'super_admin':
+            return queryset
+        assigner_roles = UserRole.objects.filter(
+            user=user, is_active=True, role__is_active=True, role__can_assign_roles=True
+        ).values('role_id')
+        below = RoleClosure.objects.filter(ancestor__in=assigner_roles, depth__gt=0).values('descendant_id')
+        if user.user_type == 'admin':
+            return queryset.filter(Q(is_system_role=False) | Q(pk__in=below))
+        return queryset.filter(pk__in=below)
+
+    def attach(self, role):
+        """Add the closure rows of a new role under its parent"""
+        links = [RoleClosure(ancestor=role, descendant=role, depth=0)]
+        if role.parent_id:
+            links += [
+                RoleClosure(ancestor_id=ancestor_id, descendant=role, depth=depth + 1)
+                for ancestor_id, depth in RoleClosure.objects.filter(
+                    descendant_id=role.parent_id
+                ).values_list('ancestor_id', 'depth')
+            ]
+        RoleClosure.objects.bulk_create(links)
+
+    def move(self, role):
+        """Re-link the subtree of ``role`` under its new parent"""
+        subtree = dict(RoleClosure.objects.filter(ancestor=role).values_list('descendant_id', 'depth'))
+        if role.parent_id in subtree:
+            raise ValidationError('A role cannot be placed below itself or one of its descendants.')
+        RoleClosure.objects.filter(descendant_id__in=subtree).exclude(ancestor_id__in=subtree).delete()
+        if role.parent_id:
+            ancestors = RoleClosure.objects.filter(descendant_id=role.parent_id).values_list('ancestor_id', 'depth')
+            RoleClosure.objects.bulk_create([
+                RoleClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + 1 + down)
+                for ancestor_id, up in ancestors
+                for descendant_id, down in subtree.items()
+            ])
+
+    def rebuild_closure(self):
+        """Recompute the closure table from the parent links"""
+        parents = dict(self.values_list('pk', 'parent_id'))
+        links = []
+        for role_id in parents:
+            ancestor_id, depth, seen = role_id, 0, set()
+            while ancestor_id is not None and ancestor_id not in seen:
+                seen.add(ancestor_id)
+                links.append(RoleClosure(ancestor_id=ancestor_id, descendant_id=role_id, depth=depth))
+                ancestor_id, depth = parents.get(ancestor_id), depth + 1
+        with transaction.atomic():
+            RoleClosure.objects.all().delete()
+            RoleClosure.objects.bulk_create(links, batch_size=1000)
+        return len(links)
 
 
 class Role(TimestampedModel):
@@ -288,8 +504,18 @@ class Role(TimestampedModel):
     is_system_role = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
     max_assignments = models.PositiveIntegerField(blank=True, null=True)
+    # Active UserRole rows, kept by conditional UPDATEs (RoleManager.reserve_assignments)
+    active_assignments = models.PositiveIntegerField(default=0, editable=False)
     role_level = models.PositiveIntegerField(default=1)  # 1=Super Admin, 2=Admin, etc.
     can_assign_roles = models.BooleanField(default=False)
+    # Hierarchy; RoleClosure holds its transitive closure
+    parent = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='children'
+    )
+    # Permissions of django_group as a bitmask (bit n = auth_permission id n), kept by signals
+    permission_mask = models.TextField(blank=True, default='', editable=False)
+    
+    objects = RoleManager()
     
     class Meta:
         db_table = 'roles'
@@ -300,17 +526,46 @@ class Role(TimestampedModel):
         return self.display_name
     
     def save(self, *args, **kwargs):
-        """Auto-create Django Group when Role is created"""
+        """Auto-create Django Group when Role is created, and keep the hierarchy closure"""
         if not self.django_group:
             group, created = Group.objects.get_or_create(name=self.name)
             self.django_group = group
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            if self._state.adding:
+                super().save(*args, **kwargs)
+                Role.objects.attach(self)
+            elif update_fields is not None and 'parent' not in update_fields:
+                super().save(*args, **kwargs)
+            else:
+                old_parent_id = Role.objects.filter(pk=self.pk).values_list('parent_id', flat=True).first()
+                super().save(*args, **kwargs)
+                if old_parent_id != self.parent_id:
+                    Role.objects.move(self)
+    
+    def delete(self, *args, **kwargs):
+        """Splice the role out of the hierarchy: its children move to its parent"""
+        with transaction.atomic():
+            for child in self.children.all():
+                child.parent_id = self.parent_id
+                child.save(update_fields=['parent'])
+            return super().delete(*args, **kwargs)
+    
+    def clean(self):
+        if self.parent_id and self.pk and Role.objects.subtree(self).filter(pk=self.parent_id).exists():
+            raise ValidationError({'parent': 'A role cannot be placed below itself or one of its descendants.'})
+    
+    @property
+    def permission_bits(self):
+        return decode_mask(self.permission_mask)
+    
+    def has_permission(self, codename):
+        """Check the role's permission bitmask for a codename"""
+        return bool(self.permission_bits & permission_catalog.bits_for(codename))
     
     def get_all_permissions(self):
         """Get all permissions assigned to this role"""
-        if self.django_group:
-            return list(self.django_group.permissions.values_list('codename', flat=True))
-        return []
+        return permission_catalog.codenames_for(self.permission_bits)
     
     def add_permission(self, permission):
         """Add a permission to this role"""
@@ -328,6 +583,148 @@ class Role(TimestampedModel):
             self.django_group.permissions.set(permissions)
 
 
+class RoleClosure(models.Model):
+    """Transitive closure of the role hierarchy: one row per (ancestor, descendant) pair, self included"""
+
+    ancestor = models.ForeignKey(Role, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Role, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        db_table = 'role_closure'
+        verbose_name = 'Role Hierarchy Link'
+        verbose_name_plural = 'Role Hierarchy Links'
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='role_closure_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='role_closure_descendant_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.ancestor_id} > {self.descendant_id} ({self.depth})'
+
+
+class UserRoleManager(models.Manager):
+    """Manager for role assignments"""
+
+    _local = threading.local()
+
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Collect the assignment changes made inside the block and sync group
+        membership once when it exits: the touched (user, group) pairs are
+        diffed against the users_groups table and only the missing or surplus
+        rows are written, inside one transaction with one permission refresh.
+        Nested blocks join the outermost one.
+        """
+        if getattr(self._local, 'pending', None) is not None:
+            yield
+            return
+        with transaction.atomic(), EffectivePermission.objects.deferred():
+            self._local.pending = set()
+            try:
+                yield
+                pairs = self._local.pending
+            finally:
+                self._local.pending = None
+            self.sync_group_memberships(pairs)
+
+    def touch(self, user_id, group_id):
+        """Mark a (user, group) membership for syncing by the enclosing unit of work"""
+        if group_id is not None:
+            self._local.pending.add((user_id, group_id))
+
+    def sync_group_memberships(self, pairs):
+        """
+        Make users_groups hold exactly the given (user, group) pairs that are
+        backed by an active assignment. Returns (added, removed) row counts.
+        """
+        pairs = set(pairs)
+        if not pairs:
+            return 0, 0
+        user_ids = {user_id for user_id, _ in pairs}
+        group_ids = {group_id for _, group_id in pairs}
+        desired = pairs & set(
+            self.filter(user_id__in=user_ids, role__django_group_id__in=group_ids, is_active=True).values_list(
+                'user_id', 'role__django_group_id'
+            )
+        )
+        actual = pairs & set(
+            User.groups.through.objects.filter(user_id__in=user_ids, group_id__in=group_ids).values_list(
+                'user_id', 'group_id'
+            )
+        )
+        missing, surplus = desired - actual, actual - desired
+        if missing:
+            User.groups.through.objects.bulk_create(
+                [User.groups.through(user_id=user_id, group_id=group_id) for user_id, group_id in missing],
+                ignore_conflicts=True,
+            )
+        removed = self.remove_group_memberships(surplus)
+        # The through table writes bypass m2m signals
+        EffectivePermission.objects.schedule({user_id for user_id, _ in missing | surplus}, membership_changed=True)
+        return len(missing), removed
+
+    def remove_group_memberships(self, pairs):
+        """Delete (user_id, group_id) rows from the users_groups table in one statement"""
+        by_group = {}
+        for user_id, group_id in pairs:
+            if group_id is not None:
+                by_group.setdefault(group_id, set()).add(user_id)
+        if not by_group:
+            return 0
+        condition = Q()
+        for group_id, user_ids in by_group.items():
+            condition |= Q(group_id=group_id, user_id__in=user_ids)
+        deleted, _ = User.groups.through.objects.filter(condition).delete()
+        return deleted
+
+    def expire_due(self, now=None, batch_size=500):
+        """
+        Deactivate assignments whose ``expires_at`` has passed, ``batch_size``
+        rows per transaction: one UPDATE for the assignments, one DELETE for
+        their group memberships and a permission refresh of only the affected
+        users. Returns sweep statistics.
+        """
+        now = now or timezone.now()
+        started = time.monotonic()
+        expired = batches = 0
+        max_lag = 0.0
+        while True:
+            with transaction.atomic():
+                due = list(
+                    self.select_for_update(skip_locked=True, of=('self',))
+                    .filter(is_active=True, expires_at__lte=now)
+                    .order_by('expires_at')
+                    .values_list('pk', 'user_id', 'role_id', 'role__django_group_id', 'expires_at')[:batch_size]
+                )
+                if not due:
+                    break
+                self.filter(pk__in=[row[0] for row in due]).update(
+                    is_active=False, revoked_at=now, revocation_reason='Expired', updated_at=now
+                )
+                Role.objects.release_assignment_slots(role_id for _, _, role_id, _, _ in due)
+                self.remove_group_memberships((user_id, group_id) for _, user_id, _, group_id, _ in due)
+                expired_users = {row[1] for row in due}
+                EffectivePermission.objects.refresh_users(expired_users, membership_changed=expired_users)
+            expired += len(due)
+            batches += 1
+            max_lag = max(max_lag, (now - due[0][4]).total_seconds())
+            if len(due) < batch_size:
+                break
+        duration = time.monotonic() - started
+        return {
+            'swept_at': now.isoformat(),
+            'expired': expired,
+            'batches': batches,
+            'duration_seconds': round(duration, 3),
+            'rows_per_second': round(expired / duration, 1) if duration else 0.0,
+            'max_lag_seconds': round(max_lag, 3),
+        }
+
+
 class UserRole(TimestampedModel):
     """User role assignments with scope and integration with Django Groups."""
     
@@ -349,28 +746,300 @@ class UserRole(TimestampedModel):
     revoked_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='role_revocations_made')
     revoked_at = models.DateTimeField(blank=True, null=True)
     
+    objects = UserRoleManager()
+    
     class Meta:
         db_table = 'user_roles'
         unique_together = ['user', 'role']  # Simplified for now
         verbose_name = 'User Role Assignment'
         verbose_name_plural = 'User Role Assignments'
+        indexes = [
+            # Expiry sweeper (UserRoleManager.expire_due)
+            models.Index(fields=['is_active', 'expires_at'], name='user_roles_active_expiry_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.full_name} - {self.role.display_name}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = (instance.__dict__.get('role_id'), instance.__dict__.get('is_active'))
+        return instance
+    
+    def _previous_state(self):
+        """(role_id, is_active) as stored, before this save"""
+        if self._state.adding:
+            return None, False
+        state = getattr(self, '_loaded_state', (None, None))
+        if None in state:
+            state = UserRole.objects.filter(pk=self.pk).values_list('role_id', 'is_active').first() or (None, False)
+        return state
+    
+    def clean(self):
+        # Early check for forms; save() enforces the limit atomically
+        old_role_id, was_active = self._previous_state()
+        if self.is_active and (not was_active or old_role_id != self.role_id) and self.role_id:
+            role = self.role
+            if role.max_assignments is not None and role.active_assignments >= role.max_assignments:
+                raise ValidationError({'role': Role.objects.capacity_error(self.role_id).messages})
+    
     def save(self, *args, **kwargs):
-        """Auto-assign user to Django Group when role is assigned"""
-        super().save(*args, **kwargs)
-        if self.is_active and self.role.django_group:
-            self.user.groups.add(self.role.django_group)
-        elif not self.is_active and self.role.django_group:
-            self.user.groups.remove(self.role.django_group)
+        """Sync the user's membership of the role's Django Group (see UserRoleManager.unit_of_work)"""
+        with UserRole.objects.unit_of_work():
+            # Keep Role.active_assignments in step; over max_assignments raises ValidationError
+            old_role_id, was_active = self._previous_state()
+            moved = old_role_id != self.role_id
+            if self.is_active and (not was_active or moved):
+                if not Role.objects.reserve_assignments(self.role_id):
+                    raise Role.objects.capacity_error(self.role_id)
+            if was_active and (not self.is_active or moved):
+                Role.objects.release_assignments(old_role_id)
+            super().save(*args, **kwargs)
+            self._loaded_state = (self.role_id, self.is_active)
+            UserRole.objects.touch(self.user_id, self.role.django_group_id)
     
     def delete(self, *args, **kwargs):
         """Remove user from Django Group when role assignment is deleted"""
-        if self.role.django_group:
-            self.user.groups.remove(self.role.django_group)
-        super().delete(*args, **kwargs)
+        with UserRole.objects.unit_of_work():
+            UserRole.objects.touch(self.user_id, self.role.django_group_id)
+            return super().delete(*args, **kwargs)
+
+
+class UserSessionManager(models.Manager):
+    """Manager for per-device login sessions"""
+
+    def active(self):
+        return self.filter(revoked_at__isnull=True, expires_at__gt=timezone.now())
+
+    def open(self, user, refresh, session_id, request=None, remember_me=False):
+        """Create the session backing a freshly issued refresh token"""
+        meta = request.META if request is not None else {}
+        return self.create(
+            id=session_id,
+            user=user,
+            refresh_jti=refresh['jti'],
+            remember_me=remember_me,
+            ip_address=get_client_ip(request),
+            user_agent=meta.get('HTTP_USER_AGENT', '')[:255],
+            expires_at=datetime_from_epoch(refresh['exp']),
+        )
+
+    def rotate(self, session, old_jti, refresh):
+        """
+        Swap the session onto a new refresh token. The update is conditional on
+        the old jti, so a replayed or concurrently rotated token matches nothing.
+        """
+        now = timezone.now()
+        return self.filter(pk=session.pk, refresh_jti=old_jti, revoked_at__isnull=True).update(
+            refresh_jti=refresh['jti'],
+            expires_at=datetime_from_epoch(refresh['exp']),
+            last_refreshed_at=now,
+            updated_at=now,
+        )
+
+    def _revoke(self, queryset):
+        """Revoke the sessions in ``queryset`` and blacklist their outstanding tokens"""
+        sessions = list(queryset.values_list('pk', 'expires_at'))
+        if not sessions:
+            return 0
+        now = timezone.now()
+        revoked = self.filter(
+            pk__in=[pk for pk, _ in sessions], revoked_at__isnull=True
+        ).update(revoked_at=now, updated_at=now)
+        # Access tokens of the session stay valid until they expire unless blacklisted
+        for pk, expires_at in sessions:
+            token_blacklist.revoke(pk, expires_at)
+        return revoked
+
+    def revoke(self, user, session_id=None, refresh_jti=None):
+        """Revoke one session of the user, by id or by its current refresh jti"""
+        queryset = self.filter(user=user, revoked_at__isnull=True)
+        if refresh_jti is not None:
+            queryset = queryset.filter(refresh_jti=refresh_jti)
+        else:
+            queryset = queryset.filter(pk=session_id)
+        return self._revoke(queryset)
+
+    def revoke_all(self, user):
+        """
+        Revoke every open session of the user. Bumping the token generation
+        invalidates all outstanding tokens at once, so the sessions are only
+        marked revoked.
+        """
+        bump_token_generation(user.pk)
+        now = timezone.now()
+        return self.filter(user=user, revoked_at__isnull=True).update(revoked_at=now, updated_at=now)
+
+    def purgeable(self, retention):
+        """Sessions expired or revoked more than ``retention`` ago"""
+        cutoff = timezone.now() - retention
+        return self.filter(Q(expires_at__lt=cutoff) | Q(revoked_at__lt=cutoff))
+
+
+class UserSession(TimestampedModel):
+    """Login session of one device, identified by the jti of its current refresh token."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sessions')
+    refresh_jti = models.CharField(max_length=64, unique=True)
+    remember_me = models.BooleanField(default=False, help_text="Remember me for lifetime login")
+    ip_address = models.GenericIPAddressField(blank=True, null=True)
+    user_agent = models.CharField(max_length=255, blank=True)
+    expires_at = models.DateTimeField()
+    last_refreshed_at = models.DateTimeField(blank=True, null=True)
+    revoked_at = models.DateTimeField(blank=True, null=True)
+
+    objects = UserSessionManager()
+
+    class Meta:
+        db_table = 'user_sessions'
+        verbose_name = 'User Session'
+        verbose_name_plural = 'User Sessions'
+        indexes = [
+            models.Index(fields=['user', 'revoked_at'], name='user_sessions_user_open_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.login_id} - {self.created_at:%Y-%m-%d %H:%M}"
+
+    @property
+    def is_active(self):
+        return self.revoked_at is None and self.expires_at > timezone.now()
+
+
+class EffectivePermissionManager(models.Manager):
+    """Maintains the materialized (user, codename) permission table"""
+
+    _local = threading.local()
+
+    def schedule(self, user_ids, membership_changed=False):
+        """
+        Refresh the users now, or when the enclosing ``deferred()`` block
+        exits. ``membership_changed`` marks users whose groups changed: their
+        cached masks are keyed on their group list, so they are invalidated
+        even when their permissions stay the same.
+        """
+        user_ids = set(user_ids)
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            pending[0].update(user_ids)
+            if membership_changed:
+                pending[1].update(user_ids)
+        else:
+            self.refresh_users(user_ids, membership_changed=user_ids if membership_changed else ())
+
+    @contextmanager
+    def deferred(self):
+        """Coalesce the refreshes scheduled inside the block into one"""
+        if getattr(self._local, 'pending', None) is not None:
+            yield
+            return
+        self._local.pending = (set(), set())
+        try:
+            yield
+            user_ids, membership_changed = self._local.pending
+        finally:
+            self._local.pending = None
+        self.refresh_users(user_ids, membership_changed=membership_changed)
+
+    def compute(self, user_ids):
+        """Map each user id to the codenames granted by roles, groups and direct permissions"""
+        user_ids = list(user_ids)
+        granted = {user_id: set() for user_id in user_ids}
+        sources = [
+            UserRole.objects.filter(user_id__in=user_ids, is_active=True).values_list(
+                'user_id', 'role__django_group__permissions__codename'
+            ),
+            User.groups.through.objects.filter(user_id__in=user_ids).values_list(
+                'user_id', 'group__permissions__codename'
+            ),
+            User.user_permissions.through.objects.filter(user_id__in=user_ids).values_list(
+                'user_id', 'permission__codename'
+            ),
+        ]
+        for rows in sources:
+            for user_id, codename in rows:
+                if codename is not None:
+                    granted[user_id].add(codename)
+        return granted
+
+    def refresh_users(self, user_ids, membership_changed=(), bump=True):
+        """
+        Bring the rows of the given users in line with their current grants,
+        touching only rows that changed. Returns (added, removed) row counts.
+        The cached masks of users whose rows changed, or who are listed in
+        ``membership_changed``, are invalidated unless ``bump`` is False (the
+        change was already versioned, e.g. by bump_group_versions).
+        """
+        user_ids = set(user_ids)
+        if not user_ids:
+            return 0, 0
+        granted = self.compute(user_ids)
+        stale, existing, changed = [], set(), set()
+        for pk, user_id, codename in self.filter(user_id__in=user_ids).values_list('pk', 'user_id', 'codename'):
+            if codename in granted[user_id]:
+                existing.add((user_id, codename))
+            else:
+                stale.append(pk)
+                changed.add(user_id)
+        missing = [
+            self.model(user_id=user_id, codename=codename)
+            for user_id, codenames in granted.items()
+            for codename in codenames
+            if (user_id, codename) not in existing
+        ]
+        changed.update(permission.user_id for permission in missing)
+        if stale:
+            self.filter(pk__in=stale).delete()
+        if missing:
+            self.bulk_create(missing, ignore_conflicts=True)
+        stale_masks = changed | (user_ids & set(membership_changed))
+        if bump and stale_masks:
+            # Cached masks and token snapshots of these users are now stale
+            bump_user_versions(stale_masks)
+        if changed:
+            transaction.on_commit(lambda: self._send_changed(changed))
+        return len(missing), len(stale)
+
+    def _send_changed(self, user_ids):
+        for user_id in user_ids:
+            permissions_changed.send(sender=User, user_id=user_id)
+
+    def users_of_groups(self, group_ids, limit=None):
+        """Ids of users whose grants depend on the given groups; with ``limit``, at most ``limit`` + 1 ids"""
+        group_ids = list(group_ids)
+        members = User.groups.through.objects.filter(group_id__in=group_ids).values_list('user_id', flat=True)
+        holders = UserRole.objects.filter(role__django_group_id__in=group_ids).values_list('user_id', flat=True)
+        if limit is not None:
+            members, holders = members.distinct()[:limit + 1], holders.distinct()[:limit + 1]
+        return set(members) | set(holders)
+
+
+class EffectivePermission(models.Model):
+    """
+    Materialized permission codenames of each user, the union of their active
+    roles, groups and direct permissions. Kept current by signals (see
+    signals.py); ``manage.py rebuild_effective_permissions`` repairs drift.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='effective_permissions')
+    codename = models.CharField(max_length=100)
+
+    objects = EffectivePermissionManager()
+
+    class Meta:
+        db_table = 'user_effective_permissions'
+        verbose_name = 'Effective Permission'
+        verbose_name_plural = 'Effective Permissions'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'codename'], name='user_effective_permission_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['codename'], name='user_eff_perm_codename_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.codename}"
 
 
 class PermissionCategory(TimestampedModel):
@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from .policies import ADMINS, PolicyPermission, allows
 
 
 class IsSuperAdminOrAdmin(permissions.BasePermission):
@@ -10,9 +11,27 @@ class IsSuperAdminOrAdmin(permissions.BasePermission):
         """
         Check if the user has permission to perform the action.
         """
-        # Check if user is authenticated
-        if not request.user or not request.user.is_authenticated:
-            return False
-
         # Allow super admin and admin user types
-        return request.user.user_type in ['super_admin', 'admin']
+        return allows(request, ADMINS)
+
+
+class HasTokenPermissions(PolicyPermission):
+    """
+    Check ``view.required_permissions`` against the permission snapshot in the
+    access token, without touching the database.
+
+    ``required_permissions`` is a list of codenames, or a dict mapping HTTP
+    methods to lists. It is compiled like a ``policy`` (see policies.py).
+    Requests without a snapshot fall back to the user's cached permission
+    bitmask.
+    """
+
+
+def model_permissions(model_name):
+    """``required_permissions`` of a model's endpoints: Django's add/change/delete codenames for writes"""
+    return {
+        'POST': [f'add_{model_name}'],
+        'PUT': [f'change_{model_name}'],
+        'PATCH': [f'change_{model_name}'],
+        'DELETE': [f'delete_{model_name}'],
+    }
@@ -0,0 +1,268 @@
+"""
+Declarative access policies for DRF views.
+
+A view declares who may call it with a ``policy`` attribute: one Policy for
+every method, or a dict mapping HTTP methods (``'*'`` for the rest) to
+policies::
+
+    class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
+        permission_classes = [PolicyPermission]
+        policy = {'GET': AUTHENTICATED, '*': ADMINS}
+
+Policies are compiled per view class and method into lookup tables when the
+URLconf is loaded (``policy_registry.compile(urlpatterns)``). A request
+evaluates them against its memoized principal, and decisions are cached on
+the request, so repeated checks (``allows(request, ADMINS)`` in serializers)
+cost a dict lookup. ``policy_registry.matrix()`` exports the full policy
+matrix for audit (``manage.py export_policy_matrix``).
+"""
+from rest_framework import permissions
+from rest_framework.exceptions import PermissionDenied
+from .token_permissions import permission_catalog, token_permissions
+
+
+class Policy:
+    """
+    Access rule of a view or method. Every given condition must hold:
+    authentication, staff status, one of ``user_types`` and every permission
+    codename in ``permissions``. Superusers pass unless ``allow_superuser``
+    is False. ``message`` is the detail of the 403 response.
+    """
+
+    def __init__(self, permissions=(), user_types=None, staff=False, authenticated=True,
+                 allow_superuser=True, name=None, message=None):
+        self.permissions = tuple(permissions)
+        self.user_types = frozenset(user_types) if user_types is not None else None
+        self.staff = staff
+        self.authenticated = authenticated or staff or bool(permissions) or user_types is not None
+        self.allow_superuser = allow_superuser
+        self.name = name
+        self.message = message
+        self._bits = None
+        self._bits_version = None
+
+    def __repr__(self):
+        return f'<Policy {self.name or self.describe()}>'
+
+    def describe(self):
+        return {
+            'policy': self.name,
+            'authenticated': self.authenticated,
+            'staff': self.staff,
+            'user_types': sorted(self.user_types) if self.user_types is not None else None,
+            'permissions': list(self.permissions),
+            'allow_superuser': self.allow_superuser,
+            'message': self.message,
+            'any_of': None,
+        }
+
+    def permission_bits(self):
+        """Bits of each required codename, recompiled when the permission catalog changes"""
+        version = permission_catalog.version
+        if self._bits is None or self._bits_version != version:
+            self._bits = tuple(permission_catalog.bits_for(codename) for codename in self.permissions)
+            self._bits_version = version
+        return self._bits
+
+    def evaluate(self, principal):
+        user = principal.user
+        if not self.authenticated:
+            return True
+        if not user or not user.is_authenticated:
+            return False
+        if self.allow_superuser and user.is_superuser:
+            return True
+        if self.staff and not user.is_staff:
+            return False
+        if self.user_types is not None and user.user_type not in self.user_types:
+            return False
+        if self.permissions:
+            mask = principal.permission_mask
+            return all(mask & bits for bits in self.permission_bits())
+        return True
+
+
+class AnyPolicy(Policy):
+    """Passes when any of ``policies`` passes"""
+
+    def __init__(self, *policies, name=None, message=None):
+        super().__init__(authenticated=False, name=name, message=message)
+        self.policies = policies
+        self.authenticated = all(policy.authenticated for policy in policies)
+
+    def describe(self):
+        return {
+            **super().describe(),
+            'allow_superuser': any(policy.allow_superuser for policy in self.policies),
+            'any_of': [policy.describe() for policy in self.policies],
+        }
+
+    def evaluate(self, principal):
+        return any(policy.evaluate(principal) for policy in self.policies)
+
+
+class AssignerRolePolicy(Policy):
+    """Holders of an active role with ``can_assign_roles`` (and superusers)"""
+
+    def evaluate(self, principal):
+        if not super().evaluate(principal):
+            return False
+        user = principal.user
+        return user.is_superuser or user.is_role_assigner()
+
+
+ALLOW_ANY = Policy(authenticated=False, name='allow_any')
+AUTHENTICATED = Policy(name='authenticated')
+ADMINS = Policy(user_types=('super_admin', 'admin'), allow_superuser=False, name='admins')
+STAFF = Policy(staff=True, name='staff')
+ROLE_ASSIGNERS = AnyPolicy(
+    ADMINS, AssignerRolePolicy(name='assigner_role_holders'),
+    name='role_assigners', message='You are not allowed to assign roles.',
+)
+
+
+class Principal:
+    """The request's user with a lazily loaded permission mask"""
+
+    def __init__(self, request):
+        self.request = request
+        self.user = getattr(request, 'user', None)
+        self.decisions = {}
+        self._mask = None
+
+    @property
+    def permission_mask(self):
+        if self._mask is None:
+            # The token snapshot when it is current, else the user's cached bitmask
+            snapshot = token_permissions(self.request)
+            self._mask = snapshot.mask if snapshot is not None else self.user.permission_mask
+        return self._mask
+
+
+def principal_for(request):
+    """The memoized Principal of a request"""
+    principal = getattr(request, '_policy_principal', None)
+    if principal is None or principal.user is not getattr(request, 'user', None):
+        principal = Principal(request)
+        request._policy_principal = principal
+    return principal
+
+
+def allows(request, policy):
+    """Evaluate ``policy`` for the request, once per request"""
+    principal = principal_for(request)
+    decision = principal.decisions.get(policy)
+    if decision is None:
+        decision = principal.decisions[policy] = policy.evaluate(principal)
+    return decision
+
+
+def require(request, policy, message=None):
+    """Raise PermissionDenied unless ``policy`` allows the request"""
+    if not allows(request, policy):
+        raise PermissionDenied(detail=message or policy.message)
+
+
+def admins_or(required_permissions):
+    """
+    Policy table of a ``required_permissions`` dict: each listed method is
+    granted to ADMINS or to holders of its codenames; other methods only
+    require authentication.
+    """
+    table = {'*': AUTHENTICATED}
+    for method, codenames in required_permissions.items():
+        table[method] = AnyPolicy(ADMINS, Policy(permissions=codenames), name=f"admins_or_{'_'.join(codenames)}")
+    return table
+
+
+def view_policy(policy):
+    """Attach ``policy`` to an ``@api_view`` function view (apply above ``@api_view``)"""
+    def decorator(view):
+        view.cls.policy = policy
+        return view
+    return decorator
+
+
+def _as_policy(value):
+    if isinstance(value, Policy):
+        return value
+    # A list of codenames, as in ``required_permissions``
+    return Policy(permissions=value)
+
+
+class PolicyRegistry:
+    """Compiled (view class, method) -> Policy lookup tables"""
+
+    methods = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS')
+
+    def __init__(self):
+        self._tables = {}
+        self._routes = []
+
+    def compile_view(self, view_class):
+        """Method -> Policy table of a view class, from its ``policy`` or ``required_permissions``"""
+        table = self._tables.get(view_class)
+        if table is not None:
+            return table
+        declared = getattr(view_class, 'policy', None)
+        if declared is None:
+            declared = getattr(view_class, 'required_permissions', None)
+        if declared is None:
+            table = {}
+        elif isinstance(declared, dict):
+            default = declared.get('*')
+            table = {}
+            for method in self.methods:
+                value = declared.get(method, default)
+                if value is not None:
+                    table[method] = _as_policy(value)
+        else:
+            policy = _as_policy(declared)
+            table = {method: policy for method in self.methods}
+        self._tables[view_class] = table
+        return table
+
+    def policy_for(self, view_class, method):
+        return self.compile_view(view_class).get(method)
+
+    def compile(self, urlpatterns, prefix=''):
+        """Compile the policies of every class-based view routed by ``urlpatterns``"""
+        for pattern in urlpatterns:
+            route = prefix + str(pattern.pattern)
+            if hasattr(pattern, 'url_patterns'):
+                self.compile(pattern.url_patterns, route)
+                continue
+            view_class = getattr(pattern.callback, 'cls', None) or getattr(pattern.callback, 'view_class', None)
+            if view_class is not None and self.compile_view(view_class):
+                self._routes.append((route, pattern.name, view_class))
+
+    def matrix(self):
+        """One row per routed view and handled method with a policy"""
+        rows = []
+        for route, name, view_class in self._routes:
+            for method, policy in self.compile_view(view_class).items():
+                if not hasattr(view_class, method.lower()):
+                    continue
+                rows.append({
+                    'route': route,
+                    'name': name,
+                    'view': f'{view_class.__module__}.{view_class.__name__}',
+                    'method': method,
+                    **policy.describe(),
+                })
+        return rows
+
+
+policy_registry = PolicyRegistry()
+
+
+class PolicyPermission(permissions.BasePermission):
+    """Enforce the view's compiled policy; views without one only require authentication"""
+
+    def has_permission(self, request, view):
+        policy = policy_registry.policy_for(type(view), request.method) or AUTHENTICATED
+        if allows(request, policy):
+            return True
+        if policy.message:
+            self.message = policy.message
+        return False
@@ -0,0 +1,138 @@
+"""
+Cached snapshot of the RBAC catalog: roles, groups, permissions, permission
+categories and custom permissions, with grants as ids.
+
+The catalog changes rarely (admin edits) but is read by every admin screen.
+A snapshot is built in a fixed number of queries and stored in the shared
+cache under a version counter that is bumped when a catalog change commits.
+Each process keeps the last snapshot it read and reuses it while the shared
+(version, ETag) pair still names it; versions restart after a cache flush,
+the ETag digest tells the snapshots apart. Live counters (a role's active
+assignments) are not part of the snapshot.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import Role, PermissionCategory, CustomPermission
+from .token_permissions import bump_now_and_on_commit, incr_version
+
+
+RBAC_CATALOG_VERSION_KEY = 'users:rbac_catalog:version'
+RBAC_CATALOG_KEY = 'users:rbac_catalog:{}'
+# (version, etag) of the snapshot stored for the current version
+RBAC_CATALOG_CURRENT_KEY = 'users:rbac_catalog:current'
+
+
+def bump_rbac_catalog_version():
+    """Invalidate the catalog snapshot"""
+    bump_now_and_on_commit(lambda: incr_version(RBAC_CATALOG_VERSION_KEY))
+
+
+class RBACCatalog:
+    """Versioned snapshot of the RBAC catalog"""
+
+    def __init__(self):
+        self._entry = None
+
+    def snapshot(self):
+        """``{'version', 'etag', 'generated_at', 'data'}`` for the current catalog version"""
+        values = cache.get_many([RBAC_CATALOG_VERSION_KEY, RBAC_CATALOG_CURRENT_KEY])
+        version = values.get(RBAC_CATALOG_VERSION_KEY, 0)
+        current = values.get(RBAC_CATALOG_CURRENT_KEY)
+        entry = self._entry
+        if entry is not None and current == (version, entry['etag']):
+            return entry
+        ttl = getattr(settings, 'RBAC_CATALOG_CACHE_TTL', 3600)
+        key = RBAC_CATALOG_KEY.format(version)
+        entry = cache.get(key)
+        if entry is None:
+            entry = self.build(version)
+            cache.set(key, entry, ttl)
+        if current != (version, entry['etag']):
+            cache.set(RBAC_CATALOG_CURRENT_KEY, (version, entry['etag']), ttl)
+        self._entry = entry
+        return entry
+
+    def build(self, version):
+        grants = self._group_permission_ids()
+        data = {
+            'roles': self._roles(grants),
+            'groups': self._groups(grants),
+            'permissions': self._permissions(),
+            'permission_categories': self._permission_categories(),
+            'custom_permissions': self._custom_permissions(),
+        }
+        encoded = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()
+        return {
+            'version': version,
+            # Versions restart when the cache is flushed; the digest keeps ETags unique
+            'etag': f'"rbac-{version}-{hashlib.blake2b(encoded, digest_size=8).hexdigest()}"',
+            'generated_at': timezone.now().isoformat(),
+            'data': data,
+        }
+
+    def _group_permission_ids(self):
+        grants = {}
+        for group_id, permission_id in Group.permissions.through.objects.order_by(
+            'group_id', 'permission_id'
+        ).values_list('group_id', 'permission_id'):
+            grants.setdefault(group_id, []).append(permission_id)
+        return grants
+
+    def _roles(self, grants):
+        roles = Role.objects.order_by('role_level', 'display_name').values(
+            'id', 'name', 'display_name', 'description', 'role_level', 'parent_id', 'django_group_id',
+            'is_active', 'is_system_role', 'can_assign_roles', 'max_assignments',
+        )
+        return [
+            {
+                **role,
+                'id': str(role['id']),
+                'parent_id': str(role['parent_id']) if role['parent_id'] else None,
+                'permission_ids': grants.get(role['django_group_id'], []),
+            }
+            for role in roles
+        ]
+
+    def _groups(self, grants):
+        return [
+            {'id': group_id, 'name': name, 'permission_ids': grants.get(group_id, [])}
+            for group_id, name in Group.objects.order_by('name').values_list('id', 'name')
+        ]
+
+    def _permissions(self):
+        return [
+            {'id': pk, 'name': name, 'codename': codename, 'content_type': content_type_id, 'app_label': app_label}
+            for pk, name, codename, content_type_id, app_label in Permission.objects.order_by(
+                'content_type__app_label', 'codename'
+            ).values_list('id', 'name', 'codename', 'content_type_id', 'content_type__app_label')
+        ]
+
+    def _permission_categories(self):
+        categories = PermissionCategory.objects.annotate(
+            permissions_count=Count('custom_permissions', filter=Q(custom_permissions__is_active=True))
+        ).values('id', 'name', 'display_name', 'description', 'icon', 'order', 'permissions_count')
+        return [{**category, 'id': str(category['id'])} for category in categories]
+
+    def _custom_permissions(self):
+        custom_permissions = CustomPermission.objects.order_by('codename').values(
+            'id', 'codename', 'name', 'description', 'category_id', 'django_permission_id',
+            'is_active', 'is_system_permission',
+        )
+        return [
+            {
+                **permission,
+                'id': str(permission['id']),
+                'category_id': str(permission['category_id']) if permission['category_id'] else None,
+            }
+            for permission in custom_permissions
+        ]
+
+
+rbac_catalog = RBACCatalog()
@@ -0,0 +1,150 @@
+"""
+User search over login_id, email, name, employee_id and mobile.
+
+On PostgreSQL matches are served by indexes (migration 0012): a ``simple``
+tsvector over the text fields for word-prefix matches, and pg_trgm GIN
+indexes on ``UPPER(field)`` (what ``icontains`` compiles to) and on mobile
+for substring matches. Results
+are ranked by full-text rank plus the best trigram similarity. Other
+backends (SQLite in tests) fall back to ``icontains`` with a simple
+exact/prefix ranking.
+
+Mobiles are stored in E.164 (``+8801712345678``); the digits of the query
+are matched as a substring, so ``01712-345678`` finds it too.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.filters import BaseFilterBackend
+
+
+SEARCH_FIELDS = ('login_id', 'email', 'name', 'employee_id')
+# Trigram indexes need three characters; shorter terms only use the prefix/word match
+TRIGRAM_MIN_LENGTH = 3
+MOBILE_MIN_DIGITS = 4
+
+
+def search_document():
+    """The indexed tsvector expression (must stay identical to the index in migration 0012)"""
+    return SearchVector(*SEARCH_FIELDS, config='simple')
+
+
+class UserSearchFilter(BaseFilterBackend):
+    """``?search=`` through the user search backend (filtering only; the view's ordering is kept)"""
+
+    search_param = 'search'
+    search_title = 'Search'
+    search_description = 'Login ID, email, name, employee ID or mobile digits (any format).'
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '')
+        if not term.strip():
+            return queryset
+        return user_search(queryset.db).matching(queryset, term)
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        return [
+            coreapi.Field(
+                name=self.search_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(title=self.search_title, description=self.search_description),
+            )
+        ]
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.search_param,
+                'required': False,
+                'in': 'query',
+                'description': self.search_description,
+                'schema': {'type': 'string'},
+            },
+        ]
+
+
+def _mobile_digits(term):
+    digits = re.sub(r'\D', '', term)
+    return digits if len(digits) >= MOBILE_MIN_DIGITS else None
+
+
+class UserSearchBackend:
+    """Portable search: case-insensitive substring matches"""
+
+    def matching(self, queryset, term):
+        """Users matching ``term`` (unordered)"""
+        term = term.strip()
+        if not term:
+            return queryset
+        condition = Q()
+        for field in SEARCH_FIELDS:
+            condition |= Q(**{f'{field}__icontains': term})
+        digits = _mobile_digits(term)
+        if digits:
+            condition |= Q(mobile__contains=digits)
+        return queryset.filter(condition)
+
+    def rank(self, term):
+        lowered = term.lower()
+        return Case(
+            When(Q(login_id__iexact=lowered) | Q(email__iexact=lowered) | Q(employee_id__iexact=lowered), then=Value(3)),
+            When(Q(login_id__istartswith=lowered) | Q(name__istartswith=lowered), then=Value(2)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+
+    def ranked(self, queryset, term):
+        """Matching users annotated with ``search_rank``, best first"""
+        term = term.strip()
+        return self.matching(queryset, term).annotate(search_rank=self.rank(term)).order_by('-search_rank', 'login_id')
+
+
+class PostgresUserSearchBackend(UserSearchBackend):
+    """tsvector prefix matches plus pg_trgm substring matches, ranked"""
+
+    def _tsquery(self, term):
+        # Prefix query over the term's words, e.g. "rahim kha" -> 'rahim':* & 'kha':*
+        words = re.findall(r'\w+', term)
+        if not words:
+            return None
+        return SearchQuery(' & '.join(f"'{word}':*" for word in words), search_type='raw', config='simple')
+
+    def matching(self, queryset, term):
+        term = term.strip()
+        if not term:
+            return queryset
+        condition = Q()
+        tsquery = self._tsquery(term)
+        if tsquery is not None:
+            queryset = queryset.alias(search_document=search_document())
+            condition |= Q(search_document=tsquery)
+        if len(term) >= TRIGRAM_MIN_LENGTH:
+            for field in SEARCH_FIELDS:
+                condition |= Q(**{f'{field}__icontains': term})
+        digits = _mobile_digits(term)
+        if digits:
+            condition |= Q(mobile__contains=digits)
+        if not condition:
+            return queryset.none()
+        return queryset.filter(condition)
+
+    def rank(self, term):
+        similarity = Greatest(*(TrigramSimilarity(field, term) for field in SEARCH_FIELDS))
+        tsquery = self._tsquery(term)
+        if tsquery is None:
+            return similarity
+        return SearchRank(search_document(), tsquery) + similarity
+
+
+def user_search(using='default'):
+    """The search backend for the database alias"""
+    if connections[using].vendor == 'postgresql':
+        return PostgresUserSearchBackend()
+    return UserSearchBackend()
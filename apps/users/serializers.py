@@ -1,14 +1,20 @@
+import uuid
 from rest_framework import serializers
 from django.contrib.auth.models import Group, Permission
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models
 from django.contrib.auth import authenticate
 from django.utils import timezone
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
-from .models import User, Role, UserRole, PermissionCategory, CustomPermission
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from .models import User, Role, UserRole, UserSession, PermissionCategory, CustomPermission
+from .hashing import password_hash_limiter
+from .lockout import login_attempts
+from .tokens import UserRefreshToken, SESSION_ID_CLAIM
 from apps.common.models import District, Thana
-from apps.common.serializers import DistrictSerializer, ThanaSerializer
+from apps.common.utils import get_client_ip
+from apps.common.serializers import DistrictSerializer, SparseFieldsetMixin, ThanaSerializer
 
 
 class PermissionSerializer(serializers.ModelSerializer):
@@ -44,9 +50,11 @@ class GroupSerializer(serializers.ModelSerializer):
         return instance
 
 
-class RoleSerializer(serializers.ModelSerializer):
+class RoleSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Role model"""
     
+    expandable_fields = ('permissions',)
+    
     permissions = PermissionSerializer(source='django_group.permissions', many=True, read_only=True)
     permission_ids = serializers.ListField(
         child=serializers.IntegerField(),
@@ -59,15 +67,21 @@ class RoleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Role
         fields = [
-            'id', 'name', 'display_name', 'description', 'role_level',
+            'id', 'name', 'display_name', 'description', 'role_level', 'parent',
             'is_active', 'is_system_role', 'can_assign_roles', 'max_assignments',
             'permissions', 'permission_ids', 'users_count', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
     
+    def validate_parent(self, value):
+        """Keep the hierarchy acyclic"""
+        if value and self.instance and Role.objects.subtree(self.instance).filter(pk=value.pk).exists():
+            raise serializers.ValidationError("A role cannot be placed below itself or one of its descendants.")
+        return value
+    
     def get_users_count(self, obj):
         """Get count of active users with this role"""
-        return obj.user_assignments.filter(is_active=True).count()
+        return obj.active_assignments
     
     def create(self, validated_data):
         permission_ids = validated_data.pop('permission_ids', [])
@@ -111,7 +125,7 @@ class UserCreateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, validators=[validate_password])
     password_confirm = serializers.CharField(write_only=True)
     roles = serializers.ListField(
-        child=serializers.IntegerField(),
+        child=serializers.UUIDField(),
         write_only=True,
         required=False,
         help_text="List of role IDs to assign to the user"
@@ -132,6 +146,17 @@ class UserCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("A user with this login ID already exists.")
         return value
     
+    def validate_roles(self, value):
+        """Resolve the role IDs, rejecting any the requester may not assign"""
+        role_ids = list(dict.fromkeys(value))
+        roles = Role.objects.assignable_by(self.context['request'].user).in_bulk(role_ids)
+        rejected = [str(role_id) for role_id in role_ids if role_id not in roles]
+        if rejected:
+            raise serializers.ValidationError(
+                f"Unknown roles or roles you are not allowed to assign: {', '.join(rejected)}."
+            )
+        return [roles[role_id] for role_id in role_ids]
+    
     def validate(self, attrs):
         """Validate password confirmation"""
         if attrs['password'] != attrs['password_confirm']:
@@ -143,20 +168,44 @@ class UserCreateSerializer(serializers.ModelSerializer):
         roles = validated_data.pop('roles', [])
         password = validated_data.pop('password')
         
-        user = User.objects.create_user(password=password, **validated_data)
-        
-        # Assign roles
-        if roles:
-            role_objects = Role.objects.filter(id__in=roles, is_active=True)
-            for role in role_objects:
-                user.assign_role(role, assigned_by=self.context['request'].user)
+        try:
+            with UserRole.objects.unit_of_work():
+                user = User.objects.create_user(password=password, **validated_data)
+                
+                # Assign roles (validated as assignable by validate_roles)
+                for role in roles:
+                    user.assign_role(role, assigned_by=self.context['request'].user)
+        except DjangoValidationError as e:
+            # A role at its max_assignments
+            raise serializers.ValidationError({'roles': e.messages})
         
         return user
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserListSerializer(serializers.ListSerializer):
+    """List mode of UserSerializer: batch-loads the relations of the whole page before serializing it"""
+    
+    def to_representation(self, data):
+        users = data.all() if isinstance(data, models.manager.BaseManager) else data
+        # Only the relations behind the fields being rendered (see ?fields= / ?expand=)
+        relations = [
+            relation for name, relation in self.child.directory_relations.items() if name in self.child.fields
+        ]
+        return super().to_representation(User.objects.prefetch_directory_relations(users, relations))
+
+
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for User model (read/update)"""
     
+    expandable_fields = ('roles', 'permissions', 'district_info', 'thana_info')
+    # Relation loaded in list mode for each nested field
+    directory_relations = {
+        'roles': 'user_roles',
+        'permissions': 'effective_permissions',
+        'district_info': 'district',
+        'thana_info': 'thana',
+    }
+    
     # full_name = serializers.ReadOnlyField()
     roles = UserRoleSerializer(source='user_roles', many=True, read_only=True)
     permissions = serializers.SerializerMethodField()
@@ -172,12 +221,13 @@ class UserSerializer(serializers.ModelSerializer):
             'district', 'district_info', 'thana', 'thana_info', 'postal_code', 'remarks',
             'is_active', 'is_staff', 'is_email_verified', 'is_phone_verified',
             'profile_photo', 'language_preference', 'timezone', 'roles', 'permissions',
-            'last_login', 'date_joined', 'access_token', 'refresh_token', 'created_at', 'updated_at'
+            'last_login', 'date_joined', 'created_at', 'updated_at'
         ]
         
         read_only_fields = [
             'id', 'login_id', 'last_login', 'date_joined', 'created_at', 'updated_at'
         ]
+        list_serializer_class = UserListSerializer
     
     def get_permissions(self, obj):
         """Get all user permissions"""
@@ -219,7 +269,7 @@ class PasswordChangeSerializer(serializers.Serializer):
     def validate_old_password(self, value):
         """Validate old password"""
         user = self.context['request'].user
-        if not user.check_password(value):
+        if not password_hash_limiter.check_password(user, value):
             raise serializers.ValidationError("Old password is incorrect.")
         return value
     
@@ -232,11 +282,24 @@ class PasswordChangeSerializer(serializers.Serializer):
     def save(self):
         """Change user password"""
         user = self.context['request'].user
-        user.set_password(self.validated_data['new_password'])
+        password_hash_limiter.set_password(user, self.validated_data['new_password'])
         user.save()
         return user
 
 
+class BulkRoleAssignmentSerializer(serializers.Serializer):
+    """Serializer for bulk assigning/revoking one role; the role itself is resolved by the view"""
+    
+    user_ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    role_id = serializers.UUIDField()
+    action = serializers.ChoiceField(choices=['assign', 'revoke'])
+    reason = serializers.CharField(required=False, allow_blank=True, default='')
+    
+    def validate_user_ids(self, value):
+        """Drop duplicates, keeping the request order"""
+        return [str(user_id) for user_id in dict.fromkeys(value)]
+
+
 class RoleAssignmentSerializer(serializers.Serializer):
     """Serializer for assigning/revoking roles"""
     
@@ -254,14 +317,16 @@ class RoleAssignmentSerializer(serializers.Serializer):
             raise serializers.ValidationError("User not found.")
     
     def validate_role_id(self, value):
-        """Validate role exists and is active"""
+        """Validate role exists, is active and sits below the requester's assigning roles"""
         try:
-            role = Role.objects.get(id=value)
+            return Role.objects.assignable_by(self.context['request'].user).get(id=value)
+        except Role.DoesNotExist:
+            role = Role.objects.filter(id=value).first()
+            if role is None:
+                raise serializers.ValidationError("Role not found.")
             if not role.is_active:
                 raise serializers.ValidationError("Role is not active.")
-            return role
-        except Role.DoesNotExist:
-            raise serializers.ValidationError("Role not found.")
+            raise serializers.ValidationError("You are not allowed to assign this role.")
     
     def save(self):
         """Perform role assignment/revocation"""
@@ -272,18 +337,23 @@ class RoleAssignmentSerializer(serializers.Serializer):
         expires_at = self.validated_data.get('expires_at')
         assigned_by = self.context['request'].user
         
-        if action == 'assign':
-            user_role, created = user.assign_role(
-                role=role,
-                assigned_by=assigned_by,
-                assignment_reason=reason,
-                expires_at=expires_at
-            )
-            return {'action': 'assigned', 'created': created, 'user_role': user_role}
-        
-        elif action == 'revoke':
-            count = user.revoke_role(role=role, revoked_by=assigned_by, reason=reason)
-            return {'action': 'revoked', 'count': count}
+        with UserRole.objects.unit_of_work():
+            if action == 'assign':
+                try:
+                    user_role, created = user.assign_role(
+                        role=role,
+                        assigned_by=assigned_by,
+                        assignment_reason=reason,
+                        expires_at=expires_at
+                    )
+                except DjangoValidationError as e:
+                    # The role is at its max_assignments
+                    raise serializers.ValidationError({'role_id': e.messages})
+                return {'action': 'assigned', 'created': created, 'user_role': user_role}
+            
+            elif action == 'revoke':
+                count = user.revoke_role(role=role, revoked_by=assigned_by, reason=reason)
+                return {'action': 'revoked', 'count': count}
 
 
 class PermissionCategorySerializer(serializers.ModelSerializer):
@@ -300,8 +370,11 @@ class PermissionCategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
     
     def get_permissions_count(self, obj):
-        """Get count of custom permissions in this category"""
-        return obj.custom_permissions.filter(is_active=True).count()
+        """Get count of active custom permissions in this category (annotated by list views)"""
+        count = getattr(obj, 'active_permissions_count', None)
+        if count is None:
+            count = obj.custom_permissions.filter(is_active=True).count()
+        return count
 
 
 class CustomPermissionSerializer(serializers.ModelSerializer):
@@ -342,56 +415,59 @@ class LoginSerializer(serializers.Serializer):
         if not login_id or not password:
             raise serializers.ValidationError('Both login_id and password are required.')
         
+        # Reject locked login ids and throttled sources before any password hashing
+        self.check_not_blocked(login_id)
+        
         # Authenticate user
         user = authenticate(request=self.context.get('request'), login_id=login_id, password=password)
+        self.check_authenticated(user)
         
+        attrs.update(self.complete_login(user, remember_me))
+        return attrs
+    
+    def check_not_blocked(self, login_id):
+        """Fail fast for locked login ids and throttled client IPs"""
+        locked_until = login_attempts.blocked_until(login_id, get_client_ip(self.context.get('request')))
+        if locked_until:
+            raise serializers.ValidationError(
+                f'Account is locked until {locked_until.strftime("%Y-%m-%d %H:%M:%S")}.'
+            )
+    
+    def check_authenticated(self, user):
+        """Validate the result of authenticate()"""
         if not user:
             raise serializers.ValidationError('Invalid login credentials.')
         
         if not user.is_active:
             raise serializers.ValidationError('User account is disabled.')
+    
+    def complete_login(self, user, remember_me=False):
+        """Open a session for an authenticated user and issue its tokens"""
+        # Generate JWT tokens bound to a new device session
+        session_id = uuid.uuid4()
+        refresh = UserRefreshToken.for_session(user, session_id, remember_me=remember_me)
+        access = refresh.access_token
         
-        # Check if account is locked
-        if user.locked_until and user.locked_until > timezone.now():
-            raise serializers.ValidationError(
-                f'Account is locked until {user.locked_until.strftime("%Y-%m-%d %H:%M:%S")}.'
-            )
-        
-        # Reset failed login attempts on successful login
-        if user.failed_login_attempts > 0:
-            user.failed_login_attempts = 0
-            user.locked_until = None
-            user.save(update_fields=['failed_login_attempts', 'locked_until'])
-        
-        # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
-        access_token = str(refresh.access_token)
-        refresh_token = str(refresh)
-        
-        # Set token expiration based on remember_me
-        if remember_me:
-            # Extend refresh token lifetime for remember_me (30 days)
-            refresh.set_exp(lifetime=timezone.timedelta(days=30))
-            refresh_token = str(refresh)
-        
-        # Store tokens in user model for lifetime login
-        token_expires_at = timezone.now() + timezone.timedelta(hours=1)  # Access token expires in 1 hour
-        user.set_tokens(
-            access_token=access_token,
-            refresh_token=refresh_token,
-            expires_at=token_expires_at,
+        # Single insert into the session store
+        session = UserSession.objects.open(
+            user, refresh, session_id,
+            request=self.context.get('request'),
             remember_me=remember_me
         )
         
-        # Update last login
+        # Update last login and reset failed login attempts in one write
         user.last_login = timezone.now()
-        user.save(update_fields=['last_login'])
-        
-        attrs['user'] = user
-        attrs['access_token'] = access_token
-        attrs['refresh_token'] = refresh_token
+        user.failed_login_attempts = 0
+        user.locked_until = None
+        user.save(update_fields=['last_login', 'failed_login_attempts', 'locked_until'])
         
-        return attrs
+        return {
+            'user': user,
+            'session': session,
+            'access_token': str(access),
+            'refresh_token': str(refresh),
+            'expires_at': datetime_from_epoch(access['exp']),
+        }
 
 
 class TokenRefreshSerializer(serializers.Serializer):
@@ -400,49 +476,43 @@ class TokenRefreshSerializer(serializers.Serializer):
     refresh_token = serializers.CharField()
     
     def validate(self, attrs):
-        """Validate refresh token and generate new access token"""
+        """Validate refresh token against its session and rotate it"""
         refresh_token = attrs.get('refresh_token')
         
         try:
             # Validate refresh token
-            refresh = RefreshToken(refresh_token)
-            user_id = refresh.payload.get('user_id')
-            
-            # Get user
-            try:
-                user = User.objects.get(id=user_id)
-            except User.DoesNotExist:
-                raise serializers.ValidationError('User not found.')
-            
-            if not user.is_active:
-                raise serializers.ValidationError('User account is disabled.')
-            
-            # Check if stored refresh token matches
-            if user.refresh_token != refresh_token:
-                raise serializers.ValidationError('Invalid refresh token.')
-            
-            # Generate new access token
-            new_refresh = RefreshToken.for_user(user)
-            new_access_token = str(new_refresh.access_token)
-            new_refresh_token = str(new_refresh)
-            
-            # Update stored tokens
-            token_expires_at = timezone.now() + timezone.timedelta(hours=1)
-            user.set_tokens(
-                access_token=new_access_token,
-                refresh_token=new_refresh_token,
-                expires_at=token_expires_at,
-                remember_me=user.remember_me
-            )
-            
-            attrs['user'] = user
-            attrs['access_token'] = new_access_token
-            attrs['refresh_token'] = new_refresh_token
-            
-            return attrs
-            
-        except TokenError as e:
+            refresh = UserRefreshToken(refresh_token)
+        except TokenError:
             raise serializers.ValidationError('Invalid or expired refresh token.')
+        
+        # Look the session up by the token's jti (unique index)
+        jti = refresh.payload.get('jti')
+        try:
+            session = UserSession.objects.select_related('user').get(
+                refresh_jti=jti, revoked_at__isnull=True
+            )
+        except UserSession.DoesNotExist:
+            raise serializers.ValidationError('Invalid refresh token.')
+        
+        user = session.user
+        if not user.is_active:
+            raise serializers.ValidationError('User account is disabled.')
+        # The new pair carries a fresh permission snapshot
+        User.objects.prefetch_login_relations(user)
+        
+        # Rotate the session onto a new token pair in a single conditional update
+        new_refresh = UserRefreshToken.for_session(user, session.id, remember_me=session.remember_me)
+        if not UserSession.objects.rotate(session, jti, new_refresh):
+            raise serializers.ValidationError('Invalid refresh token.')
+        new_access = new_refresh.access_token
+        
+        attrs['user'] = user
+        attrs['session'] = session
+        attrs['access_token'] = str(new_access)
+        attrs['refresh_token'] = str(new_refresh)
+        attrs['expires_at'] = datetime_from_epoch(new_access['exp'])
+        
+        return attrs
 
 
 class LogoutSerializer(serializers.Serializer):
@@ -453,24 +523,27 @@ class LogoutSerializer(serializers.Serializer):
     
     def validate(self, attrs):
         """Validate logout request"""
-        user = self.context['request'].user
+        request = self.context['request']
+        user = request.user
         refresh_token = attrs.get('refresh_token')
         logout_all_devices = attrs.get('logout_all_devices', False)
         
         if logout_all_devices:
-            # Clear all tokens for the user
-            user.clear_tokens()
+            # Revoke every session of the user
+            UserSession.objects.revoke_all(user)
         else:
-            # Blacklist specific refresh token if provided
+            refresh_jti = None
             if refresh_token:
                 try:
-                    token = RefreshToken(refresh_token)
-                    token.blacklist()
+                    refresh_jti = UserRefreshToken(refresh_token).payload.get('jti')
                 except TokenError:
-                    pass  # Token already invalid/blacklisted
+                    pass  # Token already invalid/expired
             
-            # Clear stored tokens
-            user.clear_tokens()
+            if refresh_jti:
+                UserSession.objects.revoke(user, refresh_jti=refresh_jti)
+            elif request.auth is not None and request.auth.get(SESSION_ID_CLAIM):
+                # Revoke the session of the access token used for this request
+                UserSession.objects.revoke(user, session_id=request.auth[SESSION_ID_CLAIM])
         
         attrs['user'] = user
         return attrs
@@ -0,0 +1,183 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from .models import User, Role, UserRole, EffectivePermission
+
+
+# Status of asynchronous bulk role assignment jobs, polled by clients
+BULK_ROLE_JOB_KEY = 'users:bulk_role_job:{}'
+BULK_ROLE_JOB_TTL = 24 * 3600
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def bulk_assign_role(role, user_ids, assigned_by, reason='', expires_at=None, progress=None):
+    """
+    Assign ``role`` to the active users among ``user_ids`` with set-based
+    statements per chunk: a bulk insert of new assignments, one UPDATE
+    reactivating revoked ones and a bulk insert into the group table.
+
+    The max_assignments slots the whole request needs are reserved with one
+    conditional UPDATE before anything is written, so a request that cannot
+    fit is rejected up front and concurrent assignments cannot use up its
+    slots midway. Each chunk is then its own transaction (a savepoint inside
+    a caller's transaction), so the role row is not locked for the whole
+    request; slots left unused (rows assigned concurrently) are released at
+    the end, also when a chunk fails. ``progress(done, total)`` is called
+    after each chunk.
+    """
+    chunk_size = getattr(settings, 'BULK_ROLE_ASSIGNMENT_CHUNK_SIZE', 1000)
+    now = timezone.now()
+    ids = list(User.objects.filter(id__in=user_ids, is_active=True).values_list('id', flat=True))
+    created = reactivated = processed = 0
+
+    reserved = len(ids) - UserRole.objects.filter(role=role, user_id__in=ids, is_active=True).count()
+    if not Role.objects.reserve_assignments(role.pk, reserved):
+        raise Role.objects.capacity_error(role.pk, reserved)
+
+    try:
+        for chunk in _chunks(ids, chunk_size):
+            with transaction.atomic():
+                existing = dict(
+                    UserRole.objects.filter(role=role, user_id__in=chunk).values_list('user_id', 'is_active')
+                )
+                new_rows = [
+                    UserRole(
+                        user_id=user_id, role=role, assigned_by=assigned_by, assigned_at=now,
+                        expires_at=expires_at, assignment_reason=reason,
+                    )
+                    for user_id in chunk if user_id not in existing
+                ]
+                revoked = [user_id for user_id, is_active in existing.items() if not is_active]
+                # More than reserved only when users were revoked concurrently since the count above
+                extra = max(len(new_rows) + len(revoked) - reserved, 0)
+                if not Role.objects.reserve_assignments(role.pk, extra):
+                    error = Role.objects.capacity_error(role.pk, extra)
+                    raise ValidationError([f'{processed} of {len(ids)} users were assigned.', *error.messages])
+
+                UserRole.objects.bulk_create(new_rows, ignore_conflicts=True)
+                # Rows skipped as conflicts (assigned concurrently) were not created by this request
+                inserted = UserRole.objects.filter(pk__in=[row.pk for row in new_rows]).count() if new_rows else 0
+
+                updated = 0
+                if revoked:
+                    updated = UserRole.objects.filter(role=role, user_id__in=revoked, is_active=False).update(
+                        is_active=True, assigned_by=assigned_by, assigned_at=now, expires_at=expires_at,
+                        assignment_reason=reason, revoked_by=None, revoked_at=None, revocation_reason='',
+                        updated_at=now,
+                    )
+
+                if role.django_group_id:
+                    User.groups.through.objects.bulk_create(
+                        [User.groups.through(user_id=user_id, group_id=role.django_group_id) for user_id in chunk],
+                        ignore_conflicts=True,
+                    )
+                EffectivePermission.objects.refresh_users(chunk, membership_changed=chunk)
+            # Committed: the chunk's rows now hold the slots they used
+            reserved += extra - inserted - updated
+            created += inserted
+            reactivated += updated
+            processed += len(chunk)
+            if progress:
+                progress(processed, len(ids))
+    finally:
+        Role.objects.release_assignments(role.pk, reserved)
+
+    return {
+        'action': 'assigned',
+        'requested': len(user_ids),
+        'matched': len(ids),
+        'created': created,
+        'reactivated': reactivated,
+        'unchanged': len(ids) - created - reactivated,
+    }
+
+
+def bulk_revoke_role(role, user_ids, revoked_by, reason='', progress=None):
+    """
+    Revoke the active assignments of ``role`` for ``user_ids``: one UPDATE
+    and one group table DELETE per chunk, each chunk in its own transaction.
+    """
+    chunk_size = getattr(settings, 'BULK_ROLE_ASSIGNMENT_CHUNK_SIZE', 1000)
+    now = timezone.now()
+    ids = list(
+        UserRole.objects.filter(role=role, user_id__in=user_ids, is_active=True).values_list('user_id', flat=True)
+    )
+    revoked = processed = 0
+
+    for chunk in _chunks(ids, chunk_size):
+        with transaction.atomic():
+            count = UserRole.objects.filter(role=role, user_id__in=chunk, is_active=True).update(
+                is_active=False, revoked_by=revoked_by, revoked_at=now, revocation_reason=reason, updated_at=now,
+            )
+            Role.objects.release_assignments(role.pk, count)
+            revoked += count
+            UserRole.objects.remove_group_memberships((user_id, role.django_group_id) for user_id in chunk)
+            EffectivePermission.objects.refresh_users(chunk, membership_changed=chunk)
+        processed += len(chunk)
+        if progress:
+            progress(processed, len(ids))
+
+    return {
+        'action': 'revoked',
+        'requested': len(user_ids),
+        'matched': len(ids),
+        'revoked': revoked,
+    }
+
+
+def bulk_role_assignment(role, user_ids, action, actor, reason='', progress=None):
+    """Dispatch a bulk ``assign`` or ``revoke`` of ``role``"""
+    if action == 'assign':
+        return bulk_assign_role(role, user_ids, actor, reason=reason, progress=progress)
+    return bulk_revoke_role(role, user_ids, actor, reason=reason, progress=progress)
+
+
+class BulkRoleJob:
+    """Cache-backed status of an asynchronous bulk role assignment"""
+
+    key_format = BULK_ROLE_JOB_KEY
+    ttl = BULK_ROLE_JOB_TTL
+
+    def __init__(self, job_id):
+        self.job_id = str(job_id)
+        self.key = self.key_format.format(self.job_id)
+
+    @classmethod
+    def create(cls, actor, action, role, total):
+        job = cls(uuid.uuid4())
+        job.save({
+            'job_id': job.job_id,
+            'status': 'pending',
+            'action': action,
+            'role': str(role.id),
+            'requested_by': str(actor.id),
+            'processed': 0,
+            'total': total,
+            'result': None,
+            'error': None,
+            'created_at': timezone.now().isoformat(),
+        })
+        return job
+
+    def get(self):
+        return cache.get(self.key)
+
+    def save(self, data):
+        cache.set(self.key, data, self.ttl)
+
+    def update(self, **fields):
+        data = self.get() or {'job_id': self.job_id}
+        data.update(fields)
+        self.save(data)
+        return data
+
+    def progress(self, processed, total):
+        self.update(status='running', processed=processed, total=total)
@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .authentication import principal_cache
+from .models import (
+    User, Role, UserRole, EffectivePermission, PermissionCategory, CustomPermission, permissions_changed,
+)
+from .rbac_catalog import bump_rbac_catalog_version
+from .tasks import refresh_group_members
+from .token_permissions import bump_catalog_version, bump_group_versions
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_principal(sender, instance, **kwargs):
+    """Drop the cached principal whenever the user row changes"""
+    principal_cache.invalidate(instance.pk)
+
+
+@receiver(permissions_changed, sender=User)
+def invalidate_principal_permissions(sender, user_id, **kwargs):
+    """The cached principal carries the user's roles; reload it after a permission change"""
+    principal_cache.invalidate(user_id)
+
+
+@receiver(post_delete, sender=UserRole)
+def release_role_assignment_slot(sender, instance, **kwargs):
+    """Deleted active assignments (including cascades from User) free a max_assignments slot"""
+    if instance.is_active:
+        Role.objects.release_assignments(instance.role_id)
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def invalidate_user_role_permissions(sender, instance, **kwargs):
+    """Role assignment changes re-materialize the user's permissions (bumping their version)"""
+    EffectivePermission.objects.schedule([instance.user_id])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """Group membership and direct permission changes invalidate the affected users"""
+    if action == 'pre_clear' and reverse:
+        # Remember who is about to be removed; post_clear has no pk_set
+        related_field = 'group_id' if sender is User.groups.through else 'permission_id'
+        instance._cleared_user_ids = set(
+            sender.objects.filter(**{related_field: instance.pk}).values_list('user_id', flat=True)
+        )
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        user_ids = {instance.pk}
+    elif action == 'post_clear':
+        user_ids = getattr(instance, '_cleared_user_ids', set())
+    else:
+        user_ids = pk_set or set()
+    EffectivePermission.objects.schedule(user_ids, membership_changed=sender is User.groups.through)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Role/group permission changes bump one version counter per group, which
+    makes every member's cached mask and token snapshot stale without
+    per-user cache writes. The members' materialized rows are refreshed
+    right away for groups of up to EFFECTIVE_PERMISSION_SYNC_LIMIT users,
+    and in the background for larger ones (until then, listings that read
+    the rows lag behind the masks).
+    """
+    if action == 'pre_clear' and reverse:
+        instance._cleared_group_ids = set(
+            sender.objects.filter(permission_id=instance.pk).values_list('group_id', flat=True)
+        )
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        group_ids = {instance.pk}
+    elif action == 'post_clear':
+        group_ids = getattr(instance, '_cleared_group_ids', set())
+    else:
+        group_ids = pk_set or set()
+    if not group_ids:
+        return
+    bump_group_versions(group_ids)
+    bump_rbac_catalog_version()
+    Role.objects.refresh_permission_masks(group_ids)
+    limit = getattr(settings, 'EFFECTIVE_PERMISSION_SYNC_LIMIT', 200)
+    members = EffectivePermission.objects.users_of_groups(group_ids, limit=limit)
+    if len(members) <= limit:
+        EffectivePermission.objects.refresh_users(members, bump=False)
+        return
+    group_ids = list(group_ids)
+    transaction.on_commit(lambda: refresh_group_members.delay(group_ids))
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_members(sender, instance, **kwargs):
+    """Membership rows are cascaded without m2m signals; remember who to refresh"""
+    instance._member_ids = EffectivePermission.objects.users_of_groups([instance.pk])
+
+
+@receiver(post_delete, sender=Group)
+def refresh_deleted_group_members(sender, instance, **kwargs):
+    EffectivePermission.objects.schedule(getattr(instance, '_member_ids', set()), membership_changed=True)
+
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_permission_catalog(sender, **kwargs):
+    """New or removed permissions change the snapshot bit layout"""
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=Permission)
+def refresh_permission_holders(sender, instance, **kwargs):
+    """Grants of a deleted permission are cascaded without m2m signals"""
+    holders = EffectivePermission.objects.filter(codename=instance.codename).values_list('user_id', flat=True)
+    EffectivePermission.objects.schedule(set(holders))
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(post_save, sender=PermissionCategory)
+@receiver(post_delete, sender=PermissionCategory)
+@receiver(post_save, sender=CustomPermission)
+@receiver(post_delete, sender=CustomPermission)
+def invalidate_rbac_catalog(sender, **kwargs):
+    """Catalog edits invalidate the cached RBAC catalog snapshot"""
+    bump_rbac_catalog_version()
@@ -0,0 +1,155 @@
+import base64
+import hashlib
+import json
+import threading
+
+import jwt
+from django.conf import settings
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError, TokenBackendExpiredToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+def _b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+class SigningKey:
+    """An asymmetric JWT signing key loaded from a PEM encoded private key"""
+
+    def __init__(self, pem):
+        from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+        self.private_key = load_pem_private_key(pem, password=None)
+        self.public_key = self.private_key.public_key()
+        if isinstance(self.private_key, rsa.RSAPrivateKey):
+            self.algorithm = 'RS256'
+            jwk = jwt.algorithms.RSAAlgorithm.to_jwk(self.public_key, as_dict=True)
+            required = ('e', 'kty', 'n')
+        elif isinstance(self.private_key, ed25519.Ed25519PrivateKey):
+            self.algorithm = 'EdDSA'
+            jwk = jwt.algorithms.OKPAlgorithm.to_jwk(self.public_key, as_dict=True)
+            required = ('crv', 'kty', 'x')
+        else:
+            raise ValueError('JWT signing keys must be RSA or Ed25519 private keys.')
+
+        # RFC 7638 thumbprint as key id
+        canonical = json.dumps({name: jwk[name] for name in required}, separators=(',', ':'), sort_keys=True)
+        self.kid = _b64url(hashlib.sha256(canonical.encode()).digest())
+        self.jwk = {**jwk, 'kid': self.kid, 'alg': self.algorithm, 'use': 'sig'}
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+
+class KeyRing:
+    """
+    Signing keys listed in ``JWT_SIGNING_KEY_FILES``. The first key signs new
+    tokens; every key is published in the JWKS and accepted for verification.
+
+    Rotation: append the new key and deploy, wait at least ``JWKS_MAX_AGE`` so
+    verifiers have fetched it, move it to the front, and drop the old key once
+    the tokens it signed have expired.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            with self._lock:
+                if self._keys is None:
+                    paths = getattr(settings, 'JWT_SIGNING_KEY_FILES', None) or []
+                    self._keys = [SigningKey.from_file(path) for path in paths]
+        return self._keys
+
+    @property
+    def enabled(self):
+        return bool(self.keys)
+
+    @property
+    def active(self):
+        return self.keys[0]
+
+    @cached_property
+    def by_kid(self):
+        return {key.kid: key for key in self.keys}
+
+    @cached_property
+    def jwks(self):
+        return {'keys': [key.jwk for key in self.keys]}
+
+    @cached_property
+    def jwks_json(self):
+        return json.dumps(self.jwks, separators=(',', ':')).encode()
+
+    @cached_property
+    def jwks_etag(self):
+        return hashlib.sha256(self.jwks_json).hexdigest()[:32]
+
+    @cached_property
+    def backend(self):
+        return KeyRingTokenBackend(self)
+
+
+class KeyRingTokenBackend(TokenBackend):
+    """
+    simplejwt token backend that signs with the key ring's active key, stamps
+    its ``kid`` in the header and verifies with the key the header names.
+    """
+
+    def __init__(self, key_ring):
+        super().__init__(
+            key_ring.active.algorithm,
+            audience=api_settings.AUDIENCE,
+            issuer=api_settings.ISSUER,
+            leeway=api_settings.LEEWAY,
+            json_encoder=api_settings.JSON_ENCODER,
+        )
+        self.key_ring = key_ring
+
+    def encode(self, payload):
+        jwt_payload = payload.copy()
+        if self.audience is not None:
+            jwt_payload['aud'] = self.audience
+        if self.issuer is not None:
+            jwt_payload['iss'] = self.issuer
+        key = self.key_ring.active
+        return jwt.encode(
+            jwt_payload,
+            key.private_key,
+            algorithm=key.algorithm,
+            headers={'kid': key.kid},
+            json_encoder=self.json_encoder,
+        )
+
+    def decode(self, token, verify=True):
+        try:
+            key = self.key_ring.by_kid.get(jwt.get_unverified_header(token).get('kid'))
+            if key is None:
+                raise TokenBackendError('Token is invalid')
+            return jwt.decode(
+                token,
+                key.public_key,
+                algorithms=[key.algorithm],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.get_leeway(),
+                options={
+                    'verify_aud': self.audience is not None,
+                    'verify_signature': verify,
+                },
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise TokenBackendExpiredToken('Token is expired') from e
+        except jwt.InvalidTokenError as e:
+            raise TokenBackendError('Token is invalid') from e
+
+
+key_ring = KeyRing()
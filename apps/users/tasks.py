@@ -0,0 +1,144 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from .blacklist import token_blacklist
+from .imports import ImportFileError, UserImport, UserImportJob, read_rows, upload_storage
+from .lockout import login_attempts
+from .models import User, Role, UserRole, UserSession, EffectivePermission
+from .services import BulkRoleJob, bulk_role_assignment
+
+logger = logging.getLogger(__name__)
+
+# Statistics of the last role expiry sweep, read by the auth metrics endpoint
+ROLE_EXPIRY_STATS_KEY = 'users:role_expiry:last_sweep'
+
+
+@shared_task(ignore_result=True)
+def flush_login_failures(batch_size=1000):
+    """
+    Copy the lockout counters buffered in the cache onto the users rows, so
+    the admin shows them. One bulk UPDATE per batch of users.
+    """
+    pending = list(login_attempts.pending_failures(batch_size))
+    users = [
+        User(pk=user_id, failed_login_attempts=attempts, locked_until=locked_until)
+        for user_id, attempts, locked_until in pending
+    ]
+    User.objects.bulk_update(users, ['failed_login_attempts', 'locked_until'], batch_size=batch_size)
+    return len(users)
+
+
+@shared_task(ignore_result=True)
+def compact_token_blacklist(batch_size=1000):
+    """
+    Purge expired simplejwt outstanding/blacklisted tokens and old sessions in
+    batches, and advance the cache blacklist log past expired entries.
+    """
+    now = timezone.now()
+    _delete_in_batches(OutstandingToken.objects.filter(expires_at__lt=now), batch_size)
+    retention = timedelta(seconds=getattr(settings, 'USER_SESSION_RETENTION', 7 * 24 * 3600))
+    _delete_in_batches(UserSession.objects.purgeable(retention), batch_size)
+    token_blacklist.compact()
+
+
+def _delete_in_batches(queryset, batch_size):
+    """Delete the rows of ``queryset`` in short transactions of ``batch_size`` rows"""
+    model = queryset.model
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        # Blacklisted tokens cascade from their outstanding token
+        model.objects.filter(pk__in=pks).delete()
+
+
+@shared_task(ignore_result=True)
+def expire_role_assignments(batch_size=500):
+    """Deactivate role assignments past their expires_at"""
+    stats = UserRole.objects.expire_due(batch_size=batch_size)
+    cache.set(ROLE_EXPIRY_STATS_KEY, stats, None)
+    if stats['expired']:
+        logger.info(
+            'Expired %s role assignments in %s batches (%.1f rows/s, max lag %.1fs)',
+            stats['expired'], stats['batches'], stats['rows_per_second'], stats['max_lag_seconds'],
+        )
+    return stats
+
+
+@shared_task(ignore_result=True)
+def run_bulk_role_assignment(job_id, role_id, user_ids, action, actor_id, reason=''):
+    """Run a bulk role assignment queued by the bulk-assign endpoint, recording progress on the job"""
+    job = BulkRoleJob(job_id)
+    job.update(status='running', started_at=timezone.now().isoformat())
+    try:
+        role = Role.objects.get(pk=role_id)
+        actor = User.objects.filter(pk=actor_id).first()
+        result = bulk_role_assignment(role, user_ids, action, actor, reason=reason, progress=job.progress)
+    except ValidationError as e:
+        job.update(status='failed', error=' '.join(e.messages), finished_at=timezone.now().isoformat())
+        return
+    except Exception as e:
+        logger.exception('Bulk role assignment job %s failed', job_id)
+        job.update(status='failed', error=str(e), finished_at=timezone.now().isoformat())
+        return
+    job.update(
+        status='completed', processed=result['matched'], total=result['matched'],
+        result=result, finished_at=timezone.now().isoformat(),
+    )
+
+
+@shared_task(ignore_result=True)
+def run_user_import(job_id, upload_name, file_format, actor_id, dry_run=False):
+    """
+    Run a user import queued by the import endpoint, recording its report on
+    the job. The uploaded file is read from the import storage and deleted
+    afterwards.
+    """
+    job = UserImportJob(job_id)
+    job.update(status='running', started_at=timezone.now().isoformat())
+    storage = upload_storage()
+    try:
+        actor = User.objects.get(pk=actor_id)
+        with storage.open(upload_name, 'rb') as upload:
+            rows = read_rows(upload, file_format)
+        report = UserImport(rows, actor, dry_run=dry_run, hash_workers=settings.USER_IMPORT_HASH_WORKERS).run()
+    except ImportFileError as e:
+        job.update(status='failed', error=str(e), finished_at=timezone.now().isoformat())
+        return
+    except ValidationError as e:
+        # A role filled up between validation and insert; nothing was created
+        job.update(status='failed', error=' '.join(e.messages), finished_at=timezone.now().isoformat())
+        return
+    except Exception as e:
+        logger.exception('User import job %s failed', job_id)
+        job.update(status='failed', error=str(e), finished_at=timezone.now().isoformat())
+        return
+    finally:
+        storage.delete(upload_name)
+    job.update(status='completed', result=report, finished_at=timezone.now().isoformat())
+
+
+@shared_task(ignore_result=True)
+def reconcile_role_assignment_counts():
+    """Repair drift of Role.active_assignments (e.g. from user_roles rows changed outside the ORM)"""
+    Role.objects.reconcile_assignment_counts()
+
+
+@shared_task(ignore_result=True)
+def refresh_group_members(group_ids, batch_size=500):
+    """
+    Re-materialize the effective permissions of the members of edited groups,
+    ``batch_size`` users per transaction. Their cached masks were already
+    invalidated by the group version bump.
+    """
+    user_ids = sorted(EffectivePermission.objects.users_of_groups(group_ids))
+    for start in range(0, len(user_ids), batch_size):
+        with transaction.atomic():
+            EffectivePermission.objects.refresh_users(user_ids[start:start + batch_size], bump=False)
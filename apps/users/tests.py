@@ -1,3 +1,1806 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.contrib.admin import site as admin_site
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.utils import ConnectionHandler
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from apps.common.models import District, Thana
+from apps.common.pagination import KeysetPagination
+from apps.common.utils import get_client_ip
+from .admin import UserRoleInline
+from .authentication import CachedJWTAuthentication, PrincipalCache, principal_cache
+from .blacklist import BloomFilter, TokenBlacklist
+from .hashing import RELEASE_SLOT_SCRIPT, HashingCapacityExceeded, PasswordHashLimiter, password_hash_limiter
+from .imports import UserImport, hash_passwords
+from .lockout import login_attempts
+from .models import User, Role, UserRole, UserSession, EffectivePermission
+from .rbac_catalog import rbac_catalog
+from .search import UserSearchBackend, UserSearchFilter
+from .serializers import UserSerializer
+from .services import bulk_assign_role
+from .tasks import ROLE_EXPIRY_STATS_KEY, expire_role_assignments, flush_login_failures, run_user_import
+from .token_verifier import TokenVerificationError, TokenVerifier
+from .tokens import TOKEN_GENERATION_KEY, bump_token_generation, is_current_generation
+from .token_permissions import USER_MASK_KEY, current_version, has_all
+
+
+BENCHMARK_PASSWORD = 'Bench!mark-pass1'
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def load_baseline():
+    try:
+        with open(settings.AUTH_BENCHMARK_BASELINE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(results):
+    """Merge ``results`` into the baseline file when AUTH_BENCHMARK_UPDATE_BASELINE is set"""
+    if not getattr(settings, 'AUTH_BENCHMARK_UPDATE_BASELINE', False) or not results:
+        return
+    baseline = load_baseline()
+    baseline.update(results)
+    path = settings.AUTH_BENCHMARK_BASELINE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+class AuthEndpointBenchmark(TestCase):
+    """
+    In-process benchmarks of the authentication endpoints.
+
+    Each endpoint is driven through the test client against a seeded set of
+    users and roles, recording latency percentiles, SQL query counts and
+    response sizes. Results are compared with the JSON baseline: a run fails
+    when an endpoint issues more queries than its baseline. Latency depends on
+    the machine, so the p95 budget (baseline x AUTH_BENCHMARK_LATENCY_TOLERANCE)
+    is only enforced with AUTH_BENCHMARK_ENFORCE_LATENCY=True, e.g. on a
+    dedicated benchmark runner. Set AUTH_BENCHMARK_UPDATE_BASELINE=True to
+    rewrite the baseline.
+
+        python manage.py test apps.users --settings=config.settings.testing
+    """
+
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        user_count = getattr(settings, 'AUTH_BENCHMARK_USERS', 50)
+        role_count = getattr(settings, 'AUTH_BENCHMARK_ROLES', 10)
+
+        district = District.objects.create(name='Dhaka', code='DHA')
+        thanas = [Thana.objects.create(name=f'Thana {i}', code=f'T{i}', district=district) for i in range(5)]
+
+        permissions = list(Permission.objects.order_by('id'))
+        roles = []
+        for i in range(role_count):
+            role = Role.objects.create(name=f'bench_role_{i}', display_name=f'Bench Role {i}')
+            role.set_permissions(permissions[i::role_count])
+            roles.append(role)
+
+        password = make_password(BENCHMARK_PASSWORD)
+        cls.users = User.objects.bulk_create([
+            User(
+                login_id=f'bench{i}',
+                username=f'bench{i}',
+                email=f'bench{i}@example.com',
+                mobile=f'+88017{i:08d}',
+                name=f'Bench User {i}',
+                user_type='admin',
+                password=password,
+                district=district,
+                thana=thanas[i % len(thanas)],
+            )
+            for i in range(user_count)
+        ])
+        assigner = cls.users[0]
+        for i, user in enumerate(cls.users):
+            for role in roles[i % role_count:i % role_count + 2]:
+                UserRole.objects.create(user=user, role=role, assigned_by=assigner)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        save_baseline(cls.results)
+
+    @classmethod
+    def load_baseline(cls):
+        return load_baseline()
+
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+        self.iterations = getattr(settings, 'AUTH_BENCHMARK_ITERATIONS', 50)
+
+    def login(self, user):
+        response = self.client.post(
+            reverse('users:auth-login'),
+            {'login_id': user.login_id, 'password': BENCHMARK_PASSWORD},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['data']['tokens']
+
+    def auth_headers(self, tokens):
+        return {'HTTP_AUTHORIZATION': f"Bearer {tokens['access']}"}
+
+    def measure(self, name, request, prepare=None, expected_status=200):
+        """
+        Call ``request(state)`` once per iteration (``state`` from the untimed
+        ``prepare(i)``), then record and check the endpoint's numbers.
+        """
+        latencies, query_counts, sizes = [], [], []
+        for i in range(self.iterations):
+            state = prepare(i) if prepare else i
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = request(state)
+                latencies.append((time.perf_counter() - started) * 1000)
+            self.assertEqual(response.status_code, expected_status, response.content)
+            query_counts.append(len(queries))
+            sizes.append(len(response.content))
+
+        result = {
+            'iterations': self.iterations,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'queries': max(query_counts),
+            'bytes': round(statistics.mean(sizes)),
+        }
+        type(self).results[name] = result
+        self.check_budget(name, result)
+        return result
+
+    def check_budget(self, name, result):
+        if getattr(settings, 'AUTH_BENCHMARK_UPDATE_BASELINE', False):
+            return
+        budget = self.load_baseline().get(name)
+        if budget is None:
+            return
+        self.assertLessEqual(
+            result['queries'], budget['queries'],
+            f"{name}: {result['queries']} queries, budget is {budget['queries']}",
+        )
+        if not getattr(settings, 'AUTH_BENCHMARK_ENFORCE_LATENCY', False):
+            return
+        tolerance = getattr(settings, 'AUTH_BENCHMARK_LATENCY_TOLERANCE', 2.0)
+        self.assertLessEqual(
+            result['p95_ms'], budget['p95_ms'] * tolerance,
+            f"{name}: p95 {result['p95_ms']}ms, budget is {budget['p95_ms']}ms x {tolerance}",
+        )
+
+    def test_login(self):
+        users = self.users
+
+        def request(i):
+            user = users[i % len(users)]
+            return self.client.post(
+                reverse('users:auth-login'),
+                {'login_id': user.login_id, 'password': BENCHMARK_PASSWORD},
+                content_type='application/json',
+            )
+
+        self.measure('login', request)
+
+    def test_token_refresh(self):
+        tokens = self.login(self.users[1])
+
+        def request(i):
+            response = self.client.post(
+                reverse('users:auth-refresh'), {'refresh_token': tokens['refresh']}, content_type='application/json'
+            )
+            if response.status_code == 200:
+                tokens['refresh'] = response.json()['data']['tokens']['refresh']
+            return response
+
+        self.measure('token_refresh', request)
+
+    def test_verify_token(self):
+        headers = self.auth_headers(self.login(self.users[2]))
+        self.measure('verify_token', lambda i: self.client.post(reverse('users:auth-verify'), **headers))
+
+    def test_logout(self):
+        users = self.users
+
+        def prepare(i):
+            return self.login(users[i % len(users)])
+
+        def request(tokens):
+            return self.client.post(
+                reverse('users:auth-logout'),
+                {'refresh_token': tokens['refresh']},
+                content_type='application/json',
+                **self.auth_headers(tokens),
+            )
+
+        self.measure('logout', request, prepare=prepare)
+
+    def test_user_profile(self):
+        headers = self.auth_headers(self.login(self.users[3]))
+        self.measure('user_profile', lambda i: self.client.get(reverse('users:user-profile'), **headers))
+
+
+class PermissionCheckBenchmark(TestCase):
+    """
+    Microbenchmark of permission checks: codename lists built from the role,
+    group and direct permission relations (the previous path) against the
+    cached permission bitmask.
+    """
+
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        permissions = list(Permission.objects.order_by('id'))
+        cls.user = User.objects.create_user(
+            login_id='permbench', email='permbench@example.com', password=BENCHMARK_PASSWORD,
+            name='Permission Bench', user_type='admin', mobile='+8801700000001',
+        )
+        for i in range(5):
+            role = Role.objects.create(name=f'perm_bench_{i}', display_name=f'Perm Bench {i}')
+            role.set_permissions(permissions[i::5][:10])
+            UserRole.objects.create(user=cls.user, role=role, assigned_by=cls.user)
+        cls.user.user_permissions.add(*permissions[-3:])
+        cls.codenames = [permission.codename for permission in permissions[::3]]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        save_baseline(cls.results)
+
+    def setUp(self):
+        cache.clear()
+
+    def codename_list_permissions(self, user):
+        """The relation-walking computation get_all_permissions() used before"""
+        granted = set()
+        for user_role in user.user_roles.all():
+            if user_role.is_active:
+                granted.update(p.codename for p in user_role.role.django_group.permissions.all())
+        for group in user.groups.all():
+            granted.update(p.codename for p in group.permissions.all())
+        granted.update(p.codename for p in user.user_permissions.all())
+        return list(granted)
+
+    def time_per_check(self, check):
+        iterations = getattr(settings, 'AUTH_BENCHMARK_ITERATIONS', 50) * 20
+        started = time.perf_counter()
+        for i in range(iterations):
+            check(self.codenames[i % len(self.codenames)])
+        return (time.perf_counter() - started) / iterations * 1000000
+
+    def test_bitmask_matches_and_beats_codename_lists(self):
+        user = User.objects.prefetch_related(
+            'user_roles__role__django_group__permissions', 'groups__permissions', 'user_permissions'
+        ).get(pk=self.user.pk)
+        expected = set(self.codename_list_permissions(user))
+        self.assertEqual(set(user.get_all_permissions()), expected)
+        for codename in self.codenames:
+            self.assertEqual(user.has_permission(codename), codename in expected)
+
+        list_us = self.time_per_check(lambda codename: codename in self.codename_list_permissions(user))
+        with CaptureQueriesContext(connection) as queries:
+            mask_us = self.time_per_check(lambda codename: user.has_permission(codename))
+        mask = user.permission_mask
+        and_us = self.time_per_check(lambda codename: has_all(mask, [codename]))
+
+        self.assertEqual(len(queries), 0)
+        if getattr(settings, 'AUTH_BENCHMARK_ENFORCE_LATENCY', False):
+            self.assertLess(mask_us, list_us)
+        type(self).results['permission_check'] = {
+            'codename_list_us': round(list_us, 3),
+            'bitmask_us': round(mask_us, 3),
+            'bitmask_and_us': round(and_us, 3),
+        }
+
+
+class UserDirectoryQueryCountTest(TestCase):
+    """Serializing a page of the user directory costs the same queries for 20 or 1000 users"""
+
+    @classmethod
+    def setUpTestData(cls):
+        districts = [District.objects.create(name=f'District {i}', code=f'D{i}') for i in range(3)]
+        thanas = [
+            Thana.objects.create(name=f'Thana {i}', code=f'DT{i}', district=districts[i % len(districts)])
+            for i in range(9)
+        ]
+        permissions = list(Permission.objects.order_by('id'))
+        roles = []
+        for i in range(4):
+            role = Role.objects.create(name=f'directory_role_{i}', display_name=f'Directory Role {i}')
+            role.set_permissions(permissions[i::4][:5])
+            roles.append(role)
+
+        users = User.objects.bulk_create([
+            User(
+                login_id=f'directory{i}',
+                username=f'directory{i}',
+                email=f'directory{i}@example.com',
+                mobile=f'+88018{i:08d}',
+                name=f'Directory User {i}',
+                user_type='field_staff',
+                password='!',
+                district=thanas[i % len(thanas)].district,
+                thana=thanas[i % len(thanas)],
+            )
+            for i in range(1000)
+        ])
+        UserRole.objects.bulk_create([
+            UserRole(user=user, role=roles[i % len(roles)], assigned_by=users[0])
+            for i, user in enumerate(users)
+        ])
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=user.pk, group_id=roles[i % len(roles)].django_group_id)
+            for i, user in enumerate(users)
+        ])
+        EffectivePermission.objects.refresh_users([user.pk for user in users], bump=False)
+
+    def serialize(self, count):
+        users = User.objects.filter(login_id__startswith='directory').order_by('login_id')[:count]
+        with CaptureQueriesContext(connection) as queries:
+            data = UserSerializer(users, many=True).data
+        self.assertEqual(len(data), count)
+        self.assertTrue(all(row['roles'] and row['permissions'] and row['thana_info'] for row in data))
+        return len(queries)
+
+    def test_query_count_is_constant(self):
+        page = self.serialize(20)
+        self.assertLessEqual(page, 6)
+        self.assertEqual(self.serialize(1000), page)
+
+
+class UserImportTest(TestCase):
+    """Bulk import validates in set-based passes and reports rejected rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            login_id='importadmin', email='importadmin@example.com', password=BENCHMARK_PASSWORD,
+            name='Import Admin', user_type='super_admin', mobile='+8801700000002',
+        )
+        district = District.objects.create(name='Dhaka', code='DHK')
+        Thana.objects.create(name='Mirpur', code='MRP', district=district)
+        cls.role = Role.objects.create(name='import_clerk', display_name='Import Clerk')
+        cls.role.set_permissions(list(Permission.objects.order_by('id')[:3]))
+
+    def rows(self, count, start=0):
+        return [
+            {
+                'login_id': f'import{i}', 'email': f'import{i}@example.com', 'mobile': f'+88019{i:08d}',
+                'user_type': 'field_staff', 'name': f'Import User {i}', 'password': BENCHMARK_PASSWORD if i % 2 else '',
+                'district': 'DHK', 'thana': 'Mirpur', 'roles': 'import_clerk',
+            }
+            for i in range(start, start + count)
+        ]
+
+    def validation_queries(self, rows):
+        with CaptureQueriesContext(connection) as queries:
+            UserImport(rows, self.admin, dry_run=True).validate()
+        return len(queries)
+
+    def test_validation_query_count_is_constant(self):
+        self.assertEqual(self.validation_queries(self.rows(500)), self.validation_queries(self.rows(5)))
+
+    def test_hash_passwords_in_a_process_pool_keeps_row_order(self):
+        passwords = [f'pool-password-{i}' for i in range(6)]
+        hashes = hash_passwords(passwords, workers=2)
+        self.assertEqual(len(hashes), len(passwords))
+        for password, encoded in zip(passwords, hashes):
+            self.assertTrue(check_password(password, encoded))
+
+    def test_import_creates_users_and_role_links(self):
+        rows = self.rows(20) + [
+            dict(self.rows(1)[0], email='other@example.com'),  # duplicate login_id in the file
+            dict(self.rows(1, start=20)[0], login_id='importadmin'),  # existing login_id
+            dict(self.rows(1, start=21)[0], thana='Nowhere', user_type='nope'),
+        ]
+        report = UserImport(rows, self.admin).run()
+
+        self.assertEqual((report['created'], report['failed']), (19, 4))
+        self.assertEqual([error['row'] for error in report['errors']], [1, 21, 22, 23])
+        self.assertIn('user_type', report['errors'][-1]['errors'])
+        created = User.objects.filter(login_id__startswith='import').exclude(pk=self.admin.pk)
+        self.assertEqual(created.count(), 19)
+        self.assertEqual(UserRole.objects.filter(role=self.role, user__in=created).count(), 19)
+        self.assertTrue(created.get(login_id='import3').check_password(BENCHMARK_PASSWORD))
+        self.assertFalse(created.get(login_id='import2').has_usable_password())
+        self.assertEqual(created.get(login_id='import2').thana.code, 'MRP')
+        self.assertTrue(EffectivePermission.objects.filter(user__login_id='import2').exists())
+
+    def test_unique_conflict_at_insert_is_reported_per_row(self):
+        user_import = UserImport(self.rows(4), self.admin)
+        self.assertTrue(user_import.validate())
+        # Taken by someone else between validation and insert
+        User.objects.create_user(
+            login_id='import2', email='elsewhere@example.com', password=BENCHMARK_PASSWORD,
+            name='Concurrent', user_type='field_staff', mobile='+8801700000003',
+        )
+        user_import.save()
+        report = user_import.report()
+
+        self.assertEqual((report['created'], report['failed']), (3, 1))
+        self.assertEqual(report['errors'][0]['row'], 3)
+        self.assertIn('non_field_errors', report['errors'][0]['errors'])
+        self.assertEqual(User.objects.get(login_id='import2').name, 'Concurrent')
+        self.assertEqual(
+            set(UserRole.objects.filter(role=self.role).values_list('user__login_id', flat=True)),
+            {'import0', 'import1', 'import3'},
+        )
+
+    def test_password_hash_column(self):
+        encoded = make_password(BENCHMARK_PASSWORD)
+        rows = self.rows(3)
+        rows[0].update(password='', password_hash=encoded)
+        rows[1]['password_hash'] = encoded  # with a password as well
+        rows[2].update(password='', password_hash='not-a-hash')
+        report = UserImport(rows, self.admin).run()
+
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3])
+        self.assertIn('password_hash', report['errors'][1]['errors'])
+        user = User.objects.get(login_id='import0')
+        self.assertEqual(user.password, encoded)
+        self.assertTrue(user.check_password(BENCHMARK_PASSWORD))
+
+
+class PrincipalCacheTest(TestCase):
+    """The two-tier principal cache hands out private copies and honours invalidations"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            login_id='principal', email='principal@example.com', password=BENCHMARK_PASSWORD,
+            name='Principal', user_type='admin', mobile='+8801700000003',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_every_path_returns_a_private_copy(self):
+        worker = PrincipalCache()
+        user = User.objects.get(pk=self.user.pk)
+        from_set = worker.set(user)
+        from_local = worker.get(str(user.pk))
+        other = PrincipalCache()
+        from_shared = other.get(str(user.pk))
+        from_shared_local = other.get(str(user.pk))
+
+        copies = [from_set, from_local, from_shared, from_shared_local]
+        self.assertEqual(len({id(copy) for copy in copies}), len(copies))
+        from_local.name = 'Changed'
+        from_shared._prefetched_objects_cache = {'user_roles': []}
+        self.assertEqual(worker.get(str(user.pk)).name, 'Principal')
+        self.assertNotIn('_prefetched_objects_cache', other.get(str(user.pk)).__dict__)
+
+    def test_invalidation_reaches_other_processes(self):
+        worker_a, worker_b = PrincipalCache(), PrincipalCache()
+        worker_a.set(User.objects.get(pk=self.user.pk))
+        self.assertIsNotNone(worker_a.get(str(self.user.pk)))
+
+        worker_b.invalidate(self.user.pk)
+
+        self.assertIsNone(worker_a.get(str(self.user.pk)))
+
+    def test_entry_loaded_before_an_invalidation_is_not_trusted(self):
+        worker = PrincipalCache()
+        stamp = worker.stamp(str(self.user.pk))
+        loaded = User.objects.get(pk=self.user.pk)
+        worker.invalidate(self.user.pk)  # the row changed while it was being loaded
+        worker.set(loaded, stamp=stamp)
+
+        self.assertIsNone(worker.get(str(self.user.pk)))
+
+
+def create_user(login_id, user_type='admin', **extra):
+    """A user with BENCHMARK_PASSWORD and a unique mobile derived from the login id"""
+    return User.objects.create_user(
+        login_id=login_id, email=f'{login_id}@example.com', password=BENCHMARK_PASSWORD,
+        name=login_id.title(), user_type=user_type,
+        mobile=extra.pop('mobile', f'+88016{zlib.crc32(login_id.encode()) % 100000000:08d}'), **extra,
+    )
+
+
+class AuthClientMixin:
+    """Log in through the API and authenticate later requests with the access token"""
+
+    def login(self, user, **extra):
+        response = self.client.post(
+            reverse('users:auth-login'),
+            {'login_id': user.login_id, 'password': BENCHMARK_PASSWORD, **extra},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['data']['tokens']
+
+    def auth_headers(self, tokens):
+        return {'HTTP_AUTHORIZATION': f"Bearer {tokens['access']}"}
+
+    def refresh(self, refresh_token):
+        return self.client.post(
+            reverse('users:auth-refresh'), {'refresh_token': refresh_token}, content_type='application/json'
+        )
+
+
+class UserSessionTest(AuthClientMixin, TestCase):
+    """Per-device sessions: rotation on refresh, revocation by sid or for all devices"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('sessionuser')
+
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+
+    def test_login_opens_a_session_per_device(self):
+        first, second = self.login(self.user), self.login(self.user)
+        self.assertNotEqual(first['refresh'], second['refresh'])
+        self.assertEqual(UserSession.objects.active().filter(user=self.user).count(), 2)
+
+    def test_refresh_rotates_and_rejects_replay(self):
+        tokens = self.login(self.user)
+        session = UserSession.objects.get(user=self.user)
+
+        response = self.refresh(tokens['refresh'])
+        self.assertEqual(response.status_code, 200, response.content)
+        session.refresh_from_db()
+        self.assertIsNotNone(session.last_refreshed_at)
+
+        replayed = self.refresh(tokens['refresh'])
+        self.assertNotEqual(replayed.status_code, 200)
+        self.assertEqual(UserSession.objects.filter(user=self.user).count(), 1)
+
+    def test_logout_revokes_only_the_session_of_the_access_token(self):
+        phone, laptop = self.login(self.user), self.login(self.user)
+
+        response = self.client.post(reverse('users:auth-logout'), {}, content_type='application/json', **self.auth_headers(phone))
+        self.assertEqual(response.status_code, 200, response.content)
+
+        self.assertEqual(self.client.get(reverse('users:user-profile'), **self.auth_headers(phone)).status_code, 401)
+        self.assertEqual(self.client.get(reverse('users:user-profile'), **self.auth_headers(laptop)).status_code, 200)
+        self.assertNotEqual(self.refresh(phone['refresh']).status_code, 200)
+        self.assertEqual(UserSession.objects.active().filter(user=self.user).count(), 1)
+
+    def test_logout_all_devices_revokes_every_token(self):
+        phone, laptop = self.login(self.user), self.login(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('users:auth-logout'), {'logout_all_devices': True}, content_type='application/json',
+                **self.auth_headers(phone),
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+
+        for tokens in (phone, laptop):
+            self.assertEqual(self.client.get(reverse('users:user-profile'), **self.auth_headers(tokens)).status_code, 401)
+            self.assertNotEqual(self.refresh(tokens['refresh']).status_code, 200)
+        self.assertFalse(UserSession.objects.active().filter(user=self.user).exists())
+
+
+class LoginLockoutTest(AuthClientMixin, TestCase):
+    """Cache-backed lockout counters, flushed to the users rows in batches"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('lockoutuser')
+
+    def setUp(self):
+        cache.clear()
+
+    def fail_login(self):
+        return self.client.post(
+            reverse('users:auth-login'), {'login_id': self.user.login_id, 'password': 'wrong-password'},
+            content_type='application/json',
+        )
+
+    def test_lockout_rejects_the_correct_password(self):
+        for _ in range(settings.LOGIN_MAX_FAILED_ATTEMPTS):
+            self.assertNotEqual(self.fail_login().status_code, 200)
+        response = self.client.post(
+            reverse('users:auth-login'), {'login_id': self.user.login_id, 'password': BENCHMARK_PASSWORD},
+            content_type='application/json',
+        )
+        self.assertNotEqual(response.status_code, 200)
+        self.assertIsNotNone(login_attempts.blocked_until(self.user.login_id))
+
+    def test_failures_are_buffered_and_flushed_in_one_update(self):
+        other = create_user('lockoutother')
+        with CaptureQueriesContext(connection) as queries:
+            for user in (self.user, self.user, other):
+                login_attempts.register_failure(user.login_id, '10.0.0.1', user=user)
+        self.assertEqual(len(queries), 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_login_failures(), 2)
+        self.assertEqual(len(queries), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.failed_login_attempts, 2)
+        # Drained: a second run has nothing to write
+        self.assertEqual(flush_login_failures(), 0)
+
+    def test_successful_login_discards_unflushed_failures(self):
+        self.fail_login()
+        self.login(self.user)
+        flush_login_failures()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.failed_login_attempts, 0)
+
+    def test_client_ip_trusts_real_ip_only_from_proxies(self):
+        factory = RequestFactory()
+        proxied = factory.get('/', REMOTE_ADDR='127.0.0.1', HTTP_X_REAL_IP='198.51.100.4')
+        self.assertEqual(get_client_ip(proxied), '198.51.100.4')
+        direct = factory.get('/', REMOTE_ADDR='203.0.113.9', HTTP_X_REAL_IP='198.51.100.4')
+        self.assertEqual(get_client_ip(direct), '203.0.113.9')
+        invalid = factory.get('/', REMOTE_ADDR='127.0.0.1', HTTP_X_REAL_IP="1.2.3.4' OR 1=1")
+        self.assertEqual(get_client_ip(invalid), '127.0.0.1')
+        with self.settings(TRUSTED_PROXIES=['172.16.0.0/12']):
+            self.assertEqual(get_client_ip(factory.get('/', REMOTE_ADDR='172.18.0.5', HTTP_X_REAL_IP='::1')), '::1')
+            self.assertEqual(get_client_ip(proxied), '127.0.0.1')
+
+    def test_spoofed_real_ip_does_not_evade_the_ip_limit(self):
+        with self.settings(LOGIN_MAX_FAILED_ATTEMPTS_PER_IP=3):
+            for i in range(3):
+                self.client.post(
+                    reverse('users:auth-login'), {'login_id': f'nobody{i}', 'password': 'wrong-password'},
+                    content_type='application/json', REMOTE_ADDR='203.0.113.7', HTTP_X_REAL_IP=f'10.0.0.{i}',
+                )
+        self.assertIsNotNone(login_attempts.blocked_until('someone-else', '203.0.113.7'))
+
+    def test_invalid_real_ip_is_not_stored_on_the_session(self):
+        response = self.client.post(
+            reverse('users:auth-login'), {'login_id': self.user.login_id, 'password': BENCHMARK_PASSWORD},
+            content_type='application/json', HTTP_X_REAL_IP='not-an-ip',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(UserSession.objects.get(user=self.user).ip_address, '127.0.0.1')
+
+
+class PasswordHashLimiterTest(AuthClientMixin, TestCase):
+    """Hashing slots are shared by every process; logins beyond them are shed with 503"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('hashlimited')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_login_is_shed_when_every_slot_is_taken(self):
+        # Slots held by other worker processes
+        holders = [PasswordHashLimiter(concurrency=password_hash_limiter.concurrency)
+                   for _ in range(password_hash_limiter.concurrency)]
+        leases = [holder._acquire() for holder in holders]
+        self.assertTrue(all(leases))
+
+        response = self.client.post(
+            reverse('users:auth-login'), {'login_id': self.user.login_id, 'password': BENCHMARK_PASSWORD},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+        holders[0]._release(*leases[0])
+        self.login(self.user)
+
+    def test_slot_is_released_after_the_hash(self):
+        limiter = PasswordHashLimiter(concurrency=1)
+        self.assertTrue(limiter.check_password(self.user, BENCHMARK_PASSWORD))
+        self.assertTrue(limiter.check_password(self.user, BENCHMARK_PASSWORD))
+
+    def test_expired_lease_is_not_released_by_its_former_holder(self):
+        limiter = PasswordHashLimiter(concurrency=1)
+        key, token = limiter._acquire()
+        cache.set(key, 'next-holder', 5)  # the lease ran out and another worker took the slot
+        limiter._release(key, token)
+        self.assertEqual(cache.get(key), 'next-holder')
+
+    def test_redis_release_is_an_atomic_compare_and_delete(self):
+        limiter = PasswordHashLimiter(concurrency=1)
+        client = mock.Mock()
+        with mock.patch.object(limiter, '_redis', return_value=client), \
+                mock.patch.object(cache, 'client', create=True) as cache_client:
+            cache_client.encode.side_effect = lambda value: f'encoded:{value}'.encode()
+            limiter._release('users:hash_slot:0', 'token')
+        client.eval.assert_called_once_with(
+            RELEASE_SLOT_SCRIPT, 1, cache.make_key('users:hash_slot:0'), b'encoded:token',
+        )
+
+    def test_queued_request_is_admitted_when_a_slot_frees(self):
+        holder = PasswordHashLimiter(concurrency=1)
+        lease = holder._acquire()
+        limiter = PasswordHashLimiter(concurrency=1, queue_timeout=2)
+        releaser = threading.Timer(0.1, holder._release, lease)
+        releaser.start()
+        try:
+            self.assertTrue(limiter.check_password(self.user, BENCHMARK_PASSWORD))
+        finally:
+            releaser.join()
+        wait = limiter.stats()['queue_wait_seconds']
+        self.assertEqual(wait['count'], 1)
+        self.assertGreaterEqual(wait['sum'], 0.05)
+
+    def test_stats_are_shared_by_every_process(self):
+        # Two worker processes
+        first = PasswordHashLimiter(concurrency=1, queue_timeout=0)
+        second = PasswordHashLimiter(concurrency=1, queue_timeout=0)
+        self.assertTrue(first.check_password(self.user, BENCHMARK_PASSWORD))
+        with first.slot():
+            with self.assertRaises(HashingCapacityExceeded):
+                second.check_password(self.user, BENCHMARK_PASSWORD)
+        stats = second.stats()
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['queue_wait_seconds']['count'], 3)
+        self.assertEqual(stats['hash_duration_seconds']['count'], 1)
+
+
+class CredentialLookupTest(TestCase):
+    """Login lookup by login_id or email, case-insensitively, in one query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('LookupUser')
+
+    def test_login_id_or_email_in_any_case(self):
+        for identifier in ('LookupUser', 'lookupuser', ' LOOKUPUSER ', 'LookupUser@example.com', 'lookupuser@EXAMPLE.com'):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(User.objects.get_for_login(identifier), self.user)
+            self.assertEqual(len(queries), 1, identifier)
+
+    def test_inactive_and_unknown_users_are_not_found(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        for identifier in ('lookupuser', 'nobody'):
+            with self.assertRaises(User.DoesNotExist):
+                User.objects.get_for_login(identifier)
+
+    def test_case_variants_only_match_exactly(self):
+        variant = create_user('lookupuser')
+        self.assertEqual(User.objects.get_for_login('lookupuser'), variant)
+        self.assertEqual(User.objects.get_for_login('LookupUser'), self.user)
+        with self.assertRaises(User.DoesNotExist):
+            User.objects.get_for_login('LOOKUPUSER')
+
+
+class TokenPermissionViewTest(AuthClientMixin, TestCase):
+    """RBAC writes need an admin user type or the model permission in the token's permission claim"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.granted = create_user('rbacgranted', user_type='support_staff')
+        cls.plain = create_user('rbacplain', user_type='support_staff')
+        cls.admin = create_user('rbacadmin', user_type='admin')
+        cls.role = Role.objects.create(name='role_manager', display_name='Role Manager')
+        cls.role.set_permissions(list(Permission.objects.filter(codename__in=['add_role', 'change_role'])))
+        UserRole.objects.create(user=cls.granted, role=cls.role, assigned_by=cls.granted)
+
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+
+    def create_role(self, tokens, name):
+        return self.client.post(
+            reverse('users:role-list-create'), {'name': name, 'display_name': name.title()},
+            content_type='application/json', **self.auth_headers(tokens),
+        )
+
+    def test_token_without_the_permission_gets_403(self):
+        tokens = self.login(self.plain)
+        self.assertEqual(self.create_role(tokens, 'denied_role').status_code, 403)
+        self.assertEqual(self.client.get(reverse('users:role-list-create'), **self.auth_headers(tokens)).status_code, 200)
+
+    def test_token_with_the_permission_is_allowed(self):
+        tokens = self.login(self.granted)
+        response = self.create_role(tokens, 'granted_role')
+        self.assertEqual(response.status_code, 201, response.content)
+        role = Role.objects.get(name='granted_role')
+        denied = self.client.delete(reverse('users:role-detail', args=[role.pk]), **self.auth_headers(tokens))
+        self.assertEqual(denied.status_code, 403)
+
+    def test_admins_write_without_the_permission(self):
+        tokens = self.login(self.admin)
+        self.assertEqual(self.create_role(tokens, 'admin_role').status_code, 201)
+        for name in ('group-list-create', 'permission-category-list-create'):
+            response = self.client.post(
+                reverse(f'users:{name}'), {'name': f'admin_{name}', 'display_name': name},
+                content_type='application/json', **self.auth_headers(tokens),
+            )
+            self.assertEqual(response.status_code, 201, response.content)
+
+    def test_role_assignment_requires_an_assigner(self):
+        response = self.client.post(
+            reverse('users:role-assignment'),
+            {'user_id': str(self.plain.pk), 'role_id': str(self.role.pk), 'action': 'assign'},
+            content_type='application/json', **self.auth_headers(self.login(self.plain)),
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(UserRole.objects.filter(user=self.plain).exists())
+
+    def test_claim_issued_before_a_revocation_is_rejected(self):
+        tokens = self.login(self.granted)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.granted.revoke_role(self.role, revoked_by=self.granted)
+        response = self.create_role(tokens, 'stale_role')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Role.objects.filter(name='stale_role').exists())
+
+
+class TokenBlacklistTest(TestCase):
+    """Revocations shared through the cache log, answered from per-process bloom filters"""
+
+    def setUp(self):
+        cache.clear()
+        self.expires_at = timezone.now() + timedelta(minutes=5)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        values = [str(uuid.uuid4()) for _ in range(1000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+        false_positives = sum(str(uuid.uuid4()) in bloom for _ in range(2000))
+        self.assertLess(false_positives, 100)
+
+    def test_revocation_reaches_other_processes(self):
+        revoking, other = TokenBlacklist(), TokenBlacklist()
+        other.sync(force=True)
+        revoking.revoke('session-1', self.expires_at)
+
+        other.sync(force=True)
+        self.assertTrue(other.is_revoked('session-1'))
+        self.assertFalse(other.is_revoked('session-2'))
+        # A process started later replays the live log
+        self.assertTrue(TokenBlacklist().is_revoked('session-1'))
+
+    def test_unknown_ids_are_answered_without_a_cache_read(self):
+        blacklist = TokenBlacklist()
+        blacklist.sync(force=True)
+        with mock.patch.object(blacklist, 'sync'), mock.patch('apps.users.blacklist.cache') as shared:
+            self.assertFalse(blacklist.is_revoked('never-revoked'))
+        shared.get.assert_not_called()
+
+    def test_rotation_keeps_the_previous_generation(self):
+        blacklist = TokenBlacklist()
+        blacklist.revoke('session-1', self.expires_at)
+        period = blacklist.rotation_period
+
+        blacklist._rotated_at -= period
+        blacklist.revoke('session-2', self.expires_at)  # rotates: session-1 moves to the previous filter
+        self.assertTrue(blacklist._might_contain('session-1'))
+
+        blacklist._rotated_at -= period
+        blacklist.revoke('session-3', self.expires_at)  # rotates again: session-1 is dropped
+        self.assertFalse(blacklist._might_contain('session-1'))
+        self.assertTrue(blacklist._might_contain('session-2'))
+
+    def test_expired_revocations_are_compacted(self):
+        blacklist = TokenBlacklist()
+        blacklist.revoke('expired', self.expires_at)
+        blacklist.revoke('live', self.expires_at)
+        cache.delete(blacklist._log_key(1))  # the first entry's TTL ran out
+
+        self.assertEqual(blacklist.compact(), 1)
+        fresh = TokenBlacklist()
+        fresh.sync(force=True)
+        self.assertTrue(fresh._might_contain('live'))
+        self.assertFalse(fresh._might_contain('expired'))
+
+    def test_cache_flush_resets_the_local_filter(self):
+        blacklist = TokenBlacklist()
+        blacklist.revoke('session-1', self.expires_at)
+        blacklist.revoke('session-2', self.expires_at)
+        blacklist.sync(force=True)
+
+        cache.clear()
+        TokenBlacklist().revoke('session-3', self.expires_at)
+        blacklist.sync(force=True)
+
+        self.assertFalse(blacklist._might_contain('session-1'))
+        self.assertTrue(blacklist.is_revoked('session-3'))
+
+
+class TokenGenerationTest(TestCase):
+    """The cached token generation only moves forward and never runs ahead of the database"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('generationuser')
+
+    def setUp(self):
+        cache.clear()
+        self.key = TOKEN_GENERATION_KEY.format(self.user.pk)
+
+    def test_bump_publishes_the_new_generation_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            generation = bump_token_generation(self.user.pk)
+        self.assertEqual(generation, 1)
+        self.assertEqual(cache.get(self.key), 1)
+        self.assertFalse(is_current_generation(self.user.pk, 0))
+        self.assertTrue(is_current_generation(self.user.pk, 1))
+
+    def test_out_of_order_publication_keeps_the_newest_generation(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            bump_token_generation(self.user.pk)
+            bump_token_generation(self.user.pk)
+        for callback in reversed(callbacks):  # the second bump publishes first
+            callback()
+        self.assertEqual(cache.get(self.key), 2)
+
+    def test_rolled_back_bump_leaves_tokens_valid(self):
+        try:
+            with transaction.atomic():
+                bump_token_generation(self.user.pk)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertTrue(is_current_generation(self.user.pk, 0))
+
+    def test_cache_behind_the_database_is_settled_by_the_database(self):
+        User.objects.filter(pk=self.user.pk).update(token_generation=3)
+        cache.set(self.key, 2, None)
+        self.assertTrue(is_current_generation(self.user.pk, 3))
+        self.assertEqual(cache.get(self.key), 3)
+        self.assertFalse(is_current_generation(self.user.pk, 2))
+
+
+class TokenVerifierTest(TestCase):
+    """Keys the verifier cannot use are skipped instead of failing the whole key set"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        public_jwk = jwt.algorithms.RSAAlgorithm.to_jwk(cls.private_key.public_key(), as_dict=True)
+        cls.jwks = {'keys': [
+            {'kty': 'FOO', 'kid': 'unsupported'},
+            {'kty': 'EC', 'crv': 'P-999', 'x': 'AA', 'y': 'AA', 'kid': 'bad-curve'},
+            {**public_jwk, 'kid': 'good', 'alg': 'RS256', 'use': 'sig'},
+        ]}
+
+    def verifier(self):
+        response = mock.MagicMock()
+        response.__enter__.return_value = io.BytesIO(json.dumps(self.jwks).encode())
+        patcher = mock.patch('urllib.request.urlopen', return_value=response)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return TokenVerifier('https://auth.example.com/.well-known/jwks.json')
+
+    def token(self, kid):
+        payload = {'token_type': 'access', 'user_id': 1, 'exp': int(time.time()) + 60}
+        return jwt.encode(payload, self.private_key, algorithm='RS256', headers={'kid': kid})
+
+    def test_usable_key_verifies_next_to_unusable_ones(self):
+        claims = self.verifier().verify(self.token('good'))
+        self.assertEqual(claims['user_id'], 1)
+
+    def test_token_naming_an_unusable_key_is_rejected(self):
+        verifier = self.verifier()
+        for kid in ('unsupported', 'bad-curve'):
+            with self.assertRaises(TokenVerificationError):
+                verifier.verify(self.token(kid))
+
+
+class EffectivePermissionTest(TestCase):
+    """The materialized (user, codename) rows follow role, group and direct grants"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('effectiveuser')
+        cls.assigner = create_user('effectiveassigner', user_type='super_admin')
+        cls.add_role, cls.change_role, cls.delete_role = (
+            Permission.objects.get(codename=codename) for codename in ('add_role', 'change_role', 'delete_role')
+        )
+        cls.role = Role.objects.create(name='effective_role', display_name='Effective Role')
+        cls.role.set_permissions([cls.add_role, cls.change_role])
+
+    def codenames(self):
+        return set(EffectivePermission.objects.filter(user=self.user).values_list('codename', flat=True))
+
+    def test_role_assignment_and_revocation(self):
+        self.user.assign_role(self.role, assigned_by=self.assigner)
+        self.assertEqual(self.codenames(), {'add_role', 'change_role'})
+        self.user.revoke_role(self.role, revoked_by=self.assigner)
+        self.assertEqual(self.codenames(), set())
+
+    def test_direct_permissions_and_group_membership(self):
+        self.user.user_permissions.add(self.delete_role)
+        self.user.groups.add(self.role.django_group)
+        self.assertEqual(self.codenames(), {'add_role', 'change_role', 'delete_role'})
+        self.user.groups.clear()
+        self.assertEqual(self.codenames(), {'delete_role'})
+
+    def test_refresh_writes_only_changed_rows(self):
+        self.user.assign_role(self.role, assigned_by=self.assigner)
+        self.assertEqual(EffectivePermission.objects.refresh_users([self.user.pk]), (0, 0))
+        EffectivePermission.objects.filter(user=self.user, codename='add_role').delete()
+        EffectivePermission.objects.create(user=self.user, codename='stale_codename')
+        self.assertEqual(EffectivePermission.objects.refresh_users([self.user.pk]), (1, 1))
+        self.assertEqual(self.codenames(), {'add_role', 'change_role'})
+
+    def test_get_all_permissions_reuses_the_prefetch(self):
+        self.user.assign_role(self.role, assigned_by=self.assigner)
+        user = User.objects.prefetch_related('effective_permissions').get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(set(user.get_all_permissions()), {'add_role', 'change_role'})
+
+    def test_rebuild_command_repairs_drift(self):
+        self.user.assign_role(self.role, assigned_by=self.assigner)
+        EffectivePermission.objects.filter(user=self.user).delete()
+        EffectivePermission.objects.create(user=self.assigner, codename='stale_codename')
+        out = io.StringIO()
+        call_command('rebuild_effective_permissions', stdout=out)
+        self.assertEqual(self.codenames(), {'add_role', 'change_role'})
+        self.assertFalse(EffectivePermission.objects.filter(codename='stale_codename').exists())
+        self.assertIn('2 permissions added, 1 removed', out.getvalue())
+
+
+class RequestPermissionMaskTest(AuthClientMixin, TestCase):
+    """The authenticated principal reads its permission versions once per request"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('maskuser')
+        cls.assigner = create_user('maskassigner', user_type='super_admin')
+        cls.role = Role.objects.create(name='mask_role', display_name='Mask Role')
+        cls.role.set_permissions([Permission.objects.get(codename='add_role')])
+
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+
+    def authenticate(self):
+        request = RequestFactory().get('/', **self.auth_headers(self.login(self.user)))
+        user, _ = CachedJWTAuthentication().authenticate(request)
+        return user
+
+    def test_principal_mask_is_read_once_per_request(self):
+        self.user.assign_role(self.role, assigned_by=self.assigner)
+        user = self.authenticate()
+        self.assertTrue(user.has_permission('add_role'))
+        with mock.patch('apps.users.token_permissions.cache.get_many', wraps=cache.get_many) as get_many:
+            for _ in range(3):
+                self.assertTrue(user.has_permission('add_role'))
+                self.assertFalse(user.has_permission('delete_role'))
+        get_many.assert_not_called()
+
+    def test_next_request_sees_the_change(self):
+        user = self.authenticate()
+        self.assertFalse(user.has_permission('add_role'))
+        self.user.assign_role(self.role, assigned_by=self.assigner)
+        self.assertFalse(user.has_permission('add_role'))
+        self.assertTrue(self.authenticate().has_permission('add_role'))
+
+    def test_unpinned_users_recheck_their_versions(self):
+        user = User.objects.get(pk=self.user.pk)
+        self.assertFalse(user.has_permission('add_role'))
+        user.assign_role(self.role, assigned_by=self.assigner)
+        self.assertTrue(user.has_permission('add_role'))
+
+
+class RoleExpiryTest(TestCase):
+    """The sweeper deactivates due assignments in batches and drops their grants"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.assigner = create_user('expiryassigner', user_type='super_admin')
+        cls.role = Role.objects.create(name='expiry_role', display_name='Expiry Role')
+        cls.role.set_permissions([Permission.objects.get(codename='add_role')])
+        now = timezone.now()
+        cls.expired = [create_user(f'expired{i}') for i in range(3)]
+        cls.current = create_user('notexpired')
+        for i, user in enumerate(cls.expired):
+            user.assign_role(cls.role, assigned_by=cls.assigner, expires_at=now - timedelta(minutes=i + 1))
+        cls.current.assign_role(cls.role, assigned_by=cls.assigner, expires_at=now + timedelta(days=1))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_sweep_deactivates_due_assignments_in_batches(self):
+        stats = expire_role_assignments(batch_size=2)
+        self.assertEqual((stats['expired'], stats['batches']), (3, 2))
+        self.assertGreater(stats['max_lag_seconds'], 120)
+        self.assertEqual(cache.get(ROLE_EXPIRY_STATS_KEY), stats)
+
+        self.assertFalse(UserRole.objects.filter(user__in=self.expired, is_active=True).exists())
+        self.assertEqual(
+            set(UserRole.objects.filter(user__in=self.expired).values_list('revocation_reason', flat=True)),
+            {'Expired'},
+        )
+        self.role.refresh_from_db()
+        self.assertEqual(self.role.active_assignments, 1)
+
+    def test_sweep_removes_group_membership_and_permissions(self):
+        for user in self.expired + [self.current]:
+            self.assertTrue(User.objects.get(pk=user.pk).has_permission('add_role'))
+        expire_role_assignments()
+        group_members = set(self.role.django_group.user_set.values_list('pk', flat=True))
+        self.assertEqual(group_members, {self.current.pk})
+        for user in self.expired:
+            self.assertFalse(User.objects.get(pk=user.pk).has_permission('add_role'))
+            self.assertFalse(EffectivePermission.objects.filter(user=user).exists())
+        self.assertTrue(User.objects.get(pk=self.current.pk).has_permission('add_role'))
+
+    def test_nothing_due_is_a_no_op(self):
+        expire_role_assignments()
+        stats = expire_role_assignments()
+        self.assertEqual((stats['expired'], stats['batches']), (0, 0))
+
+
+class BulkRoleAssignmentViewTest(AuthClientMixin, TestCase):
+    """Bulk assignment validates its input and is limited to admins and role assigners"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('bulkadmin', user_type='super_admin')
+        cls.field = create_user('bulkfield', user_type='field_staff')
+        cls.lead = create_user('bulklead', user_type='support_staff')
+        cls.manager = Role.objects.create(name='bulk_manager', display_name='Bulk Manager', can_assign_roles=True)
+        cls.child = Role.objects.create(name='bulk_child', display_name='Bulk Child', parent=cls.manager)
+        cls.lead.assign_role(cls.manager, assigned_by=cls.admin)
+        cls.targets = [create_user(f'bulktarget{i}', user_type='field_staff') for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+
+    def post(self, user, role, user_ids):
+        return self.client.post(
+            reverse('users:bulk-role-assignment'),
+            {'user_ids': user_ids, 'role_id': str(role.pk), 'action': 'assign'},
+            content_type='application/json',
+            **self.auth_headers(self.login(user)),
+        )
+
+    @mock.patch('apps.users.views.run_bulk_role_assignment.delay')
+    def test_invalid_user_ids_are_rejected_before_queueing(self, delay):
+        with self.settings(BULK_ROLE_ASSIGNMENT_ASYNC_THRESHOLD=0):
+            response = self.post(self.admin, self.child, [str(self.targets[0].pk), 'not-a-uuid'])
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn('user_ids', response.json()['error'])
+        delay.assert_not_called()
+
+    def test_requires_admin_or_assigner_role(self):
+        response = self.post(self.field, self.child, [str(self.targets[0].pk)])
+        self.assertEqual(response.status_code, 403, response.content)
+
+    def test_assigner_role_holder_assigns_roles_below_theirs(self):
+        user_ids = [str(user.pk) for user in self.targets]
+        response = self.post(self.lead, self.child, user_ids + user_ids[:1])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(UserRole.objects.filter(role=self.child, is_active=True).count(), 3)
+        response = self.post(self.lead, self.manager, user_ids)
+        self.assertEqual(response.status_code, 404, response.content)
+
+
+class RoleUnitOfWorkTest(TestCase):
+    """Assignment changes inside a unit of work sync group membership once, on exit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.assigner = create_user('uowassigner', user_type='super_admin')
+        cls.users = [create_user(f'uowuser{i}') for i in range(3)]
+        cls.roles = [Role.objects.create(name=f'uow_role_{i}', display_name=f'UoW Role {i}') for i in range(2)]
+        for role, codename in zip(cls.roles, ('add_role', 'change_role')):
+            role.set_permissions([Permission.objects.get(codename=codename)])
+
+    def memberships(self):
+        return set(User.groups.through.objects.filter(
+            user_id__in=[user.pk for user in self.users]
+        ).values_list('user_id', 'group_id'))
+
+    def test_changes_are_synced_with_one_permission_refresh(self):
+        refresh = mock.patch.object(
+            EffectivePermission.objects, 'refresh_users', wraps=EffectivePermission.objects.refresh_users
+        )
+        with refresh as refresh_users:
+            with UserRole.objects.unit_of_work():
+                for user in self.users:
+                    for role in self.roles:
+                        user.assign_role(role, assigned_by=self.assigner)
+                with UserRole.objects.unit_of_work():  # joins the outer block
+                    self.users[0].revoke_role(self.roles[0], revoked_by=self.assigner)
+                self.assertEqual(self.memberships(), set())
+        self.assertEqual(refresh_users.call_count, 1)
+        expected = {(user.pk, role.django_group_id) for user in self.users for role in self.roles}
+        self.assertEqual(self.memberships(), expected - {(self.users[0].pk, self.roles[0].django_group_id)})
+        self.assertEqual(
+            set(EffectivePermission.objects.filter(user=self.users[0]).values_list('codename', flat=True)),
+            {'change_role'},
+        )
+
+    def test_assign_then_revoke_leaves_no_membership(self):
+        user, role = self.users[0], self.roles[0]
+        with UserRole.objects.unit_of_work():
+            user.assign_role(role, assigned_by=self.assigner)
+            user.revoke_role(role, revoked_by=self.assigner)
+        self.assertEqual(self.memberships(), set())
+        self.assertFalse(EffectivePermission.objects.filter(user=user).exists())
+
+    def test_sync_repairs_missing_and_surplus_rows(self):
+        user, role = self.users[0], self.roles[0]
+        user.assign_role(role, assigned_by=self.assigner)
+        pair = (user.pk, role.django_group_id)
+        other = (self.users[1].pk, role.django_group_id)
+        User.groups.through.objects.filter(user_id=user.pk).delete()
+        User.groups.through.objects.create(user_id=other[0], group_id=other[1])
+        self.assertEqual(UserRole.objects.sync_group_memberships([pair, other]), (1, 1))
+        self.assertEqual(self.memberships(), {pair})
+        self.assertEqual(UserRole.objects.sync_group_memberships([pair, other]), (0, 0))
+
+
+class AssignableRolesTest(AuthClientMixin, TestCase):
+    """Which roles a user may assign, and the places that enforce it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('assignadmin', user_type='admin', is_staff=True)
+        cls.lead = create_user('assignlead', user_type='support_staff')
+        cls.system = Role.objects.create(name='assign_system', display_name='Assign System', is_system_role=True)
+        cls.manager = Role.objects.create(name='assign_manager', display_name='Assign Manager', can_assign_roles=True)
+        cls.child = Role.objects.create(name='assign_child', display_name='Assign Child', parent=cls.manager)
+        cls.lead.assign_role(cls.manager, assigned_by=cls.admin)
+
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+
+    def assignable(self, user):
+        return set(Role.objects.assignable_by(user).filter(name__startswith='assign_').values_list('name', flat=True))
+
+    def test_assignable_by(self):
+        self.assertEqual(self.assignable(self.admin), {'assign_manager', 'assign_child'})
+        self.assertEqual(self.assignable(self.lead), {'assign_child'})
+        superuser = create_user('assignsuper', user_type='field_staff', is_superuser=True)
+        self.assertEqual(self.assignable(superuser), {'assign_system', 'assign_manager', 'assign_child'})
+
+    def create_user_with_roles(self, login_id, roles):
+        return self.client.post(
+            reverse('users:user-list-create'),
+            {
+                'login_id': login_id, 'email': f'{login_id}@example.com', 'name': 'Created',
+                'password': BENCHMARK_PASSWORD, 'password_confirm': BENCHMARK_PASSWORD,
+                'mobile': '+8801911000111', 'user_type': 'field_staff', 'roles': [str(role.pk) for role in roles],
+            },
+            content_type='application/json',
+            **self.auth_headers(self.login(self.admin)),
+        )
+
+    def test_user_creation_rejects_unassignable_roles(self):
+        response = self.create_user_with_roles('assignrejected', [self.child, self.system])
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn(str(self.system.pk), json.dumps(response.json()))
+        self.assertFalse(User.objects.filter(login_id='assignrejected').exists())
+
+        response = self.create_user_with_roles('assigncreated', [self.child])
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTrue(User.objects.get(login_id='assigncreated').has_role('assign_child'))
+
+    def role_choices(self, object_id=None):
+        request = RequestFactory().get('/')
+        request.user = self.admin
+        request.resolver_match = mock.Mock(kwargs={'object_id': str(object_id)} if object_id else {})
+        field = UserRoleInline(User, admin_site).formfield_for_foreignkey(UserRole._meta.get_field('role'), request)
+        return set(field.queryset.filter(name__startswith='assign_').values_list('name', flat=True))
+
+    def test_admin_inline_keeps_the_current_role_of_existing_rows(self):
+        holder = create_user('assignholder', user_type='field_staff')
+        holder.assign_role(self.system, assigned_by=self.admin)
+        self.assertNotIn('assign_system', self.role_choices())
+        self.assertIn('assign_system', self.role_choices(holder.pk))
+
+
+class BulkAssignRoleTest(TestCase):
+    """Bulk assignment reserves its slots up front, commits per chunk and keeps the counter exact"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.assigner = create_user('chunkassigner', user_type='super_admin')
+        cls.role = Role.objects.create(name='chunk_role', display_name='Chunk Role', max_assignments=5)
+        cls.users = [create_user(f'chunkuser{i}', user_type='field_staff') for i in range(4)]
+        cls.user_ids = [user.pk for user in cls.users]
+
+    def active_assignments(self):
+        self.role.refresh_from_db()
+        return self.role.active_assignments
+
+    def test_request_over_capacity_is_rejected_before_writing(self):
+        self.role.max_assignments = 3
+        self.role.save()
+        with self.assertRaises(ValidationError):
+            bulk_assign_role(self.role, self.user_ids, self.assigner)
+        self.assertFalse(UserRole.objects.filter(role=self.role).exists())
+        self.assertEqual(self.active_assignments(), 0)
+
+    def test_slots_are_reserved_for_the_whole_request(self):
+        competing = []
+
+        def progress(done, total):
+            # Another request tries to take the remaining slots between two chunks
+            competing.append(Role.objects.reserve_assignments(self.role.pk, 2))
+
+        with self.settings(BULK_ROLE_ASSIGNMENT_CHUNK_SIZE=2):
+            result = bulk_assign_role(self.role, self.user_ids, self.assigner, progress=progress)
+        self.assertEqual(result['created'], 4)
+        self.assertEqual(competing, [False, False])
+        self.assertEqual(UserRole.objects.filter(role=self.role, is_active=True).count(), 4)
+        self.assertEqual(self.active_assignments(), 4)
+
+    def test_failed_chunk_releases_the_rest_of_the_reservation(self):
+        refresh_users = EffectivePermission.objects.refresh_users
+        calls = []
+
+        def fail_second_chunk(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            return refresh_users(*args, **kwargs)
+
+        with self.settings(BULK_ROLE_ASSIGNMENT_CHUNK_SIZE=2), \
+                mock.patch.object(EffectivePermission.objects, 'refresh_users', side_effect=fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                bulk_assign_role(self.role, self.user_ids, self.assigner)
+        self.assertEqual(UserRole.objects.filter(role=self.role, is_active=True).count(), 2)
+        self.assertEqual(self.active_assignments(), 2)
+
+    def test_rows_assigned_concurrently_are_not_counted_as_created(self):
+        bulk_create = UserRole.objects.bulk_create
+
+        def race_then_create(rows, **kwargs):
+            if not UserRole.objects.filter(user_id=self.user_ids[0]).exists():
+                # A concurrent request assigns the first user after the existing rows were read
+                Role.objects.reserve_assignments(self.role.pk)
+                bulk_create([UserRole(user_id=self.user_ids[0], role=self.role, assigned_by=self.assigner)])
+            return bulk_create(rows, **kwargs)
+
+        with mock.patch.object(UserRole.objects, 'bulk_create', side_effect=race_then_create):
+            result = bulk_assign_role(self.role, self.user_ids, self.assigner)
+        self.assertEqual((result['created'], result['unchanged']), (3, 1))
+        self.assertEqual(self.active_assignments(), 4)
+
+    def test_reconcile_repairs_drift(self):
+        bulk_assign_role(self.role, self.user_ids[:2], self.assigner)
+        Role.objects.filter(pk=self.role.pk).update(active_assignments=5)
+        self.assertEqual(Role.objects.reconcile_assignment_counts(), 1)
+        self.assertEqual(self.active_assignments(), 2)
+        self.assertEqual(Role.objects.reconcile_assignment_counts(), 0)
+
+
+class GroupPermissionVersionTest(TestCase):
+    """Role permission edits reach members' masks, rows and token versions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.assigner = create_user('versionassigner', user_type='super_admin')
+        cls.users = [create_user(f'versionuser{i}') for i in range(3)]
+        cls.role = Role.objects.create(name='version_role', display_name='Version Role')
+        cls.add_role, cls.change_role = (
+            Permission.objects.get(codename=codename) for codename in ('add_role', 'change_role')
+        )
+        cls.role.set_permissions([cls.add_role])
+        for user in cls.users:
+            user.assign_role(cls.role, assigned_by=cls.assigner)
+
+    def setUp(self):
+        cache.clear()
+
+    def rows(self, user):
+        return set(EffectivePermission.objects.filter(user=user).values_list('codename', flat=True))
+
+    def test_small_group_rows_are_refreshed_inline(self):
+        user = self.users[0]
+        version = current_version(user.pk)
+        self.role.add_permission(self.change_role)
+        self.assertNotEqual(current_version(user.pk), version)
+        self.assertEqual(self.rows(user), {'add_role', 'change_role'})
+        listed = User.objects.prefetch_related('effective_permissions').get(pk=user.pk)
+        self.assertEqual(set(listed.get_all_permissions()), {'add_role', 'change_role'})
+        self.assertTrue(User.objects.get(pk=user.pk).has_permission('change_role'))
+
+    def test_large_group_rows_are_refreshed_by_the_task(self):
+        user = self.users[0]
+        with self.settings(EFFECTIVE_PERMISSION_SYNC_LIMIT=2):
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.role.add_permission(self.change_role)
+            # Masks follow the group version at once; the rows wait for the task
+            self.assertTrue(User.objects.get(pk=user.pk).has_permission('change_role'))
+            self.assertEqual(self.rows(user), {'add_role'})
+            for callback in callbacks:
+                callback()
+        self.assertEqual(self.rows(user), {'add_role', 'change_role'})
+
+    def test_current_version_rebuilds_an_evicted_entry_once(self):
+        user = self.users[0]
+        current_version(user.pk)
+        cache.delete(USER_MASK_KEY.format(user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            version = current_version(user.pk)
+        self.assertGreater(len(queries), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(current_version(user.pk), version)
+
+
+class RBACCatalogTest(AuthClientMixin, TestCase):
+    """The catalog endpoint serves a versioned snapshot with ETags"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('cataloguser')
+        cls.role = Role.objects.create(name='catalog_role', display_name='Catalog Role')
+
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+        rbac_catalog._entry = None
+        self.headers = self.auth_headers(self.login(self.user))
+
+    def get(self, **headers):
+        return self.client.get(reverse('users:rbac-catalog'), **self.headers, **headers)
+
+    def role_permission_ids(self, response):
+        roles = {role['name']: role for role in response.json()['data']['roles']}
+        return roles['catalog_role']['permission_ids']
+
+    def test_etag_and_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.role_permission_ids(response), [])
+        with self.assertNumQueries(0):
+            cached = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_group_permission_change_invalidates_the_snapshot(self):
+        etag = self.get()['ETag']
+        permission = Permission.objects.get(codename='add_role')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.role.add_permission(permission)
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.role_permission_ids(response), [permission.pk])
+
+    def test_process_snapshot_is_dropped_after_a_cache_flush(self):
+        etag = self.get()['ETag']
+        # A change whose version bump was lost with the flushed cache
+        Role.objects.filter(pk=self.role.pk).update(display_name='Renamed Role')
+        cache.clear()
+        self.headers = self.auth_headers(self.login(self.user))
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        roles = {role['name']: role for role in response.json()['data']['roles']}
+        self.assertEqual(roles['catalog_role']['display_name'], 'Renamed Role')
+
+
+class KeysetPaginationTest(AuthClientMixin, TestCase):
+    """Keyset pages on the user directory: cursors, NULL keys and sparse fieldsets"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.requester = create_user('pagingadmin')
+        cls.role = Role.objects.create(name='paging_role', display_name='Paging Role')
+        start = timezone.now() - timedelta(days=30)
+        cls.users = [create_user(f'paging{i}', user_type='field_staff') for i in range(7)]
+        for i, user in enumerate(cls.users):
+            # Pairs share date_joined so the primary key has to break ties;
+            # every third user never logged in
+            user.date_joined = start + timedelta(days=i // 2)
+            user.last_login = None if i % 3 == 0 else start + timedelta(hours=i)
+            user.save(update_fields=['date_joined', 'last_login'])
+        UserRole.objects.create(user=cls.users[0], role=cls.role, assigned_by=cls.requester)
+
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+        self.headers = self.auth_headers(self.login(self.requester))
+
+    def get(self, url, **params):
+        response = self.client.get(url, params, **self.headers)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def walk(self, **params):
+        """Ids of every page following next links, then of every page going back"""
+        page = self.get(reverse('users:user-list-create'), user_type='field_staff', page_size=3, **params)
+        forward, pages = [], []
+        while True:
+            pages.append([row['id'] for row in page['results']])
+            forward.extend(pages[-1])
+            if not page['next']:
+                break
+            page = self.get(page['next'])
+        backward = pages.pop()
+        while page['previous']:
+            page = self.get(page['previous'])
+            self.assertEqual([row['id'] for row in page['results']], pages.pop())
+            backward = [row['id'] for row in page['results']] + backward
+        self.assertEqual(pages, [])
+        return forward, backward
+
+    def ids(self, users):
+        return [str(user.pk) for user in users]
+
+    def test_default_ordering_round_trip(self):
+        expected = User.objects.filter(user_type='field_staff').order_by('-date_joined', '-id')
+        forward, backward = self.walk()
+        self.assertEqual(forward, self.ids(expected))
+        self.assertEqual(backward, forward)
+
+    def test_nullable_key_sorts_nulls_last(self):
+        users = User.objects.filter(user_type='field_staff')
+        logged_in = users.filter(last_login__isnull=False)
+        never = users.filter(last_login__isnull=True)
+        forward, backward = self.walk(ordering='last_login')
+        self.assertEqual(forward, self.ids(logged_in.order_by('last_login', 'id')) + self.ids(never.order_by('id')))
+        self.assertEqual(backward, forward)
+        forward, backward = self.walk(ordering='-last_login')
+        self.assertEqual(forward, self.ids(logged_in.order_by('-last_login', '-id')) + self.ids(never.order_by('-id')))
+        self.assertEqual(backward, forward)
+
+    def test_cursor_is_bound_to_its_ordering(self):
+        page = self.get(reverse('users:user-list-create'), page_size=3)
+        self.assertNotIn('count', page)
+        response = self.client.get(page['next'] + '&ordering=login_id', **self.headers)
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('users:user-list-create'), {'cursor': 'not-a-cursor'}, **self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_same_direction_keys_use_a_row_comparison(self):
+        pagination = KeysetPagination()
+        pagination.ordering = ['-date_joined', '-id']
+        pagination.fields = [User._meta.get_field('date_joined'), User._meta.get_field('id')]
+        queryset = User.objects.order_by(*pagination._order_by(False)).filter(
+            pagination._after([timezone.now(), uuid.uuid4()], False)
+        )
+        # Compiled for PostgreSQL without connecting; the index serves it as one range scan
+        postgresql = ConnectionHandler({'default': {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'compile_only'}})
+        sql, params = queryset.query.get_compiler(connection=postgresql['default']).as_sql()
+        self.assertIn('WHERE ("users"."date_joined", "users"."id") < (%s, %s)', sql)
+        self.assertIn('ORDER BY "users"."date_joined" DESC, "users"."id" DESC', sql)
+        self.assertNotIn('NULLS', sql)
+        # The same row comparison on the test database
+        sql, params = queryset.query.get_compiler(connection=connection).as_sql()
+        self.assertIn('WHERE ("users"."date_joined", "users"."id") < (%s, %s)', sql)
+
+    def test_sparse_fieldsets(self):
+        url = reverse('users:user-list-create')
+        row = self.get(url, fields='id,login_id', user_type='field_staff')['results'][0]
+        self.assertEqual(set(row), {'id', 'login_id'})
+        rows = self.get(url, fields='id,email', expand='roles,email', user_type='field_staff')['results']
+        # expand= adds expandable fields only
+        self.assertEqual(set(rows[0]), {'id', 'email', 'roles'})
+        roles = {row['id']: row['roles'] for row in rows}
+        self.assertEqual([role['role'] for role in roles[str(self.users[0].pk)]], [str(self.role.pk)])
+        full = set(self.get(url, user_type='field_staff')['results'][0])
+        self.assertTrue({'roles', 'permissions', 'district_info', 'thana_info'} <= full)
+        # Without fields= the default shape is kept; expand= does not hide other nested fields
+        self.assertEqual(set(self.get(url, expand='roles', user_type='field_staff')['results'][0]), full)
+
+
+class UserSearchTest(AuthClientMixin, TestCase):
+    """User search: portable matching and ranking, the list filter and the admin"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.requester = create_user('searchadmin', is_staff=True, is_superuser=True)
+        cls.exact = create_user('rahim', user_type='field_staff', mobile='+8801712345678')
+        cls.prefix = create_user('rahimuddin', user_type='field_staff')
+        cls.substring = create_user('karim', user_type='field_staff', employee_id='EMP-RAHIM-1')
+        cls.other = create_user('selim', user_type='field_staff')
+        start = timezone.now() - timedelta(days=10)
+        for i, user in enumerate([cls.exact, cls.prefix, cls.substring, cls.other]):
+            user.date_joined = start + timedelta(days=i)
+            user.save(update_fields=['date_joined'])
+
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+
+    def test_portable_backend_matches_mobile_digits(self):
+        backend = UserSearchBackend()
+        for term in ('01712-345678', '+880 1712 345678', '345678'):
+            self.assertEqual(list(backend.matching(User.objects.all(), term)), [self.exact], term)
+        # Fewer than MOBILE_MIN_DIGITS digits are not a mobile query
+        self.assertFalse(backend.matching(User.objects.all(), '171').exists())
+
+    def test_ranking_order(self):
+        ranked = UserSearchBackend().ranked(User.objects.filter(user_type='field_staff'), ' Rahim ')
+        self.assertEqual(list(ranked), [self.exact, self.prefix, self.substring])
+        self.assertEqual([user.search_rank for user in ranked], [3, 2, 1])
+
+    def test_typeahead(self):
+        headers = self.auth_headers(self.login(self.requester))
+        response = self.client.get(reverse('users:user-search'), {'q': 'rahim', 'limit': 2}, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['login_id'] for row in response.json()['data']], ['rahim', 'rahimuddin'])
+
+    def test_list_search_with_keyset_pages(self):
+        headers = self.auth_headers(self.login(self.requester))
+        page = self.client.get(reverse('users:user-list-create'), {'search': 'rahim', 'page_size': 1}, **headers).json()
+        login_ids = []
+        while True:
+            login_ids.extend(row['login_id'] for row in page['results'])
+            if not page['next']:
+                break
+            self.assertIn('search=rahim', page['next'])
+            page = self.client.get(page['next'], **headers).json()
+        # Keyset order (-date_joined), not rank order
+        self.assertEqual(login_ids, ['karim', 'rahimuddin', 'rahim'])
+
+    def test_admin_search_results(self):
+        model_admin = admin_site._registry[User]
+        request = RequestFactory().get('/admin/users/user/', {'q': '01712-345678'})
+        request.user = self.requester
+        queryset, may_have_duplicates = model_admin.get_search_results(request, User.objects.all(), '01712-345678')
+        self.assertEqual(list(queryset), [self.exact])
+        self.assertFalse(may_have_duplicates)
+        queryset, _ = model_admin.get_search_results(request, User.objects.all(), '  ')
+        self.assertEqual(queryset.count(), User.objects.count())
+
+    def test_search_parameter_is_documented(self):
+        parameters = UserSearchFilter().get_schema_operation_parameters(view=None)
+        self.assertEqual([parameter['name'] for parameter in parameters], ['search'])
+        schema = json.loads(self.client.get(reverse('schema-json'), {'format': 'openapi'}).content)
+        operation = schema['paths']['/users/']['get']
+        self.assertIn('search', [parameter['name'] for parameter in operation['parameters']])
+
+
+class ExportTest(AuthClientMixin, TestCase):
+    """Streaming CSV / JSONL exports of users and role assignments"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('exportadmin')
+        cls.role = Role.objects.create(name='export_role', display_name='Export Role')
+        cls.other_role = Role.objects.create(name='another_role', display_name='Another Role')
+        cls.users = [create_user(f'export{i}', user_type='field_staff') for i in range(5)]
+        cls.users[0].name = '=HYPERLINK("http://example.com","x")'
+        cls.users[0].save(update_fields=['name'])
+        for user in cls.users[:3]:
+            UserRole.objects.create(user=user, role=cls.role, assigned_by=cls.admin)
+        UserRole.objects.create(user=cls.users[0], role=cls.other_role, assigned_by=cls.admin)
+
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+        self.headers = self.auth_headers(self.login(self.admin))
+
+    def export(self, url_name, export_format, **params):
+        response = self.client.get(reverse(url_name, args=[export_format]), params, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        return b''.join(response.streaming_content).decode()
+
+    def test_user_csv(self):
+        rows = {row['login_id']: row for row in csv.DictReader(io.StringIO(
+            self.export('users:user-export', 'csv', user_type='field_staff')
+        ))}
+        self.assertEqual(sorted(rows), [f'export{i}' for i in range(5)])
+        self.assertEqual(rows['export0']['roles'], 'another_role;export_role')
+        self.assertEqual(rows['export3']['roles'], '')
+        # Formula-like cells are neutralized, including E.164 mobiles
+        self.assertEqual(rows['export0']['name'], '\'=HYPERLINK("http://example.com","x")')
+        self.assertEqual(rows['export1']['mobile'], "'" + str(self.users[1].mobile))
+
+    def test_user_jsonl_keeps_raw_values(self):
+        lines = self.export('users:user-export', 'jsonl', user_type='field_staff').splitlines()
+        rows = {row['login_id']: row for row in map(json.loads, lines)}
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows['export0']['roles'], ['another_role', 'export_role'])
+        self.assertEqual(rows['export0']['name'], '=HYPERLINK("http://example.com","x")')
+
+    def test_role_assignment_export(self):
+        rows = list(csv.DictReader(io.StringIO(
+            self.export('users:user-role-export', 'csv', role=str(self.role.pk))
+        )))
+        self.assertEqual(sorted(row['login_id'] for row in rows), ['export0', 'export1', 'export2'])
+        self.assertTrue(all(row['role'] == 'export_role' and row['assigned_by'] == 'exportadmin' for row in rows))
+
+    def test_unsupported_format_and_bad_role(self):
+        for url in (reverse('users:user-export', args=['xlsx']), reverse('users:user-role-export', args=['xml'])):
+            self.assertEqual(self.client.get(url, **self.headers).status_code, 400)
+        response = self.client.get(reverse('users:user-role-export', args=['csv']), {'role': 'x'}, **self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_roles_are_loaded_once_per_chunk(self):
+        with self.settings(EXPORT_CHUNK_SIZE=2):
+            response = self.client.get(
+                reverse('users:user-export', args=['csv']), {'user_type': 'field_staff'}, **self.headers
+            )
+            with CaptureQueriesContext(connection) as queries:
+                lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+        # One query for the user rows, one role query for each chunk of two users
+        self.assertEqual(len(queries), 1 + 3)
+
+
+class UserImportViewTest(AuthClientMixin, TestCase):
+    """The import endpoint answers small files inline and queues the expensive ones"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('importviewadmin')
+        cls.staff = create_user('importviewstaff', user_type='field_staff')
+
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+        self.headers = self.auth_headers(self.login(self.admin))
+
+    def upload(self, count, **data):
+        lines = [
+            json.dumps({
+                'login_id': f'viewimport{i}', 'email': f'viewimport{i}@example.com', 'mobile': f'+88015{i:08d}',
+                'user_type': 'field_staff', 'name': f'View Import {i}', 'password': BENCHMARK_PASSWORD,
+            })
+            for i in range(count)
+        ]
+        upload = SimpleUploadedFile('users.jsonl', '\n'.join(lines).encode(), content_type='application/x-ndjson')
+        return self.client.post(reverse('users:user-import'), {'file': upload, **data}, **self.headers)
+
+    def test_small_file_is_imported_in_the_request(self):
+        with self.settings(USER_IMPORT_SYNC_PASSWORDS=2):
+            response = self.upload(2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['created'], 2)
+
+    def test_file_with_many_passwords_is_queued(self):
+        upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_dir, ignore_errors=True)
+        with self.settings(USER_IMPORT_SYNC_PASSWORDS=2, USER_IMPORT_UPLOAD_DIR=upload_dir, USER_IMPORT_HASH_WORKERS=2), \
+                mock.patch.object(run_user_import, 'delay', wraps=run_user_import.delay) as delay:
+            response = self.upload(3)
+        self.assertEqual(response.status_code, 202)
+        # Only a reference to the stored file is queued, never the passwords; the job deletes the file
+        self.assertNotIn(BENCHMARK_PASSWORD, repr(delay.call_args))
+        self.assertEqual(os.listdir(upload_dir), [])
+        job_id = response.json()['data']['job_id']
+        # Tasks run eagerly in tests, so the job has finished
+        response = self.client.get(reverse('users:user-import-status', args=[job_id]), **self.headers)
+        self.assertEqual(response.status_code, 200)
+        job = response.json()['data']
+        self.assertEqual(job['status'], 'completed')
+        self.assertEqual((job['result']['created'], job['result']['failed']), (3, 0))
+        self.assertEqual(User.objects.filter(login_id__startswith='viewimport').count(), 3)
+
+        other = self.auth_headers(self.login(self.staff))
+        response = self.client.get(reverse('users:user-import-status', args=[job_id]), **other)
+        self.assertEqual(response.status_code, 404)
+
+    def test_dry_run_does_not_count_passwords(self):
+        with self.settings(USER_IMPORT_SYNC_PASSWORDS=2):
+            response = self.upload(3, dry_run='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['data']['valid'], response.json()['data']['created']), (3, 0))
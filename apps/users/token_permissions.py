@@ -0,0 +1,375 @@
+import base64
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import BooleanField, Value
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+
+# Claims carrying the permission snapshot and the versions it was built from
+PERMISSIONS_CLAIM = 'perms'
+PERMISSIONS_VERSION_CLAIM = 'permv'
+
+CATALOG_VERSION_KEY = 'users:perm_version:catalog'
+USER_VERSION_KEY = 'users:perm_version:user:{}'
+# One counter per group, and so per role (Role.django_group)
+GROUP_VERSION_KEY = 'users:perm_version:group:{}'
+USER_MASK_KEY = 'users:perm_mask:{}'
+GROUP_MASK_KEY = 'users:group_mask:{}'
+
+
+def encode_mask(mask):
+    """Encode a permission bitmask (bit n = auth_permission id n) as base64url"""
+    if not mask:
+        return ''
+    raw = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_mask(value):
+    if not value:
+        return 0
+    padded = value + '=' * (-len(value) % 4)
+    return int.from_bytes(base64.urlsafe_b64decode(padded), 'little')
+
+
+def incr_version(key):
+    """Increment a shared version counter (created at 1 when missing or evicted)"""
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+        return 1
+
+
+def bump_catalog_version():
+    """Invalidate every permission snapshot (permissions were created or deleted)"""
+    return incr_version(CATALOG_VERSION_KEY)
+
+
+def bump_user_version(user_id):
+    """Invalidate the permission snapshots of one user"""
+    return incr_version(USER_VERSION_KEY.format(user_id))
+
+
+def bump_now_and_on_commit(bump):
+    """
+    Bump now, and again once the transaction commits so readers cannot
+    cache data from before the commit under the new version.
+    """
+    bump()
+    transaction.on_commit(bump)
+
+
+def bump_user_versions(user_ids):
+    """Invalidate the snapshots of several users"""
+    user_ids = list(user_ids)
+
+    def bump():
+        for user_id in user_ids:
+            bump_user_version(user_id)
+
+    bump_now_and_on_commit(bump)
+
+
+def bump_group_versions(group_ids):
+    """
+    Invalidate the masks and snapshots of every member of the groups (or the
+    roles they back): one counter per group, however many users hold it.
+    Stale user entries are detected when they are next read.
+    """
+    group_ids = list(group_ids)
+
+    def bump():
+        for group_id in group_ids:
+            incr_version(GROUP_VERSION_KEY.format(group_id))
+
+    bump_now_and_on_commit(bump)
+
+
+def _group_versions(group_ids):
+    """((group_id, version), ...) for the groups, in one cache round trip"""
+    if not group_ids:
+        return ()
+    values = cache.get_many([GROUP_VERSION_KEY.format(group_id) for group_id in group_ids])
+    return tuple((group_id, values.get(GROUP_VERSION_KEY.format(group_id), 0)) for group_id in group_ids)
+
+
+def _stamp(base, group_versions):
+    """Version string of a user's permissions: catalog.user[.digest of the group versions]"""
+    if not group_versions:
+        return base
+    digest = hashlib.blake2b(repr(group_versions).encode(), digest_size=6).hexdigest()
+    return f'{base}.{digest}'
+
+
+def _load_grants(user_id):
+    """(sorted group ids, direct permission mask) of a user, in one query"""
+    User = get_user_model()
+    memberships = User.groups.through.objects.filter(user_id=user_id).values_list(
+        Value(True, output_field=BooleanField()), 'group_id'
+    )
+    direct = User.user_permissions.through.objects.filter(user_id=user_id).values_list(
+        Value(False, output_field=BooleanField()), 'permission_id'
+    )
+    group_ids, mask = set(), 0
+    for is_group, value in memberships.union(direct, all=True):
+        if is_group:
+            group_ids.add(value)
+        else:
+            mask |= 1 << value
+    return tuple(sorted(group_ids)), mask
+
+
+def _group_masks(group_versions, catalog_version, known=None):
+    """
+    Union of the groups' permission masks, cached per (catalog, group)
+    version. ``known`` maps group ids to masks already loaded (Role.permission_mask).
+    """
+    keys = {GROUP_MASK_KEY.format(group_id): (group_id, version) for group_id, version in group_versions}
+    cached = cache.get_many(list(keys)) if keys else {}
+    mask, missing = 0, {}
+    for key, (group_id, version) in keys.items():
+        entry = cached.get(key)
+        if entry is not None and entry[:2] == (catalog_version, version):
+            mask |= decode_mask(entry[2])
+        else:
+            missing[group_id] = version
+    if missing:
+        known = known or {}
+        masks = {group_id: known[group_id] for group_id in missing if group_id in known}
+        unknown = [group_id for group_id in missing if group_id not in known]
+        if unknown:
+            masks.update(dict.fromkeys(unknown, 0))
+            for group_id, permission_id in Group.permissions.through.objects.filter(
+                group_id__in=unknown
+            ).values_list('group_id', 'permission_id'):
+                masks[group_id] |= 1 << permission_id
+        cache.set_many(
+            {
+                GROUP_MASK_KEY.format(group_id): (catalog_version, missing[group_id], encode_mask(m))
+                for group_id, m in masks.items()
+            },
+            getattr(settings, 'PRINCIPAL_CACHE_SHARED_TTL', 300),
+        )
+        for m in masks.values():
+            mask |= m
+    return mask
+
+
+def _prefetched_role_masks(user):
+    """Group id -> stored mask of the roles in a prefetched ``user_roles`` (with ``role``)"""
+    if 'user_roles' not in getattr(user, '_prefetched_objects_cache', {}):
+        return None
+    return {
+        user_role.role.django_group_id: decode_mask(user_role.role.permission_mask)
+        for user_role in user.user_roles.all()
+        if user_role.is_active and user_role.role.django_group_id and 'role' in user_role._state.fields_cache
+    }
+
+
+def _user_entry(user_id):
+    """Catalog version, base version (catalog.user) and the user's cached mask entry, or None when stale"""
+    mask_key = USER_MASK_KEY.format(user_id)
+    user_key = USER_VERSION_KEY.format(user_id)
+    values = cache.get_many([CATALOG_VERSION_KEY, user_key, mask_key])
+    # Read the versions before computing, so a concurrent change leaves the result stale
+    catalog_version = values.get(CATALOG_VERSION_KEY, 0)
+    base = f'{catalog_version}.{values.get(user_key, 0)}'
+    stored = values.get(mask_key)
+    if stored is not None and len(stored) == 4 and stored[0] == base:
+        return catalog_version, base, stored
+    return catalog_version, base, None
+
+
+def current_version(user_id):
+    """
+    Version string a fresh snapshot for the user would carry. Cache reads
+    only while the user's mask entry is current; a stale or evicted entry is
+    rebuilt and stored (one grants query, plus the masks of uncached groups),
+    so the per-request check queries at most once per user per permission
+    change or PRINCIPAL_CACHE_SHARED_TTL.
+    """
+    return _resolve_mask(user_id)[0]
+
+
+class PermissionCatalog:
+    """
+    In-process map between auth_permission ids (the snapshot bit positions)
+    and codenames. Reloaded when the catalog version changes.
+    """
+
+    # Seconds between checks of the shared catalog version
+    recheck_interval = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._bits_by_codename = {}
+        self._codenames_by_id = {}
+
+    def _load(self, version=None):
+        now = time.monotonic()
+        if version is None:
+            if self._codenames_by_id and now - self._checked_at < self.recheck_interval:
+                return
+            version = cache.get(CATALOG_VERSION_KEY, 0)
+        self._checked_at = now
+        if version == self._version and self._codenames_by_id:
+            return
+        with self._lock:
+            bits_by_codename, codenames_by_id = {}, {}
+            for pk, codename in Permission.objects.values_list('id', 'codename'):
+                bits_by_codename[codename] = bits_by_codename.get(codename, 0) | (1 << pk)
+                codenames_by_id[pk] = codename
+            self._bits_by_codename = bits_by_codename
+            self._codenames_by_id = codenames_by_id
+            self._version = version
+
+    @property
+    def version(self):
+        """Catalog version of the loaded bit layout"""
+        self._load()
+        return self._version
+
+    def bits_for(self, codename):
+        """Bits of the permissions with ``codename`` (one per app defining it)"""
+        self._load()
+        return self._bits_by_codename.get(codename, 0)
+
+    def mask_for(self, codenames):
+        self._load()
+        mask = 0
+        for codename in codenames:
+            mask |= self._bits_by_codename.get(codename, 0)
+        return mask
+
+    def codenames_for(self, mask):
+        self._load()
+        codenames = set()
+        while mask:
+            low = mask & -mask
+            codename = self._codenames_by_id.get(low.bit_length() - 1)
+            if codename:
+                codenames.add(codename)
+            mask ^= low
+        return sorted(codenames)
+
+
+permission_catalog = PermissionCatalog()
+
+
+def has_all(mask, codenames):
+    """True when ``mask`` grants every codename"""
+    return all(mask & permission_catalog.bits_for(codename) for codename in codenames)
+
+
+def _resolve_mask(user_id, local=None, known=None):
+    """
+    (version, mask) of the user's permissions: the union of their groups'
+    masks and their direct permissions. The cached entry records the group
+    versions it was built from, so a role or group edit makes it stale
+    without touching any per-user key; it is rebuilt from the per-group
+    masks and stored on the next read. ``local`` is a result computed
+    earlier, reused while its version is current; ``known`` as in _group_masks.
+    """
+    catalog_version, base, stored = _user_entry(user_id)
+    if stored is not None:
+        group_ids, direct = tuple(group_id for group_id, _ in stored[1]), decode_mask(stored[2])
+    else:
+        group_ids, direct = _load_grants(user_id)
+    group_versions = _group_versions(group_ids)
+    version = _stamp(base, group_versions)
+
+    if local is not None and local[0] == version:
+        return local
+    if stored is not None and stored[1] == group_versions:
+        mask = decode_mask(stored[3])
+    else:
+        mask = _group_masks(group_versions, catalog_version, known) | direct
+        cache.set(
+            USER_MASK_KEY.format(user_id), (base, group_versions, encode_mask(direct), encode_mask(mask)),
+            getattr(settings, 'PRINCIPAL_CACHE_SHARED_TTL', 300),
+        )
+    return version, mask
+
+
+def _versioned_mask(user):
+    """
+    (version, mask) of the user's permissions, remembered on the instance.
+    A user pinned to a request (``pin_permission_mask``) reuses the first
+    result for the rest of the request instead of re-reading the versions.
+    """
+    local = user.__dict__.get('_permission_mask')
+    if local is not None and user.__dict__.get('_permission_mask_pinned'):
+        return local
+    result = _resolve_mask(user.pk, local, _prefetched_role_masks(user))
+    user._permission_mask = result
+    return result
+
+
+def pin_permission_mask(user):
+    """
+    Memoize the user's permission mask for the lifetime of the request that
+    authenticated it: like the token snapshot, changes made during the
+    request apply from the next one.
+    """
+    user._permission_mask_pinned = True
+    return user
+
+
+def user_permission_mask(user):
+    """Union permission bitmask of the user (bit n = auth_permission id n)"""
+    return _versioned_mask(user)[1]
+
+
+def build_permission_claims(user):
+    """Permission claims for a token issued to ``user``"""
+    version, mask = _versioned_mask(user)
+    return {PERMISSIONS_CLAIM: encode_mask(mask), PERMISSIONS_VERSION_CLAIM: version}
+
+
+class TokenPermissions:
+    """Permission snapshot carried by a validated access token"""
+
+    def __init__(self, token):
+        self.mask = decode_mask(token.get(PERMISSIONS_CLAIM))
+        self.version = token.get(PERMISSIONS_VERSION_CLAIM)
+        self._current = None
+
+    def is_current(self, user_id):
+        if self._current is None:
+            self._current = self.version is not None and self.version == current_version(user_id)
+        return self._current
+
+    def has_perm(self, codename):
+        return bool(self.mask & permission_catalog.bits_for(codename))
+
+    def codenames(self):
+        return permission_catalog.codenames_for(self.mask)
+
+
+def token_permissions(request, allow_stale=False):
+    """
+    Return the request's TokenPermissions, or None when the request was not
+    authenticated with a token carrying a snapshot. A snapshot older than the
+    user's permissions raises AuthenticationFailed so the client refreshes.
+    """
+    token = getattr(request, 'auth', None)
+    if token is None or PERMISSIONS_CLAIM not in token:
+        return None
+    snapshot = getattr(request, '_token_permissions', None)
+    if snapshot is None:
+        snapshot = TokenPermissions(token)
+        request._token_permissions = snapshot
+    if not allow_stale and not snapshot.is_current(request.user.pk):
+        raise AuthenticationFailed('Permissions have changed, refresh the token.', code='permissions_changed')
+    return snapshot
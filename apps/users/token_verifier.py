@@ -0,0 +1,100 @@
+"""
+Local verification of KTL access tokens for other services (router sync
+workers, reporting, customer portal).
+
+Depends only on PyJWT (with cryptography) and the standard library, so it can
+be copied into services that do not run Django::
+
+    verifier = TokenVerifier('https://billing.example.com/.well-known/jwks.json')
+    claims = verifier.verify(token)
+
+Public keys are fetched once and cached in-process; a token naming an unknown
+``kid`` triggers at most one refetch per ``min_refresh_interval``. After the
+first fetch, verification is a signature check with no network round trip.
+Revocation (logout, deactivation) is not visible locally: tokens stay valid
+until they expire.
+"""
+import json
+import threading
+import time
+import urllib.request
+
+import jwt
+
+
+class TokenVerificationError(Exception):
+    """Raised when a token cannot be verified"""
+
+
+class TokenVerifier:
+
+    def __init__(self, jwks_url, audience=None, issuer=None, leeway=0,
+                 cache_ttl=86400, min_refresh_interval=60, timeout=5):
+        self.jwks_url = jwks_url
+        self.audience = audience
+        self.issuer = issuer
+        self.leeway = leeway
+        self.cache_ttl = cache_ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._fetched_at = None
+
+    def _fetch(self):
+        with urllib.request.urlopen(self.jwks_url, timeout=self.timeout) as response:
+            jwks = json.load(response)
+        if not isinstance(jwks, dict) or not isinstance(jwks.get('keys', []), list):
+            raise ValueError('Malformed JWKS document')
+        keys = {}
+        for jwk in jwks.get('keys', []):
+            if not isinstance(jwk, dict) or jwk.get('use', 'sig') != 'sig' or 'kid' not in jwk:
+                continue
+            try:
+                keys[jwk['kid']] = jwt.PyJWK(jwk)
+            except (jwt.exceptions.PyJWKError, jwt.exceptions.InvalidKeyError):
+                # Key type or algorithm this verifier cannot use; tokens naming it fail as unknown
+                continue
+        return keys
+
+    def refresh(self, force=False):
+        """Refetch the key set unless it was fetched very recently"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._fetched_at is not None and now - self._fetched_at < self.min_refresh_interval:
+                return
+            try:
+                self._keys = self._fetch()
+            except (OSError, ValueError, jwt.exceptions.PyJWTError) as e:
+                if not self._keys:
+                    raise TokenVerificationError(f'Could not fetch signing keys: {e}') from e
+            self._fetched_at = now
+
+    def get_key(self, kid):
+        expired = self._fetched_at is None or time.monotonic() - self._fetched_at > self.cache_ttl
+        if expired or kid not in self._keys:
+            self.refresh(force=expired)
+        try:
+            return self._keys[kid]
+        except KeyError:
+            raise TokenVerificationError('Token signed with an unknown key.')
+
+    def verify(self, token, token_type='access'):
+        """Return the claims of a valid token, or raise TokenVerificationError"""
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+            key = self.get_key(kid)
+            claims = jwt.decode(
+                token,
+                key.key,
+                algorithms=[key.algorithm_name],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={'verify_aud': self.audience is not None},
+            )
+        except jwt.InvalidTokenError as e:
+            raise TokenVerificationError(str(e)) from e
+        if token_type and claims.get('token_type') != token_type:
+            raise TokenVerificationError('Token has wrong type.')
+        return claims
@@ -0,0 +1,136 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, BlacklistMixin, RefreshToken
+
+from .blacklist import token_blacklist
+from .signing_keys import key_ring
+from .token_permissions import build_permission_claims
+
+
+# Claim carrying the user's principal version at the time the token was issued
+PRINCIPAL_VERSION_CLAIM = 'pver'
+
+# Claim linking a token pair to its UserSession row
+SESSION_ID_CLAIM = 'sid'
+
+# Claim carrying the user's token generation; bumping it revokes every token
+TOKEN_GENERATION_CLAIM = 'gen'
+TOKEN_GENERATION_KEY = 'users:token_gen:{}'
+
+# Refresh token lifetime for "remember me" logins
+REMEMBER_ME_LIFETIME = timedelta(days=30)
+
+
+def principal_version(user):
+    """Version stamp of a user row, derived from its last modification time"""
+    if not user.updated_at:
+        return 0
+    return int(user.updated_at.timestamp() * 1000000)
+
+
+def _load_token_generation(user_id):
+    return get_user_model().objects.filter(pk=user_id).values_list('token_generation', flat=True).first() or 0
+
+
+def _cache_token_generation(user_id, generation):
+    """Cache ``generation`` unless a newer one is already cached (generations only grow)"""
+    key = TOKEN_GENERATION_KEY.format(user_id)
+    if cache.add(key, generation, None):
+        return
+    cached = cache.get(key)
+    if cached is None or cached < generation:
+        cache.set(key, generation, None)
+
+
+def token_generation(user_id):
+    """Current token generation of the user (one cache read, database on a miss)"""
+    generation = cache.get(TOKEN_GENERATION_KEY.format(user_id))
+    if generation is None:
+        generation = _load_token_generation(user_id)
+        _cache_token_generation(user_id, generation)
+    return generation
+
+
+def is_current_generation(user_id, claimed):
+    """
+    True when ``claimed`` is the user's current token generation. The cache
+    never runs ahead of the database, so an older claim is revoked outright;
+    a newer one means the cache is behind and is settled by the database.
+    """
+    generation = token_generation(user_id)
+    if claimed > generation:
+        generation = _load_token_generation(user_id)
+        _cache_token_generation(user_id, generation)
+    return claimed == generation
+
+
+def bump_token_generation(user_id):
+    """Revoke every token issued to the user so far. Returns the new generation."""
+    with transaction.atomic():
+        # The UPDATE locks the row until commit, so the read below sees this bump's value
+        get_user_model().objects.filter(pk=user_id).update(
+            token_generation=F('token_generation') + 1, updated_at=timezone.now()
+        )
+        generation = _load_token_generation(user_id)
+        # Publish once committed: a rolled back bump must not reject the current tokens
+        transaction.on_commit(lambda: _cache_token_generation(user_id, generation))
+    return generation
+
+
+class KeyRingTokenMixin:
+    """Sign and verify with the asymmetric key ring when one is configured"""
+
+    @property
+    def token_backend(self):
+        if key_ring.enabled:
+            return key_ring.backend
+        return super().token_backend
+
+
+class UserAccessToken(KeyRingTokenMixin, AccessToken):
+    """Access token signed with the key ring, verifiable from the published JWKS"""
+
+
+class UserRefreshToken(KeyRingTokenMixin, RefreshToken):
+    """
+    Refresh token that stamps KTL specific claims on the token pair.
+    Claims set here are copied to the derived access token.
+
+    Revocation is tracked by ``UserSession`` rows and the cache-backed
+    ``token_blacklist``, so these tokens are not recorded in simplejwt's
+    outstanding token table nor checked against its blacklist table.
+    """
+
+    access_token_class = UserAccessToken
+
+    @classmethod
+    def for_user(cls, user):
+        # Skip BlacklistMixin.for_user, which inserts an OutstandingToken row
+        token = super(BlacklistMixin, cls).for_user(user)
+        token[PRINCIPAL_VERSION_CLAIM] = principal_version(user)
+        token[TOKEN_GENERATION_CLAIM] = user.token_generation
+        token.payload.update(build_permission_claims(user))
+        return token
+
+    @classmethod
+    def for_session(cls, user, session_id, remember_me=False):
+        """Token pair bound to the given session id"""
+        token = cls.for_user(user)
+        token[SESSION_ID_CLAIM] = str(session_id)
+        if remember_me:
+            token.set_exp(lifetime=REMEMBER_ME_LIFETIME)
+        return token
+
+    def check_blacklist(self):
+        """Reject tokens of revoked sessions without a database query"""
+        if token_blacklist.is_revoked(self.payload.get(SESSION_ID_CLAIM)):
+            raise TokenError('Token is blacklisted')
+        if not is_current_generation(self.payload[api_settings.USER_ID_CLAIM], self.payload.get(TOKEN_GENERATION_CLAIM, 0)):
+            raise TokenError('Token has been revoked')
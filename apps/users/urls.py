@@ -7,13 +7,19 @@ app_name = 'users'
 urlpatterns = [
     # Authentication endpoints
     path('auth/login/', views.LoginView.as_view(), name='auth-login'),
+    path('auth/login/async/', views.async_login, name='auth-login-async'),
     path('auth/refresh/', views.TokenRefreshView.as_view(), name='auth-refresh'),
     path('auth/logout/', views.LogoutView.as_view(), name='auth-logout'),
     path('auth/verify/', views.VerifyTokenView.as_view(), name='auth-verify'),
+    path('auth/metrics/', views.auth_metrics, name='auth-metrics'),
     
     # User Management (Consolidated)
     path('users/', views.UserListCreateView.as_view(), name='user-list-create'),
     path('users/<uuid:pk>/', views.UserDetailView.as_view(), name='user-detail'),
+    path('users/search/', views.user_search_typeahead, name='user-search'),  # Ranked typeahead
+    path('users/export/<str:export_format>/', views.export_users, name='user-export'),  # Streaming CSV / JSONL
+    path('users/import/', views.import_users, name='user-import'),  # Bulk create from CSV / JSONL
+    path('users/import/<uuid:job_id>/', views.user_import_status, name='user-import-status'),
     path('users/profile/', views.user_profile, name='user-profile'),  # Current user profile
     path('users/permissions/', views.user_permissions, name='user-permissions'),  # Current user permissions
     path('users/change-password/', views.ChangePasswordView.as_view(), name='change-password'),  # Current user password change
@@ -23,9 +29,11 @@ urlpatterns = [
     path('roles/<uuid:pk>/', views.RoleDetailView.as_view(), name='role-detail'),
     path('roles/assign/', views.RoleAssignmentView.as_view(), name='role-assignment'),
     path('roles/bulk-assign/', views.bulk_role_assignment, name='bulk-role-assignment'),
+    path('roles/bulk-assign/<uuid:job_id>/', views.bulk_role_assignment_status, name='bulk-role-assignment-status'),
     
     # User Role Assignments
     path('user-roles/', views.UserRoleListView.as_view(), name='user-role-list'),
+    path('user-roles/export/<str:export_format>/', views.export_role_assignments, name='user-role-export'),
     
     # Permissions
     path('permissions/', views.PermissionListView.as_view(), name='permission-list'),
@@ -42,6 +50,9 @@ urlpatterns = [
     path('custom-permissions/', views.CustomPermissionListCreateView.as_view(), name='custom-permission-list-create'),
     path('custom-permissions/<uuid:pk>/', views.CustomPermissionDetailView.as_view(), name='custom-permission-detail'),
     
+    # Cached snapshot of the whole role/permission catalog
+    path('rbac/catalog/', views.rbac_catalog_snapshot, name='rbac-catalog'),
+    
     # Dashboard
     path('dashboard/stats/', views.dashboard_stats, name='dashboard-stats'),
 ]
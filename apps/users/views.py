@@ -1,21 +1,46 @@
-from rest_framework import generics, status, permissions
+import json
+import uuid
+from asgiref.sync import sync_to_async
+from rest_framework import generics, status, permissions, serializers
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.contrib.auth import aauthenticate
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Q
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import etag, require_GET, require_POST
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from .models import User, Role, UserRole, PermissionCategory, CustomPermission
-from .permissions import IsSuperAdminOrAdmin
+from apps.common.pagination import KeysetPagination
+from .models import User, Role, UserRole, UserSession, PermissionCategory, CustomPermission
+from . import exports, imports, services
+from .permissions import model_permissions
+from .policies import ADMINS, AUTHENTICATED, ROLE_ASSIGNERS, PolicyPermission, admins_or, allows, view_policy
+from .rbac_catalog import rbac_catalog
+from .search import UserSearchFilter, user_search
+from .authentication import principal_cache
+from .hashing import HashingCapacityExceeded, password_hash_limiter
+from .signing_keys import key_ring
+from .services import BulkRoleJob
+from .tasks import ROLE_EXPIRY_STATS_KEY, run_bulk_role_assignment, run_user_import
+from .tokens import SESSION_ID_CLAIM
+from .token_permissions import token_permissions
 from .serializers import (
     UserSerializer, UserCreateSerializer, UserUpdateSerializer,
     RoleSerializer, UserRoleSerializer, PasswordChangeSerializer,
-    RoleAssignmentSerializer, PermissionSerializer, GroupSerializer,
+    RoleAssignmentSerializer, BulkRoleAssignmentSerializer, PermissionSerializer, GroupSerializer,
     PermissionCategorySerializer, CustomPermissionSerializer,
     LoginSerializer, TokenRefreshSerializer, LogoutSerializer, UserLoginResponseSerializer
 )
@@ -26,24 +51,18 @@ class UserListCreateView(generics.ListCreateAPIView):
     List all users or create a new user
 
     GET /api/users/ - List users with filtering and search (all authenticated users)
+    GET /api/users/?cursor=...&fields=id,name&expand=roles - Keyset pages, sparse fieldsets
+    GET /api/users/?search=... - Indexed search on login ID, email, name, employee ID and mobile
     POST /api/users/ - Create new user (only super admin and admin)
     """
     queryset = User.objects.all()
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, UserSearchFilter, OrderingFilter]
     filterset_fields = ['user_type', 'is_active', 'is_staff']
-    search_fields = ['login_id', 'email', 'first_name', 'last_name', 'employee_id']
     ordering_fields = ['login_id', 'email', 'date_joined', 'last_login']
     ordering = ['-date_joined']
-
-    def get_permissions(self):
-        """
-        Return different permissions based on the request method.
-        GET: All authenticated users can list
-        POST: Only super admin and admin can create
-        """
-        if self.request.method == 'POST':
-            return [permissions.IsAuthenticated(), IsSuperAdminOrAdmin()]
-        return [permissions.IsAuthenticated()]
+    pagination_class = KeysetPagination
+    permission_classes = [PolicyPermission]
+    policy = {'POST': ADMINS, '*': AUTHENTICATED}
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -56,7 +75,8 @@ class UserListCreateView(generics.ListCreateAPIView):
         role = self.request.query_params.get('role')
         if role:
             queryset = queryset.filter(user_roles__role__name=role, user_roles__is_active=True)
-        return queryset.prefetch_related('user_roles__role', 'groups__permissions')
+        # Relations are batch-loaded per page by UserSerializer's list mode
+        return queryset
 
 
 class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -69,16 +89,8 @@ class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
     DELETE /api/users/{id}/ - Deactivate user (only super admin and admin)
     """
     queryset = User.objects.all()
-
-    def get_permissions(self):
-        """
-        Return different permissions based on the request method.
-        GET: All authenticated users can retrieve
-        PUT/PATCH/DELETE: Only super admin and admin can modify/delete
-        """
-        if self.request.method in ['PUT', 'PATCH', 'DELETE']:
-            return [permissions.IsAuthenticated(), IsSuperAdminOrAdmin()]
-        return [permissions.IsAuthenticated()]
+    permission_classes = [PolicyPermission]
+    policy = {'PUT': ADMINS, 'PATCH': ADMINS, 'DELETE': ADMINS, '*': AUTHENTICATED}
 
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
@@ -89,6 +101,8 @@ class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
         # Soft delete - deactivate user instead of deleting
         instance.is_active = False
         instance.save()
+        # Revoke every token issued to the user
+        UserSession.objects.revoke_all(instance)
 
 
 class ChangePasswordView(APIView):
@@ -101,8 +115,17 @@ class ChangePasswordView(APIView):
     
     def post(self, request):
         serializer = PasswordChangeSerializer(data=request.data, context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
+        try:
+            is_valid = serializer.is_valid()
+            if is_valid:
+                serializer.save()
+        except HashingCapacityExceeded:
+            return Response(
+                hashing_busy_data('Password change failed'),
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '1'}
+            )
+        if is_valid:
             return Response({
                 'success': True,
                 'status': 200,
@@ -122,15 +145,30 @@ class RoleListCreateView(generics.ListCreateAPIView):
     List all roles or create a new role
     
     GET /api/roles/ - List roles
-    POST /api/roles/ - Create new role
+    GET /api/roles/?assignable=true - List the roles the requester may assign
+    GET /api/roles/?fields=id,name&expand=permissions - Sparse fieldsets
+    POST /api/roles/ - Create new role (admins, or with add_role)
     """
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
+    permission_classes = [PolicyPermission]
+    policy = admins_or(model_permissions('role'))
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['is_active', 'is_system_role', 'role_level']
     search_fields = ['name', 'display_name', 'description']
     ordering_fields = ['role_level', 'display_name', 'created_at']
     ordering = ['role_level', 'display_name']
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Roles the requester may assign
+        if self.request.query_params.get('assignable') in ('1', 'true'):
+            queryset = Role.objects.assignable_by(self.request.user)
+        # users_count reads the role's counter column; permissions come in one prefetch, when rendered
+        if self.request.method == 'GET' and 'permissions' not in self.get_serializer().fields:
+            return queryset
+        return queryset.select_related('django_group').prefetch_related('django_group__permissions')
 
 
 class RoleDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -144,6 +182,8 @@ class RoleDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
+    permission_classes = [PolicyPermission]
+    policy = admins_or(model_permissions('role'))
     
     def perform_destroy(self, instance):
         # Check if role has active assignments
@@ -159,9 +199,10 @@ class RoleAssignmentView(APIView):
     """
     Assign or revoke roles from users
     
-    POST /api/roles/assign/ - Assign/revoke role
+    POST /api/roles/assign/ - Assign/revoke role (admins and role assigners)
     """
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [PolicyPermission]
+    policy = ROLE_ASSIGNERS
     
     def post(self, request):
         serializer = RoleAssignmentSerializer(data=request.data, context={'request': request})
@@ -179,7 +220,7 @@ class UserRoleListView(generics.ListAPIView):
     GET /api/user-roles/?user={user_id} - List roles for specific user
     GET /api/user-roles/?role={role_id} - List users with specific role
     """
-    queryset = UserRole.objects.all()
+    queryset = UserRole.objects.select_related('role', 'assigned_by')
     serializer_class = UserRoleSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['is_active', 'user', 'role']
@@ -216,8 +257,10 @@ class GroupListCreateView(generics.ListCreateAPIView):
     GET /api/groups/ - List groups
     POST /api/groups/ - Create new group
     """
-    queryset = Group.objects.all()
+    queryset = Group.objects.prefetch_related('permissions').order_by('name')
     serializer_class = GroupSerializer
+    permission_classes = [PolicyPermission]
+    policy = admins_or(model_permissions('group'))
     filter_backends = [SearchFilter]
     search_fields = ['name']
 
@@ -232,6 +275,8 @@ class GroupDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
+    permission_classes = [PolicyPermission]
+    policy = admins_or(model_permissions('group'))
 
 
 class PermissionCategoryListCreateView(generics.ListCreateAPIView):
@@ -241,8 +286,12 @@ class PermissionCategoryListCreateView(generics.ListCreateAPIView):
     GET /api/permission-categories/ - List categories
     POST /api/permission-categories/ - Create new category
     """
-    queryset = PermissionCategory.objects.all()
+    queryset = PermissionCategory.objects.annotate(
+        active_permissions_count=Count('custom_permissions', filter=Q(custom_permissions__is_active=True))
+    ).order_by('order', 'name')
     serializer_class = PermissionCategorySerializer
+    permission_classes = [PolicyPermission]
+    policy = admins_or(model_permissions('permissioncategory'))
     ordering = ['order', 'name']
 
 
@@ -252,6 +301,8 @@ class PermissionCategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     queryset = PermissionCategory.objects.all()
     serializer_class = PermissionCategorySerializer
+    permission_classes = [PolicyPermission]
+    policy = admins_or(model_permissions('permissioncategory'))
 
 
 class CustomPermissionListCreateView(generics.ListCreateAPIView):
@@ -261,8 +312,10 @@ class CustomPermissionListCreateView(generics.ListCreateAPIView):
     GET /api/custom-permissions/ - List custom permissions
     POST /api/custom-permissions/ - Create new custom permission
     """
-    queryset = CustomPermission.objects.all()
+    queryset = CustomPermission.objects.select_related('category').order_by('codename')
     serializer_class = CustomPermissionSerializer
+    permission_classes = [PolicyPermission]
+    policy = admins_or(model_permissions('custompermission'))
     filter_backends = [DjangoFilterBackend, SearchFilter]
     filterset_fields = ['is_active', 'is_system_permission', 'category']
     search_fields = ['name', 'codename', 'description']
@@ -274,6 +327,42 @@ class CustomPermissionDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     queryset = CustomPermission.objects.all()
     serializer_class = CustomPermissionSerializer
+    permission_classes = [PolicyPermission]
+    policy = admins_or(model_permissions('custompermission'))
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def user_search_typeahead(request):
+    """
+    Ranked typeahead over active users
+
+    GET /api/users/search/?q=rahim&limit=10 - Best matches on login ID, email,
+    name, employee ID or mobile digits (limit up to 25)
+    """
+    term = request.query_params.get('q', '').strip()
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 25)
+    except ValueError:
+        limit = 10
+    results = []
+    if term:
+        rows = user_search().ranked(User.objects.filter(is_active=True), term).values_list(
+            'id', 'login_id', 'name', 'email', 'mobile', 'employee_id', 'user_type',
+        )[:limit]
+        results = [
+            {
+                'id': pk, 'login_id': login_id, 'name': name, 'email': email,
+                'mobile': str(mobile) if mobile else None, 'employee_id': employee_id, 'user_type': user_type,
+            }
+            for pk, login_id, name, email, mobile, employee_id, user_type in rows
+        ]
+    return Response({
+        'success': True,
+        'status': 200,
+        'message': 'Users retrieved successfully',
+        'data': results
+    })
 
 
 @api_view(['GET'])
@@ -302,7 +391,12 @@ def user_permissions(request):
     GET /api/users/permissions/ - Get all permissions for current user
     """
     user = request.user
-    permissions = user.get_all_permissions()
+    # Serve from the token's permission snapshot while it is current
+    snapshot = token_permissions(request, allow_stale=True)
+    if snapshot is not None and snapshot.is_current(user.pk):
+        permissions = snapshot.codenames()
+    else:
+        permissions = user.get_all_permissions()
     
     # Group permissions by category/app
     grouped_permissions = {}
@@ -348,8 +442,66 @@ def dashboard_stats(request):
     return Response(stats)
 
 
-@api_view(['POST'])
+@api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+def rbac_catalog_snapshot(request):
+    """
+    Get the role/permission catalog in one response, from a versioned cached snapshot
+
+    GET /api/rbac/catalog/ - Roles, groups, permissions, permission categories and
+    custom permissions (grants as ids); honours If-None-Match
+    """
+    snapshot = rbac_catalog.snapshot()
+    if snapshot['etag'] in request.headers.get('If-None-Match', ''):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response({
+            'success': True,
+            'status': 200,
+            'message': 'RBAC catalog retrieved successfully',
+            'data': {
+                'version': snapshot['version'],
+                'generated_at': snapshot['generated_at'],
+                **snapshot['data'],
+            }
+        })
+    response['ETag'] = snapshot['etag']
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@view_policy(ADMINS)
+@api_view(['GET'])
+@permission_classes([PolicyPermission])
+def auth_metrics(request):
+    """
+    Get authentication subsystem metrics for this worker process
+    
+    GET /api/auth/metrics/ - Principal cache counters, password hashing histograms
+    and role expiry sweep statistics
+    """
+    now = timezone.now()
+    oldest_due = UserRole.objects.filter(is_active=True, expires_at__lte=now).order_by(
+        'expires_at'
+    ).values_list('expires_at', flat=True).first()
+    return Response({
+        'success': True,
+        'status': 200,
+        'message': 'Authentication metrics retrieved successfully',
+        'data': {
+            'principal_cache': principal_cache.stats(),
+            'password_hashing': password_hash_limiter.stats(),
+            'role_expiry': {
+                'last_sweep': cache.get(ROLE_EXPIRY_STATS_KEY),
+                'current_lag_seconds': round((now - oldest_due).total_seconds(), 3) if oldest_due else 0.0,
+            },
+        }
+    })
+
+
+@view_policy(ROLE_ASSIGNERS)
+@api_view(['POST'])
+@permission_classes([PolicyPermission])
 def bulk_role_assignment(request):
     """
     Bulk assign/revoke roles
@@ -361,50 +513,189 @@ def bulk_role_assignment(request):
         "action": "assign|revoke",
         "reason": "optional reason"
     }
+
+    Admins and holders of a can_assign_roles role only; the role must be one
+    the requester may assign. Requests above BULK_ROLE_ASSIGNMENT_ASYNC_THRESHOLD
+    users are queued and answered with 202 and a job id; poll
+    GET /api/roles/bulk-assign/<job_id>/.
     """
-    user_ids = request.data.get('user_ids', [])
-    role_id = request.data.get('role_id')
-    action = request.data.get('action')
-    reason = request.data.get('reason', '')
-    
-    if not user_ids or not role_id or not action:
-        return Response(
-            {'error': 'user_ids, role_id, and action are required'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    serializer = BulkRoleAssignmentSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({'error': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+    user_ids = serializer.validated_data['user_ids']
+    action = serializer.validated_data['action']
+    reason = serializer.validated_data['reason']
     
     try:
-        role = Role.objects.get(id=role_id, is_active=True)
-        users = User.objects.filter(id__in=user_ids, is_active=True)
-        
-        results = []
-        for user in users:
-            if action == 'assign':
-                user_role, created = user.assign_role(
-                    role=role,
-                    assigned_by=request.user,
-                    assignment_reason=reason
-                )
-                results.append({
-                    'user': user.login_id,
-                    'action': 'assigned',
-                    'created': created
-                })
-            elif action == 'revoke':
-                count = user.revoke_role(role=role, revoked_by=request.user, reason=reason)
-                results.append({
-                    'user': user.login_id,
-                    'action': 'revoked',
-                    'count': count
-                })
-        
-        return Response({'results': results}, status=status.HTTP_200_OK)
-    
+        role = Role.objects.assignable_by(request.user).get(id=serializer.validated_data['role_id'])
     except Role.DoesNotExist:
         return Response({'error': 'Role not found'}, status=status.HTTP_404_NOT_FOUND)
-    except Exception as e:
+
+    if len(user_ids) > settings.BULK_ROLE_ASSIGNMENT_ASYNC_THRESHOLD:
+        job = BulkRoleJob.create(request.user, action, role, len(user_ids))
+        run_bulk_role_assignment.delay(job.job_id, str(role.id), user_ids, action, str(request.user.id), reason)
+        return Response({
+            'success': True,
+            'status': 202,
+            'message': 'Bulk role assignment queued',
+            'data': job.get(),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    try:
+        result = services.bulk_role_assignment(role, user_ids, action, request.user, reason=reason)
+    except ValidationError as e:
+        return Response({'error': ' '.join(e.messages)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'success': True,
+        'status': 200,
+        'message': 'Bulk role assignment completed',
+        'data': result,
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_role_assignment_status(request, job_id):
+    """
+    Progress of a queued bulk role assignment
+    
+    GET /api/roles/bulk-assign/<job_id>/
+    """
+    job = BulkRoleJob(job_id).get()
+    if job is None or (job['requested_by'] != str(request.user.id) and not allows(request, ADMINS)):
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'success': True,
+        'status': 200,
+        'message': 'Bulk role assignment status retrieved successfully',
+        'data': job,
+    })
+
+
+@view_policy(ADMINS)
+@api_view(['GET'])
+@permission_classes([PolicyPermission])
+def export_users(request, export_format):
+    """
+    Stream the staff list (HR and payroll fields, active role names)
+
+    GET /api/users/export/csv/ - CSV attachment
+    GET /api/users/export/jsonl/ - One JSON object per line
+    Optional filters: ?user_type=, ?is_active=true|false
+    """
+    if export_format not in exports.EXPORT_FORMATS:
+        return Response({'error': 'Unsupported export format; use csv or jsonl'}, status=status.HTTP_400_BAD_REQUEST)
+    queryset = User.objects.all()
+    if request.query_params.get('user_type'):
+        queryset = queryset.filter(user_type=request.query_params['user_type'])
+    if request.query_params.get('is_active') in ('true', 'false'):
+        queryset = queryset.filter(is_active=request.query_params['is_active'] == 'true')
+    return exports.export_users(queryset, export_format)
+
+
+@view_policy(ADMINS)
+@api_view(['GET'])
+@permission_classes([PolicyPermission])
+def export_role_assignments(request, export_format):
+    """
+    Stream role assignments
+
+    GET /api/user-roles/export/csv/ - CSV attachment
+    GET /api/user-roles/export/jsonl/ - One JSON object per line
+    Optional filters: ?role={role_id}, ?is_active=true|false
+    """
+    if export_format not in exports.EXPORT_FORMATS:
+        return Response({'error': 'Unsupported export format; use csv or jsonl'}, status=status.HTTP_400_BAD_REQUEST)
+    queryset = UserRole.objects.all()
+    if request.query_params.get('role'):
+        try:
+            queryset = queryset.filter(role_id=uuid.UUID(request.query_params['role']))
+        except ValueError:
+            return Response({'error': 'Invalid role ID'}, status=status.HTTP_400_BAD_REQUEST)
+    if request.query_params.get('is_active') in ('true', 'false'):
+        queryset = queryset.filter(is_active=request.query_params['is_active'] == 'true')
+    return exports.export_role_assignments(queryset, export_format)
+
+
+@view_policy(ADMINS)
+@api_view(['POST'])
+@permission_classes([PolicyPermission])
+def import_users(request):
+    """
+    Bulk-create users from a CSV or JSONL file
+
+    POST /api/users/import/ (multipart)
+    {
+        "file": <users.csv | users.jsonl>,
+        "file_format": "csv" | "jsonl",  # optional, from the file extension by default
+        "dry_run": true                  # optional, validate only
+    }
+    Columns: login_id, email, password, mobile, user_type, name, employee_id, salary,
+    date_of_joining, address, postal_code, remarks, department, designation, district,
+    thana, roles (';'-separated role names); password_hash (an encoded Django hash) may
+    replace password. Invalid rows are skipped and reported.
+
+    Files above USER_IMPORT_ASYNC_THRESHOLD rows or with more than
+    USER_IMPORT_SYNC_PASSWORDS passwords to hash are queued and answered with
+    202 and a job id; poll GET /api/users/import/<job_id>/ for the report.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    file_format = request.data.get('file_format') or upload.name.rsplit('.', 1)[-1].lower()
+    dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+
+    try:
+        rows = imports.read_rows(upload.file, file_format)
+    except imports.ImportFileError as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    if imports.runs_in_background(rows, dry_run):
+        job = imports.UserImportJob.create(request.user, len(rows), dry_run)
+        # Queue a reference to the stored file, not the rows: they may hold plaintext passwords
+        upload.seek(0)
+        name = imports.upload_storage().save(f'{job.job_id}.{file_format}', upload)
+        run_user_import.delay(job.job_id, name, file_format, str(request.user.id), dry_run)
+        return Response({
+            'success': True,
+            'status': 202,
+            'message': 'User import queued',
+            'data': job.get(),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    try:
+        report = imports.UserImport(rows, request.user, dry_run=dry_run).run()
+    except ValidationError as e:
+        # A role filled up between validation and insert; nothing was created
+        return Response({'error': ' '.join(e.messages)}, status=status.HTTP_409_CONFLICT)
+
+    return Response({
+        'success': True,
+        'status': 200,
+        'message': f"{report['created']} users imported, {report['failed']} rows rejected",
+        'data': report,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def user_import_status(request, job_id):
+    """
+    Progress and report of a queued user import
+
+    GET /api/users/import/<job_id>/
+    """
+    job = imports.UserImportJob(job_id).get()
+    if job is None or (job['requested_by'] != str(request.user.id) and not allows(request, ADMINS)):
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'success': True,
+        'status': 200,
+        'message': 'User import status retrieved successfully',
+        'data': job,
+    })
+
 
 # Authentication Views
 
@@ -477,29 +768,17 @@ class LoginView(APIView):
     def post(self, request):
         serializer = LoginSerializer(data=request.data, context={'request': request})
         
-        if serializer.is_valid():
-            user = serializer.validated_data['user']
-            access_token = serializer.validated_data['access_token']
-            refresh_token = serializer.validated_data['refresh_token']
-            
-            # Serialize user data
-            user_serializer = UserLoginResponseSerializer(user)
-            
-            return Response({
-                'success': True,
-                'status': 200,
-                'message': 'Login successful',
-                'data': {
-                    'user': user_serializer.data,
-                    'tokens': {
-                        'access': access_token,
-                        'refresh': refresh_token,
-                        'token_type': 'Bearer'
-                    },
-                    'remember_me': user.remember_me,
-                    'expires_at': user.token_expires_at.isoformat() if user.token_expires_at else None
-                }
-            }, status=status.HTTP_200_OK)
+        try:
+            is_valid = serializer.is_valid()
+        except HashingCapacityExceeded:
+            return Response(
+                hashing_busy_data('Login failed'),
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '1'}
+            )
+        
+        if is_valid:
+            return Response(login_response_data(serializer.validated_data), status=status.HTTP_200_OK)
         
         return Response({
             'success': False,
@@ -509,6 +788,88 @@ class LoginView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+def login_response_data(validated_data):
+    """Build the login response body from LoginSerializer data"""
+    user_serializer = UserLoginResponseSerializer(validated_data['user'])
+    return {
+        'success': True,
+        'status': 200,
+        'message': 'Login successful',
+        'data': {
+            'user': user_serializer.data,
+            'tokens': {
+                'access': validated_data['access_token'],
+                'refresh': validated_data['refresh_token'],
+                'token_type': 'Bearer'
+            },
+            'remember_me': validated_data['session'].remember_me,
+            'expires_at': validated_data['expires_at'].isoformat()
+        }
+    }
+
+
+def hashing_busy_data(message):
+    """Response body for requests shed by the password hashing limiter"""
+    return {
+        'success': False,
+        'status': 503,
+        'message': message,
+        'error': ['Server is busy, please retry shortly.']
+    }
+
+
+@csrf_exempt
+@require_POST
+async def async_login(request):
+    """
+    Async variant of LoginView for ASGI deployments (config/asgi.py).
+    The password hash runs on a worker thread and is awaited, so the
+    event loop keeps serving other requests meanwhile.
+    
+    POST /api/auth/login/async/
+    """
+    serializer = LoginSerializer(context={'request': request})
+    try:
+        attrs = await sync_to_async(serializer.to_internal_value)(json.loads(request.body or b'{}'))
+        await sync_to_async(serializer.check_not_blocked)(attrs['login_id'])
+        user = await aauthenticate(request, login_id=attrs['login_id'], password=attrs['password'])
+        serializer.check_authenticated(user)
+        attrs.update(await sync_to_async(serializer.complete_login)(user, attrs['remember_me']))
+        data = await sync_to_async(login_response_data)(attrs)
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'status': 400,
+            'message': 'Login failed',
+            'error': ['Malformed JSON body.']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except serializers.ValidationError as e:
+        return JsonResponse({
+            'success': False,
+            'status': 400,
+            'message': 'Login failed',
+            'error': serializers.as_serializer_error(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except HashingCapacityExceeded:
+        response = JsonResponse(hashing_busy_data('Login failed'), status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = '1'
+        return response
+    return JsonResponse(data, status=status.HTTP_200_OK)
+
+
+@require_GET
+@etag(lambda request: key_ring.jwks_etag)
+def jwks(request):
+    """
+    Public keys for verifying access tokens locally
+    
+    GET /.well-known/jwks.json
+    """
+    response = HttpResponse(key_ring.jwks_json, content_type='application/json')
+    patch_cache_control(response, public=True, max_age=settings.JWKS_MAX_AGE)
+    return response
+
+
 class TokenRefreshView(APIView):
     """
     Refresh JWT access token using refresh token
@@ -574,7 +935,7 @@ class TokenRefreshView(APIView):
                         'refresh': refresh_token,
                         'token_type': 'Bearer'
                     },
-                    'expires_at': user.token_expires_at.isoformat() if user.token_expires_at else None
+                    'expires_at': serializer.validated_data['expires_at'].isoformat()
                 }
             }, status=status.HTTP_200_OK)
         
@@ -677,9 +1038,10 @@ class VerifyTokenView(APIView):
     )
     def post(self, request):
         user = request.user
+        session_id = request.auth.get(SESSION_ID_CLAIM) if request.auth is not None else None
         
-        # Check if user's stored token is still valid
-        if user.is_token_valid():
+        # Check if the token's session is still open
+        if session_id and UserSession.objects.active().filter(pk=session_id, user=user).exists():
             user_serializer = UserLoginResponseSerializer(user)
             return Response({
                 'success': True,
@@ -687,7 +1049,7 @@ class VerifyTokenView(APIView):
                 'message': 'Token is valid',
                 'data': {
                     'user': user_serializer.data,
-                    'expires_at': user.token_expires_at.isoformat() if user.token_expires_at else None
+                    'expires_at': datetime_from_epoch(request.auth['exp']).isoformat()
                 }
             }, status=status.HTTP_200_OK)
         else:
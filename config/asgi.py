@@ -3,6 +3,9 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Under ASGI (e.g. ``uvicorn config.asgi:application``) the async login endpoint
+(``/api/v1/auth/login/async/``) awaits password hashing without holding a worker.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
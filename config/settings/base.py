@@ -27,7 +27,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    
+    'django.contrib.postgres',
 ]
 
 
@@ -166,7 +166,7 @@ AUTHENTICATION_BACKENDS = [
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.users.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -207,9 +207,62 @@ SIMPLE_JWT = {
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
-    'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
+    'AUTH_TOKEN_CLASSES': ('apps.users.tokens.UserAccessToken',),
 }
 
+# Asymmetric JWT signing (RSA -> RS256, Ed25519 -> EdDSA). PEM private key files,
+# the first one signs; all are published at /.well-known/jwks.json. HS256 with
+# SECRET_KEY is used when none are configured.
+JWT_SIGNING_KEY_FILES = config('JWT_SIGNING_KEY_FILES', default='', cast=Csv())
+JWKS_MAX_AGE = config('JWKS_MAX_AGE', default=86400, cast=int)  # seconds
+
+# Authenticated principal cache (in-process LRU in front of the shared cache)
+PRINCIPAL_CACHE_LOCAL_SIZE = config('PRINCIPAL_CACHE_LOCAL_SIZE', default=1024, cast=int)
+PRINCIPAL_CACHE_LOCAL_TTL = config('PRINCIPAL_CACHE_LOCAL_TTL', default=30, cast=int)  # seconds
+PRINCIPAL_CACHE_SHARED_TTL = config('PRINCIPAL_CACHE_SHARED_TTL', default=300, cast=int)  # seconds
+
+# Proxies (addresses or networks) whose X-Real-IP header names the client; other requests use REMOTE_ADDR
+TRUSTED_PROXIES = config('TRUSTED_PROXIES', default='127.0.0.1,::1', cast=Csv())
+
+# Login lockout (counters live in the shared cache)
+LOGIN_MAX_FAILED_ATTEMPTS = config('LOGIN_MAX_FAILED_ATTEMPTS', default=5, cast=int)  # per login id
+LOGIN_MAX_FAILED_ATTEMPTS_PER_IP = config('LOGIN_MAX_FAILED_ATTEMPTS_PER_IP', default=50, cast=int)
+LOGIN_FAILURE_WINDOW = config('LOGIN_FAILURE_WINDOW', default=900, cast=int)  # seconds
+LOGIN_LOCKOUT_DURATION = config('LOGIN_LOCKOUT_DURATION', default=1800, cast=int)  # seconds
+
+# Password hashing (login / password change): concurrent hashes across all workers; excess is shed with 503.
+# Keep it below the total gunicorn worker count so a login burst cannot take every worker.
+PASSWORD_HASH_CONCURRENCY = config('PASSWORD_HASH_CONCURRENCY', default=2, cast=int)
+PASSWORD_HASH_TIMEOUT = config('PASSWORD_HASH_TIMEOUT', default=5, cast=int)  # seconds a hash slot is leased
+PASSWORD_HASH_QUEUE_TIMEOUT = config('PASSWORD_HASH_QUEUE_TIMEOUT', default=0.25, cast=float)  # seconds to wait for a slot
+
+# Revoked session blacklist (shared cache + in-process bloom filter)
+TOKEN_BLACKLIST_SYNC_INTERVAL = config('TOKEN_BLACKLIST_SYNC_INTERVAL', default=1, cast=int)  # seconds
+TOKEN_BLACKLIST_FILTER_CAPACITY = config('TOKEN_BLACKLIST_FILTER_CAPACITY', default=100000, cast=int)
+USER_SESSION_RETENTION = config('USER_SESSION_RETENTION', default=7 * 24 * 3600, cast=int)  # seconds
+
+# Bulk role assignment; larger requests run as a background job
+BULK_ROLE_ASSIGNMENT_ASYNC_THRESHOLD = config('BULK_ROLE_ASSIGNMENT_ASYNC_THRESHOLD', default=500, cast=int)  # users
+BULK_ROLE_ASSIGNMENT_CHUNK_SIZE = config('BULK_ROLE_ASSIGNMENT_CHUNK_SIZE', default=1000, cast=int)  # users per statement
+
+# Role/group permission edits re-materialize member permissions inline up to this size, else in a task
+EFFECTIVE_PERMISSION_SYNC_LIMIT = config('EFFECTIVE_PERMISSION_SYNC_LIMIT', default=200, cast=int)  # users
+
+# Cached RBAC catalog snapshot (roles, groups, permissions); rebuilt when a catalog change commits
+RBAC_CATALOG_CACHE_TTL = config('RBAC_CATALOG_CACHE_TTL', default=3600, cast=int)  # seconds
+
+# Streaming CSV/JSONL exports: rows fetched per server-side cursor round trip
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Bulk user import (CSV/JSONL); large files, or files with many passwords to hash, run as a background job
+USER_IMPORT_MAX_ROWS = config('USER_IMPORT_MAX_ROWS', default=20000, cast=int)  # rows per file
+USER_IMPORT_BATCH_SIZE = config('USER_IMPORT_BATCH_SIZE', default=1000, cast=int)  # users per INSERT
+USER_IMPORT_ASYNC_THRESHOLD = config('USER_IMPORT_ASYNC_THRESHOLD', default=1000, cast=int)  # rows
+USER_IMPORT_SYNC_PASSWORDS = config('USER_IMPORT_SYNC_PASSWORDS', default=10, cast=int)  # hashes per request
+USER_IMPORT_HASH_WORKERS = config('USER_IMPORT_HASH_WORKERS', default=4, cast=int)  # hashing processes per queued import
+# Queued import files (may hold plaintext passwords); kept out of MEDIA_ROOT and deleted by the job
+USER_IMPORT_UPLOAD_DIR = config('USER_IMPORT_UPLOAD_DIR', default=str(BASE_DIR / 'imports'))
+
 
 
 # Celery Configuration
@@ -219,6 +272,24 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'flush-login-failures': {
+        'task': 'apps.users.tasks.flush_login_failures',
+        'schedule': timedelta(minutes=1),
+    },
+    'compact-token-blacklist': {
+        'task': 'apps.users.tasks.compact_token_blacklist',
+        'schedule': timedelta(hours=1),
+    },
+    'expire-role-assignments': {
+        'task': 'apps.users.tasks.expire_role_assignments',
+        'schedule': timedelta(minutes=1),
+    },
+    'reconcile-role-assignment-counts': {
+        'task': 'apps.users.tasks.reconcile_role_assignment_counts',
+        'schedule': timedelta(hours=1),
+    },
+}
 
 
 
@@ -0,0 +1,41 @@
+from .base import *
+
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+
+
+# Run the suite without external services
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_db.sqlite3',
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Fast hashing, so benchmarks measure the auth code path rather than PBKDF2
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_TASK_EAGER_PROPAGATES = True
+
+# Auth endpoint benchmarks (apps/users/tests.py)
+AUTH_BENCHMARK_USERS = config('AUTH_BENCHMARK_USERS', default=50, cast=int)
+AUTH_BENCHMARK_ROLES = config('AUTH_BENCHMARK_ROLES', default=10, cast=int)
+AUTH_BENCHMARK_ITERATIONS = config('AUTH_BENCHMARK_ITERATIONS', default=50, cast=int)
+AUTH_BENCHMARK_BASELINE = config(
+    'AUTH_BENCHMARK_BASELINE', default=str(BASE_DIR.parent / 'apps' / 'users' / 'benchmarks' / 'auth_baseline.json')
+)
+# Query budgets are always enforced; p95 latency budgets only on request (machine dependent)
+AUTH_BENCHMARK_ENFORCE_LATENCY = config('AUTH_BENCHMARK_ENFORCE_LATENCY', default=False, cast=bool)
+AUTH_BENCHMARK_LATENCY_TOLERANCE = config('AUTH_BENCHMARK_LATENCY_TOLERANCE', default=2.0, cast=float)
+AUTH_BENCHMARK_UPDATE_BASELINE = config('AUTH_BENCHMARK_UPDATE_BASELINE', default=False, cast=bool)
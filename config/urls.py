@@ -6,6 +6,8 @@ from django.conf.urls.static import static
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from apps.users.policies import policy_registry
+from apps.users.views import jwks
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -22,6 +24,7 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('.well-known/jwks.json', jwks, name='jwks'),
     path('api/v1/', include('apps.users.urls')),
     path('api/v1/', include('apps.organizations.urls')),
     path('api/v1/', include('apps.common.urls')),
@@ -33,10 +36,11 @@ urlpatterns = [
 ]
 
 # Debug toolbar URLs (only active in development)
-try:
+if 'debug_toolbar' in settings.INSTALLED_APPS:
     import debug_toolbar
     urlpatterns += [
         path('__debug__/', include(debug_toolbar.urls)),
     ]
-except ImportError:
-    pass
+
+# Compile the view access policies once, at URLconf load
+policy_registry.compile(urlpatterns)